@@ -0,0 +1,64 @@
+#!/usr/bin/env python2.7
+
+"""Compare polling an unchanged router page with and without a
+`ddnsupdater.pagecache.PageCache`, against a router which answers conditional
+requests, one which sends an ETag but ignores them, and one with no validators.
+The address is near the end of the page so scanning it is real work.
+
+    python2.7 bench/bench_conditional.py --page-kb 16 --polls 2000
+"""
+
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from ddnsupdater.main import get_ip
+from ddnsupdater.pool import ConnectionPool
+from ddnsupdater.pagecache import PageCache
+from fakes import fake_router, ROUTER_PAGE
+
+
+def run(label, router, cache, polls):
+	pool = ConnectionPool()
+	url = router.url + '/status'
+
+	def fetch():
+		return get_ip('admin', '12345', url, 'IP Address', 1, r'.*<td>([0-9.]+)', pool=pool,
+					  cache=cache)
+
+	# authenticate and fill the cache
+	fetch()
+	sent = router.bytes_sent
+	start = time.time()
+	cpu = time.clock()
+	for _ in xrange(polls):
+		assert fetch() == '1.2.3.4'
+
+	print '{label:<24} {ms:7.3f}ms/poll  cpu {cpu:7.3f}ms/poll  {kb:7.2f}KB/poll'.format(
+		label=label,
+		ms=(time.time() - start) * 1000 / polls,
+		cpu=(time.clock() - cpu) * 1000 / polls,
+		kb=(router.bytes_sent - sent) / 1024.0 / polls)
+	pool.clear()
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument('--page-kb', type=int, default=16)
+	parser.add_argument('--polls', type=int, default=2000)
+	args = parser.parse_args()
+
+	padding = '<tr><td>Some other router statistic</td><td>12345</td></tr>\n'
+	page = (padding * (args.page_kb * 1024 / len(padding)) + ROUTER_PAGE.format(ip='1.2.3.4'))
+	for validators in ('etag', 'ignore', None):
+		router = fake_router(page=page, validators=validators)
+		name = validators or 'no validators'
+		run(name + ', no cache', router, None, args.polls)
+		run(name + ', cache', router, PageCache(), args.polls)
+
+
+if __name__ == '__main__':
+	main()
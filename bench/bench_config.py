@@ -0,0 +1,95 @@
+#!/usr/bin/env python2.7
+
+"""Time loading a configuration file with many named targets, and reloading it
+after one target has changed as happens on SIGHUP.
+
+    python2.7 bench/bench_config.py --targets 500
+"""
+
+import os
+import sys
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from ddnsupdater import config
+from ddnsupdater.main import make_target, reload_targets
+from ddnsupdater.engine import Engine
+
+DEFAULTS = {
+	'sleep': 3600,
+	'fetch_source': 'router',
+	'fetch_user': 'admin',
+	'fetch_search': 'IP Address',
+	'fetch_skip': 0,
+	'fetch_match': r'.*<td>([0-9.]+)',
+	'push_protocol': 'namecheap',
+	}
+
+
+class Args(object):
+	retry = 60
+	max_backoff = None
+	recheck = 60
+	jitter = 0.1
+
+
+def write_config(path, count, changed=None):
+	with open(path, 'w') as h:
+		h.write('[fetch]\nurl=http://192.168.0.1/status\npassword=12345\n\n')
+		for n in xrange(count):
+			h.write('[fetch:target{n}]\n'.format(n=n))
+			if n == changed:
+				h.write('skip=1\n')
+
+			h.write('[push:target{n}]\n'
+					'url=https://dynamicdns.park-your-domain.com/update?host=h{n}&ip={{ip}}\n\n'.format(
+					n=n))
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument('--targets', type=int, default=500)
+	parser.add_argument('--repeat', type=int, default=20)
+	args = parser.parse_args()
+
+	logging.basicConfig(level=logging.WARNING)
+	directory = tempfile.mkdtemp()
+	try:
+		path = os.path.join(directory, 'ddns-updater.conf')
+		write_config(path, args.targets)
+
+		start = time.time()
+		for _ in xrange(args.repeat):
+			targets = config.load(path, DEFAULTS).targets
+
+		print 'load {count} targets    {ms:8.2f}ms'.format(
+			count=len(targets), ms=(time.time() - start) / args.repeat * 1000)
+
+		build = lambda target_config, previous=None: make_target(
+			target_config, None, None, None, Args, previous)
+		running = dict((t.name, (t, build(t))) for t in targets)
+		engine = Engine([running[t.name][1] for t in targets])
+		before = dict((name, target) for name, (_, target) in running.items())
+
+		elapsed = 0
+		for n in xrange(args.repeat):
+			write_config(path, args.targets, changed=n % args.targets)
+			start = time.time()
+			reload_targets(engine, running, path, DEFAULTS, build)
+			elapsed += time.time() - start
+
+		kept = sum(1 for name, (_, target) in running.items() if before.get(name) is target)
+		print 'reload, one changed  {ms:8.2f}ms   {kept} targets untouched throughout'.format(
+			ms=elapsed / args.repeat * 1000, kept=kept)
+
+	finally:
+		shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+	main()
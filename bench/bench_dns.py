@@ -0,0 +1,73 @@
+#!/usr/bin/env python2.7
+
+"""Time RFC 2136 updates of many records against a local stand-in name server:
+one message per record on a new socket each, against all records in one message
+on a reused socket, unsigned and signed with TSIG.
+
+    python2.7 bench/bench_dns.py --records 20 --rounds 200
+"""
+
+import os
+import sys
+import time
+import base64
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from ddnsupdater import dnsupdate
+from fakes import fake_dns_server
+
+
+def run(label, server, rounds, function):
+	before = server.messages
+	start = time.time()
+	for _ in xrange(rounds):
+		function()
+
+	elapsed = time.time() - start
+	print '{label:<26} {ms:7.3f}ms/round  messages/round {m:5.1f}  over TCP {t}'.format(
+		label=label,
+		ms=elapsed * 1000 / rounds,
+		m=float(server.messages - before) / rounds,
+		t=server.tcp_messages)
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument('--records', type=int, default=20)
+	parser.add_argument('--rounds', type=int, default=200)
+	args = parser.parse_args()
+
+	zone = 'example.com'
+	records = [('host{i}'.format(i=i), '1.2.3.4', 300) for i in xrange(args.records)]
+	key = dnsupdate.TSIGKey('ddns-key', base64.b64encode('0123456789abcdef0123456789abcdef'))
+
+	plain = fake_dns_server()
+	try:
+		run('one message per record', plain, args.rounds, lambda: [
+				dnsupdate.send_update('127.0.0.1', plain.port,
+									  dnsupdate.update_message(zone, [record]))
+				for record in records])
+		client = dnsupdate.UpdateClient('127.0.0.1', plain.port)
+		run('one message, reused socket', plain, args.rounds,
+			lambda: client.send(dnsupdate.update_message(zone, records)))
+		client.close()
+
+	finally:
+		plain.close()
+
+	signed = fake_dns_server(key)
+	try:
+		client = dnsupdate.UpdateClient('127.0.0.1', signed.port, key)
+		run('one message, TSIG', signed, args.rounds,
+			lambda: client.send(dnsupdate.update_message(zone, records)))
+		client.close()
+		assert signed.messages == args.rounds
+
+	finally:
+		signed.close()
+
+
+if __name__ == '__main__':
+	main()
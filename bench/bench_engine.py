@@ -0,0 +1,89 @@
+#!/usr/bin/env python2.7
+
+"""Measure multi-target polling throughput of `ddnsupdater.engine.Engine` against
+local stand-in router and provider servers.
+
+    python2.7 bench/bench_engine.py --targets 400 --period 1 --duration 10
+
+With --trace FILE the phases of every poll are recorded and written to FILE in the
+Chrome trace format, and the slowest phases are summarised.
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+import functools
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from ddnsupdater import trace
+from ddnsupdater.main import get_ip
+from ddnsupdater.push import Pusher, PushRecord
+from ddnsupdater.pool import ConnectionPool
+from ddnsupdater.engine import Engine, Target
+from fakes import fake_router, fake_provider
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument('--targets', type=int, default=400)
+	parser.add_argument('--period', type=float, default=1.0)
+	parser.add_argument('--duration', type=float, default=10.0)
+	parser.add_argument('--max-in-flight', type=int, default=16)
+	parser.add_argument('--trace', metavar='FILE')
+	args = parser.parse_args()
+
+	if args.trace is not None:
+		trace.enable()
+
+	logging.basicConfig(level=logging.ERROR)
+	router = fake_router()
+	provider = fake_provider()
+	pool = ConnectionPool(max_idle=args.max_in_flight)
+	push_pool = ConnectionPool(max_idle=args.max_in_flight)
+
+	targets = [Target(name='site{i}'.format(i=i),
+					  fetch=functools.partial(get_ip,
+											  user=router.user,
+											  password=router.password,
+											  url=router.url + '/status',
+											  search='IP Address',
+											  skip=1,
+											  match=r'.*<td>([0-9.]+)',
+											  pool=pool),
+					  push=Pusher([PushRecord('site{i}'.format(i=i),
+											  provider.url + '/update?host=site{i}&ip={{ip}}'.format(i=i))],
+								  push_pool),
+					  period=args.period) for i in xrange(args.targets)]
+
+	engine = Engine(targets, max_in_flight=args.max_in_flight)
+	thread = threading.Thread(target=engine.run)
+	start = time.time()
+	thread.start()
+	time.sleep(args.duration)
+	engine.stop()
+	thread.join()
+	elapsed = time.time() - start
+	pool.clear()
+	push_pool.clear()
+
+	print 'targets         {n}'.format(n=args.targets)
+	print 'max in flight   {n}'.format(n=args.max_in_flight)
+	print 'checks          {n}'.format(n=engine.checks)
+	print 'checks/sec      {r:.1f}'.format(r=engine.checks / elapsed)
+	print 'ideal checks/s  {r:.1f}'.format(r=args.targets / args.period)
+	print 'router requests {n} on {c} connections'.format(n=router.requests, c=router.connections)
+	print 'pushes          {n}'.format(n=provider.requests)
+
+	if args.trace is not None:
+		trace.tracer.export(args.trace)
+		for name, count, total, longest in trace.tracer.summary():
+			print '{name:<16} {count:7d} spans  mean {mean:7.3f}ms  longest {longest:7.3f}ms'.format(
+				name=name, count=count, mean=total / count * 1000, longest=longest * 1000)
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python2.7
+
+"""Compare reading the whole router status page before scanning it with the
+streaming, early-exit `extract_ip()`, for a large page with the address near the top.
+
+    python2.7 bench/bench_extract.py --page-kb 500 --polls 200
+"""
+
+import os
+import re
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from ddnsupdater.main import get_ip
+from ddnsupdater.pool import ConnectionPool
+from fakes import fake_router, ROUTER_PAGE
+
+
+def read_then_scan(pool, url, search, skip, match):
+	"""The original `get_ip()` scan: read everything, split, then match each line."""
+	trigger = None
+	for line in pool.urlopen(url, 'admin', '12345').read().split('\n'):
+		if trigger is not None:
+			trigger -= 1
+			if trigger == 0:
+				return re.match(match, line).groups(1)[0]
+
+		if search in line:
+			trigger = skip
+
+
+def run(label, fetch, polls):
+	start = time.time()
+	cpu = time.clock()
+	for _ in xrange(polls):
+		assert fetch() == '1.2.3.4'
+
+	print '{label:<16} {ms:7.3f}ms/poll  cpu {cpu:7.3f}ms/poll'.format(
+		label=label,
+		ms=(time.time() - start) * 1000 / polls,
+		cpu=(time.clock() - cpu) * 1000 / polls)
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument('--page-kb', type=int, default=500)
+	parser.add_argument('--polls', type=int, default=200)
+	args = parser.parse_args()
+
+	padding = '<tr><td>Some other router statistic</td><td>12345</td></tr>\n'
+	page = ROUTER_PAGE.format(ip='1.2.3.4') + padding * (args.page_kb * 1024 / len(padding))
+	router = fake_router(page=page)
+	url = router.url + '/status'
+	match = r'.*<td>([0-9.]+)'
+
+	pool = ConnectionPool()
+	run('read then scan', lambda: read_then_scan(pool, url, 'IP Address', 1, match), args.polls)
+	run('streaming', lambda: get_ip('admin', '12345', url, 'IP Address', 1, match, pool=pool),
+		args.polls)
+	pool.clear()
+
+
+if __name__ == '__main__':
+	main()
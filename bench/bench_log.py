@@ -0,0 +1,110 @@
+#!/usr/bin/env python2.7
+
+"""Compare logging straight to a file with the queued pipeline of
+`ddnsupdater.log`, while the disk stalls now and then. Every simulated poll logs
+the lines the engine logs for an unchanged address.
+
+    python2.7 bench/bench_log.py --targets 500 --polls 20
+"""
+
+import os
+import sys
+import time
+import Queue
+import logging
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from ddnsupdater.log import QueueHandler, QueueListener, DuplicateFilter
+
+
+class StallingFile(object):
+	"""A file whose flush() blocks for `stall` seconds every `every` calls, like a
+	busy disk.
+	"""
+
+	def __init__(self, path, stall, every):
+		self.file = open(path, 'w')
+		self.stall = stall
+		self.every = every
+		self.flushes = 0
+		self.lines = 0
+
+	def write(self, data):
+		self.lines += data.count('\n')
+		self.file.write(data)
+
+	def flush(self):
+		self.flushes += 1
+		if self.flushes % self.every == 0:
+			time.sleep(self.stall)
+
+		self.file.flush()
+
+	def close(self):
+		self.file.close()
+
+
+def run(label, args, queued, repeat):
+	path = tempfile.mktemp()
+	stream = StallingFile(path, args.stall, args.every)
+	handler = logging.StreamHandler(stream)
+	handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(message)s'))
+	logger = logging.getLogger(label)
+	logger.propagate = False
+	logger.setLevel(logging.DEBUG)
+
+	listener = None
+	front = handler
+	if queued:
+		queue = Queue.Queue(maxsize=10000)
+		listener = QueueListener(queue, [handler]).start()
+		front = QueueHandler(queue)
+
+	if repeat:
+		front.addFilter(DuplicateFilter(3600))
+
+	logger.addHandler(front)
+
+	latencies = []
+	start = time.time()
+	for _ in xrange(args.polls):
+		for n in xrange(args.targets):
+			call = time.time()
+			logger.info('site{n}: current external address is 10.0.0.{m}'.format(n=n, m=n % 256))
+			latencies.append(time.time() - call)
+
+	elapsed = time.time() - start
+	if listener is not None:
+		listener.stop()
+
+	stream.close()
+	os.unlink(path)
+	latencies.sort()
+	print '{label:<24} calls {calls:6d}  lines written {lines:6d}  {rate:9.0f} calls/s  p99 {p99:8.3f}ms  max {worst:8.3f}ms'.format(
+		label=label,
+		calls=len(latencies),
+		lines=stream.lines,
+		rate=len(latencies) / elapsed,
+		p99=latencies[int(len(latencies) * 0.99)] * 1000,
+		worst=latencies[-1] * 1000)
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument('--targets', type=int, default=500)
+	parser.add_argument('--polls', type=int, default=20)
+	parser.add_argument('--stall', type=float, default=0.02,
+						help='Seconds each simulated disk stall lasts')
+	parser.add_argument('--every', type=int, default=500, help='Flushes between stalls')
+	args = parser.parse_args()
+
+	run('direct', args, queued=False, repeat=False)
+	run('queued', args, queued=True, repeat=False)
+	run('queued, repeats hidden', args, queued=True, repeat=True)
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python2.7
+
+"""Compare per-poll latency, connections and syscalls of `get_ip()` with and
+without a keep-alive `ConnectionPool`, against a local stand-in router.
+Syscalls are the client's socket(), connect(), send(), recv() and close() calls.
+
+    python2.7 bench/bench_pool.py --polls 2000
+"""
+
+import os
+import sys
+import time
+import socket
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from ddnsupdater.main import get_ip
+from ddnsupdater.pool import ConnectionPool
+from fakes import fake_router
+
+
+class CountingSocket(object):
+	"""Pass calls through to a real socket, counting those which make a syscall."""
+
+	calls = 0
+
+	def __init__(self, sock):
+		self._sock = sock
+
+	def __getattr__(self, name):
+		attr = getattr(self._sock, name)
+		if name in ('send', 'sendall', 'recv', 'recv_into', 'close', 'shutdown'):
+			def counted(*args, **kwargs):
+				CountingSocket.calls += 1
+				return attr(*args, **kwargs)
+
+			return counted
+
+		return attr
+
+	def makefile(self, mode='r', bufsize=-1):
+		return socket._fileobject(self, mode, bufsize)
+
+
+def create_connection(*args, **kwargs):
+	CountingSocket.calls += 2  # socket() and connect()
+	return CountingSocket(original_create_connection(*args, **kwargs))
+
+
+original_create_connection = socket.create_connection
+
+
+def percentile(values, pct):
+	values = sorted(values)
+	return values[min(len(values) - 1, int(len(values) * pct / 100.0))]
+
+
+def run(label, polls, pool):
+	router = fake_router()
+	url = router.url + '/status'
+	latencies = []
+	CountingSocket.calls = 0
+	for _ in xrange(polls):
+		start = time.time()
+		get_ip('admin', '12345', url, 'IP Address', 1, r'.*<td>([0-9.]+)', pool=pool)
+		latencies.append(time.time() - start)
+
+	calls = CountingSocket.calls
+	print '{label:<12} p50 {p50:7.3f}ms  p99 {p99:7.3f}ms  requests/poll {r:.2f}  connections/poll {c:.2f}  syscalls/poll {s:.1f}'.format(
+		label=label,
+		p50=percentile(latencies, 50) * 1000,
+		p99=percentile(latencies, 99) * 1000,
+		r=float(router.requests) / polls,
+		c=float(router.connections) / polls,
+		s=float(calls) / polls)
+	if pool is not None:
+		pool.clear()
+
+	router.shutdown()
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument('--polls', type=int, default=2000)
+	args = parser.parse_args()
+
+	# count socket calls made by the client side only
+	socket.create_connection = create_connection
+	run('urllib2', args.polls, None)
+	run('keep-alive', args.polls, ConnectionPool())
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python2.7
+
+"""Compare the line by line `extract_ip()` scan, with rules hand tuned for each
+page, against `ddnsupdater.profiles.Extractor` over the saved router pages in
+bench/pages. The extractor is timed with the profile given, recognising the page
+every time, and after it has recognised the page once.
+
+    python2.7 bench/bench_profiles.py --repeat 2000
+"""
+
+import os
+import sys
+import time
+import argparse
+import cStringIO
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from ddnsupdater.main import extract_ip
+from ddnsupdater.profiles import Extractor
+
+PAGES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pages')
+
+# (file, profile, expected address, search, skip and match for `extract_ip()`)
+CORPUS = (
+	('sitecom-n300.html', 'sitecom-n300', '81.204.17.93', 'IP Address:', 1, r'.*>([0-9.]+)<'),
+	('dd-wrt.html', 'dd-wrt', '94.12.201.7', '{wan_ipaddr::', 0, r'\{wan_ipaddr::([0-9.]+)'),
+	('openwrt.json', 'openwrt', '37.120.8.54', '"wan":', 0, r'.*"wan":\{[^}]*"ipaddr":"([0-9.]+)"'),
+	('tp-link.html', 'tp-link', '102.65.18.240', 'var wanPara', 3, r'"([0-9.]+)"'),
+	('wan-ip.html', 'wan-ip', '203.0.113.77', 'WAN IP Address', 0, r'.*<b>([0-9.]+)</b>'),
+	)
+
+
+def timed(function, expected, repeat):
+	start = time.clock()
+	for _ in xrange(repeat):
+		assert function() == expected
+
+	return (time.clock() - start) * 1e6 / repeat
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument('--repeat', type=int, default=2000)
+	args = parser.parse_args()
+
+	print '{page:<18} {size:>6}  {loop:>9}  {fixed:>9}  {auto:>9}  {known:>9}  (us/page)'.format(
+		page='page', size='bytes', loop='lines', fixed='profile', auto='detect', known='detected')
+	for name, profile, expected, search, skip, match in CORPUS:
+		with open(os.path.join(PAGES, name)) as h:
+			page = h.read()
+
+		fixed = Extractor([profile])
+		auto = Extractor()
+		known = Extractor()
+		known.extract(page)
+		assert known.detected == profile, known.detected
+		print '{page:<18} {size:6d}  {loop:9.1f}  {fixed:9.1f}  {auto:9.1f}  {known:9.1f}'.format(
+			page=name,
+			size=len(page),
+			loop=timed(lambda: extract_ip(cStringIO.StringIO(page), search, skip, match),
+					   expected, args.repeat),
+			fixed=timed(lambda: fixed.extract(page), expected, args.repeat),
+			auto=timed(lambda: auto.detect(page)[1].group(1), expected, args.repeat),
+			known=timed(lambda: known.extract(page), expected, args.repeat))
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python2.7
+
+"""Time updating many DDNS records when the address changes: one request after
+another with `update_ddns()`, concurrently with `push_records()`, and batched into
+dyndns2 requests. The mock providers take `--delay` seconds to answer.
+
+    python2.7 bench/bench_push.py --records 48 --domains 4 --delay 0.05
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from ddnsupdater.main import update_ddns
+from ddnsupdater.pool import ConnectionPool
+from ddnsupdater.push import PushRecord, push_records
+from fakes import fake_provider
+
+
+def run(label, function, servers):
+	before = sum(server.requests for server in servers)
+	start = time.time()
+	results = function()
+	elapsed = time.time() - start
+	failed = len([r for r in results if not r.ok]) if results is not None else 0
+	print '{label:<12} {ms:8.1f}ms  requests {n:4d}  failed {f}'.format(
+		label=label,
+		ms=elapsed * 1000,
+		n=sum(server.requests for server in servers) - before,
+		f=failed)
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument('--records', type=int, default=48)
+	parser.add_argument('--domains', type=int, default=4)
+	parser.add_argument('--delay', type=float, default=0.05)
+	parser.add_argument('--workers', type=int, default=8)
+	args = parser.parse_args()
+
+	logging.basicConfig(level=logging.CRITICAL)
+	namecheap = [fake_provider(args.delay) for _ in xrange(args.domains)]
+	dyndns2 = fake_provider(args.delay, protocol='dyndns2')
+
+	records = [PushRecord('host{i}'.format(i=i),
+						  namecheap[i % args.domains].url +
+						  '/update?host=host{i}&domain=example{d}.com&password=1&ip={{ip}}'.format(
+								i=i, d=i % args.domains))
+			   for i in xrange(args.records)]
+	batched = [PushRecord('host{i}'.format(i=i),
+						  dyndns2.url + '/nic/update?hostname=host{i}.example.com&myip={{ip}}'.format(i=i),
+						  'dyndns2')
+			   for i in xrange(args.records)]
+
+	run('sequential',
+		lambda: [update_ddns(record.url.format(ip='1.2.3.4')) for record in records] and None,
+		namecheap)
+	pool = ConnectionPool()
+	run('concurrent',
+		lambda: push_records(records, '1.2.3.4', pool, max_workers=args.workers),
+		namecheap)
+	run('batched',
+		lambda: push_records(batched, '1.2.3.4', pool, max_workers=args.workers),
+		[dyndns2])
+	pool.clear()
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python2.7
+
+"""Poll targets behind a router whose address flaps on every request, then
+settles, with and without debouncing and a provider rate limit. Reports the
+updates the provider received, the most it received in any one second, and how
+long after the address settled every record held it.
+
+    python2.7 bench/bench_ratelimit.py --targets 20 --flap 5 --rate 300 --debounce 2
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+import functools
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from ddnsupdater.main import get_ip
+from ddnsupdater.pool import ConnectionPool
+from ddnsupdater.push import Pusher, PushRecord
+from ddnsupdater.engine import Engine, Target
+from ddnsupdater.schedule import Schedule
+from ddnsupdater.ratelimit import RateLimiter
+from fakes import fake_router, fake_provider, ROUTER_PAGE
+
+FINAL = '192.0.2.1'
+
+
+def run(label, args, rate=None, debounce=0):
+	router = fake_router(change_every=1)
+	provider = fake_provider()
+	pool = ConnectionPool(max_idle=args.max_in_flight)
+	push_pool = ConnectionPool(max_idle=args.max_in_flight)
+	limiter = RateLimiter(rate / 60.0, burst=args.burst) if rate else None
+	pushers = []
+	targets = []
+	for i in xrange(args.targets):
+		name = 'site{i}'.format(i=i)
+		fetch = functools.partial(get_ip, router.user, router.password, router.url + '/status',
+								  'IP Address', 1, r'.*<td>([0-9.]+)', pool=pool)
+		pusher = Pusher([PushRecord(name, provider.url + '/update?host=' + name + '&ip={ip}')],
+						push_pool,
+						limiter=limiter,
+						debounce=debounce,
+						max_debounce=args.max_debounce)
+		pushers.append(pusher)
+		targets.append(Target(name, fetch, pusher, args.period,
+							  schedule=Schedule(args.period, recheck=args.period, jitter=0.1)))
+
+	engine = Engine(targets, max_in_flight=args.max_in_flight)
+	thread = threading.Thread(target=engine.run)
+	thread.start()
+	# count the provider's requests in each second
+	per_second = []
+	start = time.time()
+	settled = None
+	converged = None
+	while converged is None and time.time() - start < args.flap + args.timeout:
+		before = provider.requests
+		time.sleep(1)
+		per_second.append(provider.requests - before)
+		if settled is None and time.time() - start >= args.flap:
+			router.change_every = None
+			router.page = ROUTER_PAGE.format(ip=FINAL)
+			settled = time.time()
+
+		elif settled is not None and all(p.pushed.get(p.records[0].name) == FINAL
+										 for p in pushers):
+			converged = time.time() - settled
+
+	engine.stop()
+	thread.join()
+	pool.clear()
+	push_pool.clear()
+	print '{label:<10} updates {updates:6d}  peak/s {peak:4d}  converged {converged}'.format(
+		label=label,
+		updates=provider.requests,
+		peak=max(per_second),
+		converged='{s:5.1f}s'.format(s=converged) if converged is not None else 'never')
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument('--targets', type=int, default=20)
+	parser.add_argument('--period', type=float, default=0.5,
+						help='Seconds between checks of each target')
+	parser.add_argument('--flap', type=float, default=5.0,
+						help='Seconds the address keeps changing for')
+	parser.add_argument('--timeout', type=float, default=30.0,
+						help='Seconds to wait for every record to settle')
+	parser.add_argument('--rate', type=float, default=300.0,
+						help='Updates per minute allowed by the provider')
+	parser.add_argument('--burst', type=int, default=5)
+	parser.add_argument('--debounce', type=int, default=2)
+	parser.add_argument('--max-debounce', type=int, default=300)
+	parser.add_argument('--max-in-flight', type=int, default=16)
+	args = parser.parse_args()
+
+	logging.basicConfig(level=logging.CRITICAL)
+	run('none', args)
+	run('debounce', args, debounce=args.debounce)
+	run('ratelimit', args, rate=args.rate)
+	run('both', args, rate=args.rate, debounce=args.debounce)
+
+
+if __name__ == '__main__':
+	main()
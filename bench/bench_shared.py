@@ -0,0 +1,93 @@
+#!/usr/bin/env python2.7
+
+"""Compare many targets behind one router fetching the address separately with the
+same targets sharing one fetch through `ddnsupdater.shared.SharedFetches`. Reports
+the requests the router had to answer, the most it answered at once, and the
+checks and pushes made for the targets. The router's address changes every few
+requests, so fewer requests also means fewer changes to push.
+
+    python2.7 bench/bench_shared.py --targets 100 --period 2 --duration 10
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+import functools
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from ddnsupdater.main import get_ip
+from ddnsupdater.pool import ConnectionPool
+from ddnsupdater.engine import Engine, Target
+from ddnsupdater.shared import SharedFetches
+from ddnsupdater.schedule import Schedule
+from fakes import fake_router
+
+
+def run(label, args, share):
+	router = fake_router(delay=args.router_delay, change_every=args.change_every)
+	pushes = []
+	pool = ConnectionPool(max_idle=args.max_in_flight)
+	shared = SharedFetches(args.window) if share else None
+
+	def push(name, ip):
+		# list.append is atomic
+		pushes.append((name, ip))
+
+	targets = []
+	for i in xrange(args.targets):
+		fetch = functools.partial(get_ip, router.user, router.password, router.url + '/status',
+								  'IP Address', 1, r'.*<td>([0-9.]+)', pool=pool)
+		if shared is not None:
+			fetch = shared.get('router', fetch)
+
+		name = 'site{i}'.format(i=i)
+		targets.append(Target(name, fetch, functools.partial(push, name), args.period,
+							  schedule=Schedule(args.period, recheck=args.period)))
+
+	engine = Engine(targets, max_in_flight=args.max_in_flight)
+	if shared is not None:
+		shared.subscribe(engine.fetched)
+
+	thread = threading.Thread(target=engine.run)
+	start = time.time()
+	thread.start()
+	time.sleep(args.duration)
+	engine.stop()
+	thread.join()
+	elapsed = time.time() - start
+	pool.clear()
+
+	print '{label:<10} router requests {requests:6d} ({rate:6.1f}/s)  peak concurrent {peak:3d}  checks {checks:6d}  pushes {pushes:6d}'.format(
+		label=label,
+		requests=router.requests,
+		rate=router.requests / elapsed,
+		peak=router.peak,
+		checks=engine.checks,
+		pushes=len(pushes))
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument('--targets', type=int, default=100)
+	parser.add_argument('--period', type=float, default=2.0)
+	parser.add_argument('--duration', type=float, default=10.0)
+	parser.add_argument('--max-in-flight', type=int, default=16)
+	parser.add_argument('--window', type=float, default=1.0,
+						help='Seconds a shared result is reused')
+	parser.add_argument('--router-delay', type=float, default=0.01,
+						help='Seconds the router takes to answer')
+	parser.add_argument('--change-every', type=int, default=3,
+						help='Router requests between address changes')
+	args = parser.parse_args()
+
+	logging.basicConfig(level=logging.CRITICAL)
+	run('separate', args, share=False)
+	run('shared', args, share=True)
+
+
+if __name__ == '__main__':
+	main()
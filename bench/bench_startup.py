@@ -0,0 +1,249 @@
+#!/usr/bin/env python2.7
+
+"""Measure how long ddns-updater takes to start and how much memory it holds, each
+in a fresh interpreter, so both can be tracked from release to release:
+
+    python2.7 bench/bench_startup.py --save 0.3.json
+    ... next release ...
+    python2.7 bench/bench_startup.py --baseline 0.3.json
+
+The scenarios are importing `ddnsupdater.main`, printing --help, and running the
+daemon against a fake router and DDNS provider until its first update, for one
+target and for a config file of --targets targets, with and without --low-memory.
+`pkg_resources` is the import a setuptools console_scripts wrapper makes before
+the program starts. Each figure is the median of --repeat runs. The exit status
+is 1 if any got worse than the baseline by more than --tolerance percent.
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import tempfile
+import subprocess
+
+BENCH = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(BENCH, '..')
+sys.path.insert(0, ROOT)
+
+from ddnsupdater import __version__
+from fakes import fake_router, fake_provider
+
+FIGURES = ('seconds', 'max_rss_kb', 'rss_kb', 'vm_kb', 'threads', 'modules')
+
+# Figures shown against the baseline but not counted as regressions: the address
+# space reserved by malloc for threads which have come and gone varies a lot from
+# run to run
+UNGATED = ('vm_kb',)
+
+# Scenarios which measure Python rather than ddns-updater, shown for reference
+REFERENCE = ('python', 'pkg_resources')
+
+
+def percentile(values, fraction):
+	values = sorted(values)
+	return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def proc_status(pid):
+	"""Return the current RSS and virtual size in KB and the thread count of `pid`."""
+	status = {}
+	with open('/proc/{pid}/status'.format(pid=pid)) as h:
+		for line in h:
+			key, _, value = line.partition(':')
+			status[key] = value.strip()
+
+	return {'rss_kb': int(status['VmRSS'].split()[0]),
+			'vm_kb': int(status['VmSize'].split()[0]),
+			'threads': int(status['Threads'])}
+
+
+def run_command(command):
+	"""Run `command` to completion, returning its time and peak RSS."""
+	start = time.time()
+	process = subprocess.Popen(command, cwd=ROOT, stdout=subprocess.PIPE)
+	output = process.stdout.read()
+	_, status, usage = os.wait4(process.pid, 0)
+	if status != 0:
+		raise RuntimeError('{command} failed'.format(command=' '.join(command)))
+
+	figures = {'seconds': time.time() - start, 'max_rss_kb': usage.ru_maxrss}
+	if output.strip().isdigit():
+		figures['modules'] = int(output)
+
+	return figures
+
+
+def run_daemon(command, provider, updates):
+	"""Start the daemon `command` and wait for `provider` to receive `updates`
+	updates, then measure it and stop it.
+	"""
+
+	before = provider.requests
+	start = time.time()
+	with open(os.devnull, 'w') as devnull:
+		process = subprocess.Popen(command, cwd=ROOT, stderr=devnull)
+
+	try:
+		while provider.requests - before < updates:
+			if process.poll() is not None or time.time() - start > 60:
+				raise RuntimeError('{command} did not update'.format(command=' '.join(command)))
+
+			time.sleep(0.005)
+
+		seconds = time.time() - start
+		# let the threads handling the responses finish
+		time.sleep(0.2)
+		figures = proc_status(process.pid)
+		figures['seconds'] = seconds
+
+	finally:
+		if process.poll() is None:
+			process.terminate()
+			process.wait()
+
+	return figures
+
+
+def write_config(path, router, provider, count):
+	with open(path, 'w') as h:
+		h.write('[ddnsupdater]\nsleep=3600\nshare_window=0\n\n')
+		h.write('[fetch]\nurl={url}/status\npassword=12345\nskip=1\n\n'.format(url=router.url))
+		for n in xrange(count):
+			h.write('[fetch:t{n}]\n\n[push:t{n}]\nurl={url}/update?host=t{n}&ip={{ip}}\n\n'.format(
+					n=n, url=provider.url))
+
+
+def scenarios(router, provider, config_file, targets):
+	python = sys.executable
+	daemon = [python, '-m', 'ddnsupdater.main', '--sleep', '3600',
+			  '--fetch-url', router.url + '/status', '--fetch-password', '12345',
+			  '--fetch-skip', '1',
+			  '--push-url', provider.url + '/update?ip={ip}']
+	count_modules = 'import sys; import ddnsupdater.main; print len(sys.modules)'
+	many = [python, '-m', 'ddnsupdater.main', '--config', config_file]
+	result = [
+		('python', lambda: run_command([python, '-c', 'pass'])),
+		('pkg_resources', lambda: run_command([python, '-c', 'import pkg_resources'])),
+		('import', lambda: run_command([python, '-c', count_modules])),
+		('--help', lambda: run_command([python, '-m', 'ddnsupdater.main', '--help'])),
+		('daemon', lambda: run_daemon(daemon, provider, 1)),
+		('daemon --low-memory', lambda: run_daemon(daemon + ['--low-memory'], provider, 1)),
+		('{n} targets'.format(n=targets), lambda: run_daemon(many, provider, targets)),
+		('{n} targets --low-memory'.format(n=targets),
+		 lambda: run_daemon(many + ['--low-memory'], provider, targets)),
+		]
+	return result
+
+
+def report(results, baseline=None, tolerance=25.0):
+	"""Print `results`, compared with `baseline` if given. Returns the list of
+	figures which got worse by more than `tolerance` percent.
+	"""
+
+	worse = []
+	print '{name:<24} {ms:>8} {max_rss:>10} {rss:>8} {vm:>9} {threads:>7} {modules:>7}'.format(
+		name='scenario', ms='ms', max_rss='peak KB', rss='RSS KB', vm='VM KB', threads='threads',
+		modules='modules')
+	for name, figures in results:
+		cells = []
+		for key, width in (('seconds', 8), ('max_rss_kb', 10), ('rss_kb', 8), ('vm_kb', 9),
+						   ('threads', 7), ('modules', 7)):
+			if key not in figures:
+				cells.append(' ' * width)
+
+			elif key == 'seconds':
+				cells.append('{value:{width}.1f}'.format(value=figures[key] * 1000, width=width))
+
+			else:
+				cells.append('{value:{width}d}'.format(value=int(figures[key]), width=width))
+
+		print '{name:<24} {cells}'.format(name=name, cells=' '.join(cells))
+		if baseline is None or name not in baseline.get('results', {}):
+			continue
+
+		changes = []
+		for key in FIGURES:
+			old = baseline['results'][name].get(key)
+			if key not in figures or not old:
+				continue
+
+			change = (figures[key] - old) / float(old) * 100
+			changes.append('{key} {change:+.1f}%'.format(key=key, change=change))
+			if change > tolerance and key not in UNGATED and name not in REFERENCE:
+				worse.append('{name} {key} {change:+.1f}%'.format(name=name, key=key,
+																  change=change))
+
+		print '{blank:<24}   vs {version}: {changes}'.format(
+				blank='', version=baseline.get('version'), changes=', '.join(changes))
+
+	return worse
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__,
+									 formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--targets', type=int, default=50,
+						help='Number of targets in the config file scenarios')
+	parser.add_argument('--repeat', type=int, default=5,
+						help='Run everything this many times and report the medians')
+	parser.add_argument('--save', metavar='FILE', help='Write the results to FILE as JSON')
+	parser.add_argument('--baseline', metavar='FILE', help='Compare with results saved earlier')
+	parser.add_argument('--tolerance', type=float, default=25.0, metavar='PERCENT',
+						help='Change allowed before a figure counts as a regression')
+	args = parser.parse_args()
+
+	logging.basicConfig(level=logging.CRITICAL)
+	router = fake_router()
+	provider = fake_provider()
+	config_file = tempfile.NamedTemporaryFile(suffix='.conf', delete=False).name
+	try:
+		write_config(config_file, router, provider, args.targets)
+		runs = {}
+		for _ in xrange(args.repeat):
+			for name, scenario in scenarios(router, provider, config_file, args.targets):
+				try:
+					figures = scenario()
+				except RuntimeError as e:
+					# e.g. an older release without --low-memory
+					print >> sys.stderr, 'Skipped {name}: {error}'.format(name=name, error=e)
+					continue
+
+				runs.setdefault(name, []).append(figures)
+
+	finally:
+		os.unlink(config_file)
+
+	results = []
+	for name, _ in scenarios(router, provider, config_file, args.targets):
+		if name in runs:
+			results.append((name, dict((key, percentile([run[key] for run in runs[name]], 0.5))
+									   for key in runs[name][0])))
+
+	baseline = None
+	if args.baseline is not None:
+		with open(args.baseline) as h:
+			baseline = json.load(h)
+
+	print 'ddns-updater {version}, {python}'.format(version=__version__,
+													python=sys.version.split()[0])
+	worse = report(results, baseline, args.tolerance)
+
+	if args.save is not None:
+		with open(args.save, 'w') as h:
+			json.dump({'version': __version__, 'results': dict(results)}, h, indent=1,
+					  sort_keys=True)
+
+	if len(worse) > 0:
+		print
+		print 'Regressions beyond {t:.0f}%:'.format(t=args.tolerance)
+		for line in worse:
+			print '  ' + line
+
+		sys.exit(1)
+
+
+if __name__ == '__main__':
+	main()
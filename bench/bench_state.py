@@ -0,0 +1,77 @@
+#!/usr/bin/env python2.7
+
+"""Time the `StateStore` with many targets: opening a populated database, looking
+targets up, and recording checks and pushes, compared with one plain statefile per
+target.
+
+    python2.7 bench/bench_state.py --targets 10000
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from ddnsupdater.state import StateStore, write_statefile
+
+
+def timed(label, count, function):
+	start = time.time()
+	function()
+	elapsed = time.time() - start
+	print '{label:<32} {t:8.3f}s  {per:8.1f}us each'.format(
+		label=label, t=elapsed, per=elapsed / max(1, count) * 1e6)
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument('--targets', type=int, default=10000)
+	args = parser.parse_args()
+
+	names = ['target{n}'.format(n=n) for n in xrange(args.targets)]
+	directory = tempfile.mkdtemp()
+	try:
+		path = os.path.join(directory, 'state.db')
+		store = StateStore(path)
+
+		def populate():
+			for n, name in enumerate(names):
+				store.checked(name, '10.0.{a}.{b}'.format(a=n // 256 % 256, b=n % 256))
+				store.pushed(name, '10.0.{a}.{b}'.format(a=n // 256 % 256, b=n % 256), 'good')
+
+		timed('statedb populate', 2 * len(names), populate)
+		store.close()
+
+		stores = []
+		timed('statedb open', len(names), lambda: stores.append(StateStore(path)))
+		store = stores[0]
+		timed('statedb lookup', len(names), lambda: [store.target(name) for name in names])
+		timed('statedb unchanged check', len(names),
+			  lambda: [store.checked(name, store.target(name).ip) for name in names])
+		store.close()
+
+		files = os.path.join(directory, 'files')
+		os.mkdir(files)
+
+		def write_files():
+			for name in names:
+				write_statefile(os.path.join(files, name), '10.0.0.1')
+
+		def read_files():
+			for name in names:
+				with open(os.path.join(files, name)) as h:
+					h.read()
+
+		timed('statefiles write', len(names), write_files)
+		timed('statefiles read', len(names), read_files)
+
+	finally:
+		shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+	main()
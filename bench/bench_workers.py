@@ -0,0 +1,101 @@
+#!/usr/bin/env python2.7
+
+"""Measure how polling throughput grows when the targets are split between
+worker processes by `ddnsupdater.supervisor.Supervisor`. Targets are polled with
+no delay between checks, against fake routers each running in its own process.
+
+    python2.7 bench/bench_workers.py --targets 2000 --workers 1 2 4 --duration 5
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+import functools
+import threading
+import multiprocessing
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from ddnsupdater.main import get_ip
+from ddnsupdater.pool import ConnectionPool
+from ddnsupdater.engine import Engine, Target
+from ddnsupdater.schedule import Schedule
+from ddnsupdater.supervisor import HashRing, Supervisor
+from fakes import fake_router, serve_in_process
+
+
+class NoDelay(Schedule):
+	def next_delay(self, ok, changed):
+		return 0
+
+
+def work(index, count, names, routers, counts, max_in_flight):
+	ring = HashRing(range(count))
+	pool = ConnectionPool(max_idle=max_in_flight)
+	targets = []
+	for n, name in enumerate(names):
+		if ring.node(name) != index:
+			continue
+
+		fetch = functools.partial(get_ip, 'admin', '12345', routers[n % len(routers)] + '/status',
+								  'IP Address', 1, r'.*<td>([0-9.]+)', pool=pool)
+		targets.append(Target(name, fetch, lambda ip: None, 1, schedule=NoDelay(1)))
+
+	engine = Engine(targets, max_in_flight=max_in_flight)
+	thread = threading.Thread(target=engine.run)
+	thread.daemon = True
+	thread.start()
+	# the supervisor stops workers with SIGTERM, so publish the count as it goes
+	while True:
+		time.sleep(0.2)
+		counts[index] = engine.checks
+
+
+def run(workers, names, routers, args):
+	counts = multiprocessing.Array('l', workers)
+	supervisor = Supervisor(workers, functools.partial(work,
+													   names=names,
+													   routers=routers,
+													   counts=counts,
+													   max_in_flight=args.max_in_flight))
+	thread = threading.Thread(target=supervisor.run, kwargs={'interval': 0.1})
+	thread.start()
+	# let every worker build its targets and warm up its connections
+	time.sleep(1)
+	before = sum(counts)
+	time.sleep(args.duration)
+	checks = sum(counts) - before
+	supervisor.stop()
+	thread.join()
+	shares = [sum(1 for name in names if HashRing(range(workers)).node(name) == i)
+			  for i in xrange(workers)]
+	print 'workers {workers:2d}  checks/s {rate:8.0f}  targets per worker {low}-{high}'.format(
+		workers=workers, rate=checks / args.duration, low=min(shares), high=max(shares))
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument('--targets', type=int, default=2000)
+	parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+	parser.add_argument('--routers', type=int, default=4,
+						help='Fake router processes to spread the targets over')
+	parser.add_argument('--duration', type=float, default=5.0)
+	parser.add_argument('--max-in-flight', type=int, default=16)
+	args = parser.parse_args()
+
+	logging.basicConfig(level=logging.CRITICAL)
+	servers = [serve_in_process(fake_router) for _ in xrange(args.routers)]
+	names = ['site{i}'.format(i=i) for i in xrange(args.targets)]
+	try:
+		for workers in args.workers:
+			run(workers, names, [url for url, _ in servers], args)
+
+	finally:
+		for _, process in servers:
+			process.terminate()
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,378 @@
+#!/usr/bin/env python2.7
+
+"""Local stand-in HTTP servers for benchmarking: a router status page and a
+namecheap-compatible DDNS provider.
+"""
+
+import sys
+import time
+import base64
+import socket
+import struct
+import hashlib
+import urlparse
+import threading
+import multiprocessing
+import SocketServer
+import BaseHTTPServer
+
+from ddnsupdater import dnsupdate
+
+ROUTER_PAGE = """<html><body><table>
+<tr>
+<td>IP Address:</td>
+<td>{ip}</td>
+</tr>
+</table></body></html>
+"""
+
+NAMECHEAP_RESPONSE = """<?xml version="1.0"?>
+<interface-response>
+<Command>SETDNSHOST</Command>
+<Language>eng</Language>
+<IP>{ip}</IP>
+<ErrCount>0</ErrCount>
+<ResponseCount>0</ResponseCount>
+<Done>true</Done>
+<debug><![CDATA[]]></debug>
+</interface-response>
+"""
+
+
+class FakeServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+	"""Threaded HTTP server counting connections, requests and body bytes sent, and
+	the most requests it was ever answering at once.
+	"""
+
+	daemon_threads = True
+	allow_reuse_address = True
+	request_queue_size = 128
+
+	def __init__(self, handler):
+		BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0), handler)
+		self.lock = threading.Lock()
+		self.connections = 0
+		self.requests = 0
+		self.bytes_sent = 0
+		self.in_flight = 0
+		self.peak = 0
+
+	def process_request(self, request, client_address):
+		with self.lock:
+			self.connections += 1
+
+		SocketServer.ThreadingMixIn.process_request(self, request, client_address)
+
+	def handle_error(self, request, client_address):
+		# clients closing a connection part way through a response is expected, and
+		# at interpreter shutdown the modules used here may already be gone
+		if sys is not None and not isinstance(sys.exc_info()[1], socket.error):
+			BaseHTTPServer.HTTPServer.handle_error(self, request, client_address)
+
+	@property
+	def url(self):
+		return 'http://127.0.0.1:{port}'.format(port=self.server_address[1])
+
+	def start(self):
+		thread = threading.Thread(target=self.serve_forever)
+		thread.daemon = True
+		thread.start()
+		return self
+
+
+class FakeHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+	protocol_version = 'HTTP/1.1'
+	# buffer each response and send it straight away so Nagle and delayed ACK
+	# don't add 40ms to every request
+	wbufsize = -1
+	disable_nagle_algorithm = True
+
+	def log_message(self, *args):
+		pass
+
+	def reply(self, code, body, headers=()):
+		self.send_response(code)
+		self.send_header('Content-Type', 'text/html')
+		self.send_header('Content-Length', str(len(body)))
+		for key, value in headers:
+			self.send_header(key, value)
+
+		self.end_headers()
+		if self.command != 'HEAD':
+			self.wfile.write(body)
+			with self.server.lock:
+				self.server.bytes_sent += len(body)
+
+	def do_GET(self):
+		server = self.server
+		with server.lock:
+			server.requests += 1
+			server.in_flight += 1
+			server.peak = max(server.peak, server.in_flight)
+
+		try:
+			self.respond()
+		finally:
+			with server.lock:
+				server.in_flight -= 1
+
+	do_HEAD = do_GET
+
+
+class RouterHandler(FakeHandler):
+	"""Serve `server.page` behind Basic authentication, challenging with a 401 first,
+	after `server.delay` seconds. With `server.validators` the page has an ETag,
+	and a matching If-None-Match gets a 304 unless it is 'ignore'.
+	"""
+
+	def respond(self):
+		if self.server.delay:
+			time.sleep(self.server.delay)
+
+		expected = 'Basic ' + base64.b64encode('{user}:{password}'.format(
+				user=self.server.user, password=self.server.password))
+		if self.headers.getheader('Authorization') != expected:
+			self.reply(401, 'Unauthorized',
+					   [('WWW-Authenticate', 'Basic realm="{realm}"'.format(
+								realm=self.server.realm))])
+			return
+
+		page = self.server.next_page()
+		if self.server.validators is None:
+			self.reply(200, page)
+			return
+
+		etag = '"{hash}"'.format(hash=hashlib.md5(page).hexdigest()[:16])
+		if (self.server.validators != 'ignore'
+				and self.headers.getheader('If-None-Match') == etag):
+			self.reply(304, '', [('ETag', etag)])
+			return
+
+		self.reply(200, page, [('ETag', etag)])
+
+
+class ProviderHandler(FakeHandler):
+	"""Reply to every update with a successful namecheap response after
+	`server.delay` seconds.
+	"""
+
+	def respond(self):
+		time.sleep(self.server.delay)
+		self.reply(200, NAMECHEAP_RESPONSE.format(ip='1.2.3.4'))
+
+
+class Dyndns2Handler(FakeHandler):
+	"""Answer dyndns2 updates with one 'good' line per host after `server.delay`
+	seconds.
+	"""
+
+	def respond(self):
+		time.sleep(self.server.delay)
+		query = urlparse.parse_qs(urlparse.urlsplit(self.path).query)
+		hosts = query.get('hostname', [''])[0].split(',')
+		ip = query.get('myip', [''])[0]
+		self.reply(200, ''.join('good {ip}\n'.format(ip=ip) for _ in hosts))
+
+
+class RouterServer(FakeServer):
+	"""A router whose address moves on to the next in 10.0.0.0/8 after every
+	`change_every` authenticated requests, if `change_every` is set.
+	"""
+
+	def __init__(self, ip, user, password, realm, page, change_every=None, delay=0,
+				 validators=None):
+		FakeServer.__init__(self, RouterHandler)
+		self.delay = delay
+		self.validators = validators
+		self.user = user
+		self.password = password
+		self.realm = realm
+		self.page = page if page is not None else ROUTER_PAGE.format(ip=ip)
+		self.change_every = change_every
+		self.pages_served = 0
+
+	def next_page(self):
+		if self.change_every is None:
+			return self.page
+
+		with self.lock:
+			self.pages_served += 1
+			n = self.pages_served // self.change_every
+
+		return ROUTER_PAGE.format(ip='10.{a}.{b}.{c}'.format(
+				a=n >> 16 & 255, b=n >> 8 & 255, c=n & 255))
+
+
+def fake_router(ip='1.2.3.4', user='admin', password='12345', realm='Router', page=None,
+				change_every=None, delay=0, validators=None):
+	"""Start a router serving a status page containing `ip`, or a new address every
+	`change_every` requests, taking `delay` seconds to answer each request.
+	`validators` is passed on to `RouterServer`.
+	"""
+
+	return RouterServer(ip, user, password, realm, page, change_every, delay,
+						validators).start()
+
+
+def fake_provider(delay=0, protocol='namecheap'):
+	"""Start a DDNS provider speaking `protocol` which takes `delay` seconds to
+	answer each request.
+	"""
+
+	server = FakeServer(Dyndns2Handler if protocol == 'dyndns2' else ProviderHandler)
+	server.delay = delay
+	return server.start()
+
+
+class FakeDNSServer(object):
+	"""Accept DNS UPDATE messages over UDP and TCP on the same port, answering
+	NOERROR, or NOTAUTH if a `key` is set and the message is not correctly signed.
+	Counts messages and the records they update. `close()` stops it and waits for
+	its threads.
+	"""
+
+	def __init__(self, key=None):
+		self.key = key
+		self.messages = 0
+		self.records = 0
+		self.tcp_messages = 0
+		self.lock = threading.Lock()
+		self.stopped = threading.Event()
+		self.threads = []
+		self.udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+		self.udp.bind(('127.0.0.1', 0))
+		# wake up now and then to see whether to stop
+		self.udp.settimeout(0.05)
+		self.port = self.udp.getsockname()[1]
+		self.tcp = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		self.tcp.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+		self.tcp.bind(('127.0.0.1', self.port))
+		self.tcp.listen(16)
+		self.tcp.settimeout(0.05)
+
+	def _spawn(self, target, *args):
+		thread = threading.Thread(target=target, args=args)
+		thread.daemon = True
+		with self.lock:
+			self.threads.append(thread)
+
+		thread.start()
+
+	def start(self):
+		self._spawn(self.serve_udp)
+		self._spawn(self.serve_tcp)
+		return self
+
+	def close(self):
+		self.stopped.set()
+		# once serve_tcp has returned no more connection threads are started
+		for thread in self.threads[:2]:
+			thread.join()
+
+		for thread in self.threads[2:]:
+			thread.join()
+
+		self.udp.close()
+		self.tcp.close()
+
+	def answer(self, message):
+		msg_id, flags, _, _, upcount, _ = dnsupdate.HEADER.unpack_from(message)
+		with self.lock:
+			self.messages += 1
+			self.records += upcount / 2
+
+		rcode = 0
+		request_mac = None
+		if self.key is not None:
+			try:
+				request_mac = self.key.verify(message)
+			except dnsupdate.DNSError:
+				rcode = 9
+
+		zone_end = dnsupdate.skip_name(message, dnsupdate.HEADER.size) + 4
+		reply = (dnsupdate.HEADER.pack(msg_id, 0x8000 | (flags & 0x7800) | rcode, 1, 0, 0, 0) +
+				 message[dnsupdate.HEADER.size:zone_end])
+		if request_mac is not None:
+			reply, _ = self.key.sign(reply, request_mac)
+
+		return reply
+
+	def serve_udp(self):
+		while not self.stopped.is_set():
+			try:
+				message, address = self.udp.recvfrom(65535)
+			except socket.timeout:
+				continue
+
+			self.udp.sendto(self.answer(message), address)
+
+	def serve_tcp(self):
+		while not self.stopped.is_set():
+			try:
+				conn, _ = self.tcp.accept()
+			except socket.timeout:
+				continue
+
+			self._spawn(self.serve_connection, conn)
+
+	def serve_connection(self, conn):
+		# a timed out read on a file object drops what it had read, so the
+		# messages are split up here
+		conn.settimeout(0.05)
+		data = ''
+		try:
+			while not self.stopped.is_set():
+				try:
+					chunk = conn.recv(65535)
+				except socket.timeout:
+					continue
+
+				if chunk == '':
+					return
+
+				data += chunk
+				while len(data) >= 2:
+					size = struct.unpack('!H', data[:2])[0]
+					if len(data) < 2 + size:
+						break
+
+					message, data = data[2:2 + size], data[2 + size:]
+					with self.lock:
+						self.tcp_messages += 1
+
+					reply = self.answer(message)
+					conn.sendall(struct.pack('!H', len(reply)) + reply)
+
+		except socket.error:
+			# the client went away
+			pass
+
+		finally:
+			conn.close()
+
+
+def fake_dns_server(key=None):
+	"""Start a name server accepting updates, signed with `key` if given."""
+	return FakeDNSServer(key).start()
+
+
+def _serve(factory, kwargs, conn):
+	server = factory(**kwargs)
+	conn.send(server.url)
+	conn.close()
+	while True:
+		time.sleep(3600)
+
+
+def serve_in_process(factory, **kwargs):
+	"""Start `factory(**kwargs)`, e.g. `fake_router`, in a child process so its CPU
+	time and memory are not counted against the code being measured. Returns the
+	server's URL and the `multiprocessing.Process`, which should be terminated
+	when done.
+	"""
+
+	parent, child = multiprocessing.Pipe()
+	process = multiprocessing.Process(target=_serve, args=(factory, kwargs, child))
+	process.daemon = True
+	process.start()
+	return parent.recv(), process
@@ -0,0 +1,330 @@
+#!/usr/bin/env python2.7
+
+"""Run every hot path against a fake router and DDNS provider, each in its own
+process, and report requests per second, p50/p99 latency, CPU time per operation
+and memory per target.
+
+    python2.7 bench/suite.py --save before.json
+    ... change something ...
+    python2.7 bench/suite.py --baseline before.json
+
+With --baseline each figure is compared with the saved run. The exit status is 1 if
+any got worse by more than --tolerance percent, so the suite can gate a change.
+Each figure is the median of --repeat runs, to keep noise below the tolerance. Use
+--scale to make every scenario shorter or longer.
+"""
+
+import gc
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import functools
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from ddnsupdater.main import get_ip, update_ddns, poll
+from ddnsupdater.pool import ConnectionPool
+from ddnsupdater.push import Pusher, PushRecord
+from ddnsupdater.engine import Engine, Target
+from ddnsupdater.schedule import Schedule
+from fakes import fake_router, fake_provider, serve_in_process
+
+USER = 'admin'
+PASSWORD = '12345'
+MATCH = r'.*<td>([0-9.]+)'
+
+# Whether a larger value of each reported figure is better
+HIGHER_IS_BETTER = {
+	'ops_per_sec': True,
+	'p50_ms': False,
+	'p99_ms': False,
+	'cpu_ms_per_op': False,
+	'kb_per_target': False,
+	}
+
+
+class Stop(BaseException):
+	"""Ends `poll()`, which otherwise runs forever and catches every Exception."""
+
+
+class NoDelay(Schedule):
+	def next_delay(self, ok, changed):
+		return 0
+
+
+def cpu_time():
+	times = os.times()
+	return times[0] + times[1]
+
+
+def rss_kb():
+	with open('/proc/self/statm') as h:
+		return int(h.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024
+
+
+def percentile(values, fraction):
+	values = sorted(values)
+	return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def measure(function, count, threads=1):
+	"""Call `function` `count` times spread over `threads` threads. Returns the
+	figures for the run.
+	"""
+
+	latencies = []
+	lock = threading.Lock()
+
+	def worker(calls):
+		mine = []
+		for _ in xrange(calls):
+			start = time.time()
+			function()
+			mine.append(time.time() - start)
+
+		with lock:
+			latencies.extend(mine)
+
+	workers = [threading.Thread(target=worker, args=(count // threads,)) for _ in xrange(threads)]
+	cpu = cpu_time()
+	start = time.time()
+	for thread in workers:
+		thread.start()
+
+	for thread in workers:
+		thread.join()
+
+	elapsed = time.time() - start
+	cpu = cpu_time() - cpu
+	return {'ops': len(latencies),
+			'ops_per_sec': len(latencies) / elapsed,
+			'p50_ms': percentile(latencies, 0.5) * 1000,
+			'p99_ms': percentile(latencies, 0.99) * 1000,
+			'cpu_ms_per_op': cpu / len(latencies) * 1000}
+
+
+def bench_get_ip(router, count, pool=None, threads=1):
+	fetch = functools.partial(get_ip, USER, PASSWORD, router + '/status', 'IP Address', 1, MATCH,
+							  pool=pool)
+	fetch()
+	return measure(fetch, count, threads)
+
+
+def bench_update_ddns(provider, count):
+	url = provider + '/update?host=www&domain=example.com&password=12345&ip={ip}'
+	return measure(lambda: update_ddns(url.format(ip='1.2.3.4')), count)
+
+
+def bench_poll(router, provider, count):
+	"""Run `poll()` with no delay between polls for `count` polls. The router changes
+	address every 10 requests, so every tenth poll also pushes.
+	"""
+
+	pool = ConnectionPool()
+	fetch = functools.partial(get_ip, USER, PASSWORD, router + '/status', 'IP Address', 1, MATCH,
+							  pool=pool)
+	latencies = []
+	state = {'calls': 0, 'last': None}
+
+	def counted_fetch():
+		now = time.time()
+		if state['last'] is not None:
+			latencies.append(now - state['last'])
+
+		state['last'] = now
+		state['calls'] += 1
+		if state['calls'] > count:
+			raise Stop()
+
+		return fetch()
+
+	push = Pusher([PushRecord('www', provider + '/update?host=www&ip={ip}')], ConnectionPool())
+	cpu = cpu_time()
+	start = time.time()
+	try:
+		poll(counted_fetch, 0, None, None, schedule=NoDelay(1), push_function=push)
+	except Stop:
+		pass
+
+	elapsed = time.time() - start
+	cpu = cpu_time() - cpu
+	return {'ops': len(latencies),
+			'ops_per_sec': len(latencies) / elapsed,
+			'p50_ms': percentile(latencies, 0.5) * 1000,
+			'p99_ms': percentile(latencies, 0.99) * 1000,
+			'cpu_ms_per_op': cpu / len(latencies) * 1000}
+
+
+def make_targets(router, provider, count, pool, push_pool, period):
+	return [Target(name='site{i}'.format(i=i),
+				   fetch=functools.partial(get_ip, USER, PASSWORD, router + '/status',
+										   'IP Address', 1, MATCH, pool=pool),
+				   push=Pusher([PushRecord('site{i}'.format(i=i),
+										   provider + '/update?host=site{i}&ip={{ip}}'.format(i=i))],
+							   push_pool),
+				   period=period,
+				   schedule=Schedule(period, jitter=0)) for i in xrange(count)]
+
+
+def bench_engine(router, provider, count, duration, max_in_flight=16):
+	"""Poll `count` targets, each due every second, for `duration` seconds."""
+	pool = ConnectionPool(max_idle=max_in_flight)
+	push_pool = ConnectionPool(max_idle=max_in_flight)
+	targets = make_targets(router, provider, count, pool, push_pool, 1)
+	latencies = []
+	for target in targets:
+		def timed(fetch=target.fetch):
+			start = time.time()
+			try:
+				return fetch()
+			finally:
+				latencies.append(time.time() - start)
+
+		target.fetch = timed
+
+	engine = Engine(targets, max_in_flight=max_in_flight)
+	thread = threading.Thread(target=engine.run)
+	cpu = cpu_time()
+	start = time.time()
+	thread.start()
+	time.sleep(duration)
+	engine.stop()
+	thread.join()
+	elapsed = time.time() - start
+	cpu = cpu_time() - cpu
+	return {'ops': engine.checks,
+			'ops_per_sec': engine.checks / elapsed,
+			'p50_ms': percentile(latencies, 0.5) * 1000,
+			'p99_ms': percentile(latencies, 0.99) * 1000,
+			'cpu_ms_per_op': cpu / engine.checks * 1000}
+
+
+def bench_memory(router, provider, count):
+	"""Measure the memory taken by `count` targets with their pushers and schedules."""
+	gc.collect()
+	before = rss_kb()
+	targets = make_targets(router, provider, count, ConnectionPool(), ConnectionPool(), 3600)
+	engine = Engine(targets)
+	gc.collect()
+	used = rss_kb() - before
+	del engine, targets
+	return {'ops': count, 'kb_per_target': float(used) / count}
+
+
+def run(scale):
+	n = lambda count: max(10, int(count * scale))
+	router, router_process = serve_in_process(fake_router, user=USER, password=PASSWORD,
+											  change_every=10)
+	provider, provider_process = serve_in_process(fake_provider)
+	try:
+		results = [
+			('get_ip keep-alive', bench_get_ip(router, n(2000), pool=ConnectionPool())),
+			('get_ip opener', bench_get_ip(router, n(1000), pool=None)),
+			('get_ip 16 threads', bench_get_ip(router, n(4000), pool=ConnectionPool(max_idle=16),
+											   threads=16)),
+			('update_ddns', bench_update_ddns(provider, n(500))),
+			('poll', bench_poll(router, provider, n(2000))),
+			('engine 200 targets', bench_engine(router, provider, 200, max(1.0, 5 * scale))),
+			('memory', bench_memory(router, provider, n(5000))),
+			]
+
+	finally:
+		router_process.terminate()
+		provider_process.terminate()
+
+	return results
+
+
+def median_results(runs):
+	"""Combine several runs' results, taking the median of each figure."""
+	combined = []
+	for n, (name, figures) in enumerate(runs[0]):
+		combined.append((name, dict((key, percentile([run[n][1][key] for run in runs], 0.5))
+									for key in figures)))
+
+	return combined
+
+
+def report(results, baseline=None, tolerance=25.0):
+	"""Print `results`, compared with `baseline` if given. Returns the list of
+	figures which got worse by more than `tolerance` percent.
+	"""
+
+	worse = []
+	print '{name:<20} {ops:>6} {rps:>10} {p50:>9} {p99:>9} {cpu:>9} {mem:>9}'.format(
+		name='scenario', ops='ops', rps='ops/s', p50='p50 ms', p99='p99 ms', cpu='cpu ms/op',
+		mem='KB/target')
+	for name, figures in results:
+		cells = []
+		for key, width in (('ops_per_sec', 10), ('p50_ms', 9), ('p99_ms', 9),
+						   ('cpu_ms_per_op', 9), ('kb_per_target', 9)):
+			if key not in figures:
+				cells.append(' ' * width)
+				continue
+
+			cells.append('{value:{width}.{digits}f}'.format(
+					value=figures[key], width=width, digits=0 if key == 'ops_per_sec' else 3))
+
+		print '{name:<20} {ops:>6} {cells}'.format(name=name, ops=figures['ops'],
+												   cells=' '.join(cells))
+		if baseline is None or name not in baseline:
+			continue
+
+		changes = []
+		for key, higher_is_better in sorted(HIGHER_IS_BETTER.items()):
+			if key not in figures or not baseline[name].get(key):
+				continue
+
+			change = (figures[key] - baseline[name][key]) / baseline[name][key] * 100
+			changes.append('{key} {change:+.1f}%'.format(key=key, change=change))
+			if (change < -tolerance) if higher_is_better else (change > tolerance):
+				worse.append('{name} {key} {change:+.1f}%'.format(name=name, key=key,
+																  change=change))
+
+		print '{blank:<20}   vs baseline: {changes}'.format(blank='', changes=', '.join(changes))
+
+	return worse
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__,
+									 formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--scale', type=float, default=1.0,
+						help='Multiply the length of every scenario by this')
+	parser.add_argument('--save', metavar='FILE', help='Write the results to FILE as JSON')
+	parser.add_argument('--baseline', metavar='FILE', help='Compare with results saved earlier')
+	parser.add_argument('--repeat', type=int, default=3,
+						help='Run everything this many times and report the medians')
+	parser.add_argument('--tolerance', type=float, default=25.0, metavar='PERCENT',
+						help='Change allowed before a figure counts as a regression')
+	args = parser.parse_args()
+
+	logging.basicConfig(level=logging.CRITICAL)
+	results = median_results([run(args.scale) for _ in xrange(args.repeat)])
+
+	baseline = None
+	if args.baseline is not None:
+		with open(args.baseline) as h:
+			baseline = json.load(h)
+
+	worse = report(results, baseline, args.tolerance)
+
+	if args.save is not None:
+		with open(args.save, 'w') as h:
+			json.dump(dict(results), h, indent=1, sort_keys=True)
+
+	if len(worse) > 0:
+		print
+		print 'Regressions beyond {t:.0f}%:'.format(t=args.tolerance)
+		for line in worse:
+			print '  ' + line
+
+		sys.exit(1)
+
+
+if __name__ == '__main__':
+	main()
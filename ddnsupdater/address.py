@@ -0,0 +1,157 @@
+#!/usr/bin/env python2.7
+
+"""Parse, normalise and compare the external addresses of a target.
+
+A fetch may find an IPv4 address, an IPv6 address and a delegated IPv6 prefix.
+Each is normalised so that different ways of writing the same address compare
+equal, and they are kept together as one string, comma separated in the order of
+`RECORD_TYPES`, e.g. '192.0.2.1,2001:db8::1,2001:db8:100::/56'. A target holding
+only an IPv4 address therefore looks exactly as it always has.
+
+Each push URL updates one type of record, chosen by the placeholder it contains:
+
+    {ip}      the IPv4 address, for A records
+    {ip6}     the IPv6 address, for AAAA records
+    {prefix}  the delegated IPv6 prefix, e.g. 2001:db8:100::/56
+
+"""
+
+import socket
+import string
+
+RECORD_TYPES = ('A', 'AAAA', 'PREFIX')
+
+# Push URL placeholder for each record type
+PLACEHOLDERS = {
+	'ip': 'A',
+	'ip6': 'AAAA',
+	'prefix': 'PREFIX',
+	}
+
+# Documentation addresses used to check push URLs can be filled in
+SAMPLES = {
+	'ip': '192.0.2.1',
+	'ip6': '2001:db8::1',
+	'prefix': '2001:db8:100::/56',
+	}
+
+_formatter = string.Formatter()
+
+# normalised forms of the strings seen recently, as polls see the same few again
+# and again
+_normalised = {}
+
+
+def normalise_ipv4(text):
+	parts = text.split('.')
+	if len(parts) != 4 or not all(part.isdigit() and int(part) < 256 for part in parts):
+		raise ValueError('Not an IP address: {text}'.format(text=text))
+
+	# int() drops the leading zeros some routers pad with
+	return '.'.join(str(int(part)) for part in parts)
+
+
+def normalise_one(text):
+	"""Return the record type and normal form of one address or prefix, raising
+	ValueError if `text` is neither. IPv6 addresses are written in the compressed
+	lower case form of RFC 5952, and IPv4-mapped IPv6 addresses as plain IPv4.
+	"""
+
+	text = text.strip()
+	if '/' in text:
+		network, _, length = text.partition('/')
+		try:
+			packed = socket.inet_pton(socket.AF_INET6, network)
+		except socket.error:
+			raise ValueError('Not an IPv6 prefix: {text}'.format(text=text))
+
+		if not length.isdigit() or int(length) > 128:
+			raise ValueError('Bad prefix length: {text}'.format(text=text))
+
+		# clear the host bits so 2001:db8::1/64 and 2001:db8::/64 are the same prefix
+		bits = int(packed.encode('hex'), 16) >> (128 - int(length)) << (128 - int(length))
+		packed = ('{bits:032x}'.format(bits=bits)).decode('hex')
+		return 'PREFIX', '{network}/{length}'.format(
+			network=socket.inet_ntop(socket.AF_INET6, packed), length=int(length))
+
+	if ':' not in text:
+		return 'A', normalise_ipv4(text)
+
+	try:
+		packed = socket.inet_pton(socket.AF_INET6, text.split('%')[0])
+	except socket.error:
+		raise ValueError('Not an IP address: {text}'.format(text=text))
+
+	if packed.startswith('\0' * 10 + '\xff' * 2):
+		return 'A', socket.inet_ntoa(packed[12:])
+
+	return 'AAAA', socket.inet_ntop(socket.AF_INET6, packed)
+
+
+def split(value):
+	"""Return a dictionary of record type to address for `value`, a string of
+	addresses separated by commas or white space, or a list of them. The first
+	address of each type is kept.
+	"""
+
+	if isinstance(value, basestring):
+		value = value.replace(',', ' ').split()
+
+	addresses = {}
+	for text in value:
+		record_type, normal = normalise_one(text)
+		addresses.setdefault(record_type, normal)
+
+	if len(addresses) == 0:
+		raise ValueError('No IP address found')
+
+	return addresses
+
+
+def normalise(value):
+	"""Return `value`, as taken by `split()`, as one string holding the normal form
+	of each address, so that two observations of the same addresses are equal.
+	"""
+
+	if isinstance(value, basestring):
+		normal = _normalised.get(value)
+		if normal is not None:
+			return normal
+
+	addresses = split(value)
+	normal = ','.join(addresses[t] for t in RECORD_TYPES if t in addresses)
+	if isinstance(value, basestring):
+		if len(_normalised) > 1000:
+			_normalised.clear()
+
+		_normalised[value] = normal
+
+	return normal
+
+
+def placeholders(value):
+	"""Return the values for the push URL placeholders from the normalised
+	addresses `value`. Placeholders for missing addresses are None.
+	"""
+
+	addresses = split(value) if value is not None else {}
+	return dict((name, addresses.get(record_type)) for name, record_type in PLACEHOLDERS.items())
+
+
+def url_record_type(url):
+	"""Return the type of record updated by the push URL template `url`, from the
+	placeholder it contains. A URL with no placeholder, for providers which take the
+	address the request comes from, updates an A record. Raises ValueError if the
+	URL mixes placeholders for different types.
+	"""
+
+	types = set()
+	for _, field, _, _ in _formatter.parse(url):
+		if field is not None and field in PLACEHOLDERS:
+			types.add(PLACEHOLDERS[field])
+
+	if len(types) > 1:
+		raise ValueError('Push URL {url} mixes {types} placeholders; use one URL per '
+						 'record type'.format(url=url, types=' and '.join(sorted(types))))
+
+	return types.pop() if types else 'A'
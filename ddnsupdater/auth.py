@@ -0,0 +1,170 @@
+#!/usr/bin/env python2.7
+
+"""Cache of urllib2 openers holding Basic authentication credentials per router"""
+
+import re
+import base64
+import socket
+import urllib2
+import urlparse
+import logging
+import threading
+import collections
+
+from ddnsupdater import deadline
+
+
+class PreemptiveBasicAuthHandler(urllib2.HTTPBasicAuthHandler):
+	"""Send credentials with every request for a URL whose realm is already known,
+	rather than waiting for the server to reply with a 401 challenge first.
+	"""
+
+	def __init__(self, realm, password_mgr=None):
+		urllib2.HTTPBasicAuthHandler.__init__(self, password_mgr)
+		self.realm = realm
+
+	def http_request(self, req):
+		user, password = self.passwd.find_user_password(self.realm, req.get_full_url())
+		if user is not None and not req.has_header('Authorization'):
+			req.add_unredirected_header('Authorization', 'Basic ' + base64.b64encode(
+					'{user}:{password}'.format(user=user, password=password or '')))
+
+		return req
+
+	https_request = http_request
+
+
+class Request(urllib2.Request):
+	"""A `urllib2.Request` which may use a method other than GET or POST."""
+
+	def __init__(self, url, headers=None, method='GET'):
+		urllib2.Request.__init__(self, url, headers=headers or {})
+		self.method = method
+
+	def get_method(self):
+		return self.method
+
+
+class OpenerCache(object):
+	"""Openers keyed by (url, realm, user), so routers with different credentials
+	can be polled from one process without touching urllib2's global opener.
+	The least recently used opener is dropped once there are more than `max_size`.
+	Safe to share between threads.
+
+	>>> cache = OpenerCache()
+	>>> response = cache.urlopen('http://192.168.0.1/status', 'admin', '12345')
+
+	"""
+
+	def __init__(self, max_size=1024):
+		self.max_size = max_size
+		self._openers = collections.OrderedDict()
+		self._realms = {}
+		self._lock = threading.Lock()
+		# Basic authentication challenges answered, by 'host:port'
+		self.challenges = collections.Counter()
+
+	def __len__(self):
+		return len(self._openers)
+
+	def get(self, url, realm, user):
+		"""Return the opener for `url`, `realm` and `user`, or None."""
+		key = (url, realm, user)
+		with self._lock:
+			opener = self._openers.pop(key, None)
+			if opener is not None:
+				# re-insert to mark as most recently used
+				self._openers[key] = opener
+
+			return opener
+
+	def add(self, url, realm, user, password):
+		"""Build and remember an opener which authenticates as `user` in `realm`."""
+		password_mgr = urllib2.HTTPPasswordMgr()
+		password_mgr.add_password(realm=realm, uri=url, user=user, passwd=password)
+		opener = urllib2.build_opener(PreemptiveBasicAuthHandler(realm, password_mgr))
+		key = (url, realm, user)
+		with self._lock:
+			self._openers.pop(key, None)
+			self._openers[key] = opener
+			self._realms[(url, user)] = realm
+			while len(self._openers) > self.max_size:
+				(old_url, _, old_user), _ = self._openers.popitem(last=False)
+				self._realms.pop((old_url, old_user), None)
+
+		return opener
+
+	def evict(self, url, realm, user):
+		"""Forget the opener for `url`, `realm` and `user`, e.g. if its password
+		has been rejected.
+		"""
+
+		with self._lock:
+			self._openers.pop((url, realm, user), None)
+			if self._realms.get((url, user)) == realm:
+				del self._realms[(url, user)]
+
+	def urlopen(self, url, user, password, headers=None, method='GET'):
+		"""Open `url`, authenticating as `user` if the server asks for it.
+		After the first challenge for a (url, user) pair the credentials are sent up
+		front, so later calls make a single request. `headers` are sent as well, and
+		`method` may be 'HEAD' instead of GET. A 304 answer to a conditional request
+		is returned like any other response.
+		"""
+
+		with self._lock:
+			realm = self._realms.get((url, user))
+
+		opener = self.get(url, realm, user) if realm is not None else None
+		try:
+			return self._open(opener, url, headers, method)
+
+		except urllib2.HTTPError as e:
+			if e.code != 401:
+				raise
+
+			if opener is not None:
+				logging.debug('Cached credentials for {user} rejected, re-authenticating'.format(
+						user=user))
+				self.evict(url, realm, user)
+
+			challenge = e.headers.getheader('WWW-Authenticate')
+
+		parts = urlparse.urlsplit(url)
+		default_port = 443 if parts.scheme == 'https' else 80
+		with self._lock:
+			self.challenges['{host}:{port}'.format(host=parts.hostname,
+												   port=parts.port or default_port)] += 1
+
+		realm_obj = re.match(r'Basic realm="(.*)"', challenge or '')
+		if realm_obj is None:
+			raise ValueError('Could not find realm in {h}'.format(h=challenge))
+
+		opener = self.add(url, realm_obj.group(1), user, password)
+		return self._open(opener, url, headers, method)
+
+	def _open(self, opener, url, headers, method):
+		timeout = deadline.timeout('request', None)
+		if timeout is None:
+			timeout = socket._GLOBAL_DEFAULT_TIMEOUT
+
+		try:
+			if opener is not None:
+				return deadline.guard(opener.open(Request(url, headers, method), timeout=timeout))
+
+			return deadline.guard(urllib2.urlopen(Request(url, headers, method), timeout=timeout))
+
+		except urllib2.HTTPError as e:
+			# urllib2 treats "not modified" as an error, but it is the answer we want
+			if e.code == 304:
+				return deadline.guard(e)
+
+			raise
+
+		except (urllib2.URLError, socket.timeout) as e:
+			deadline.check_timeout(e)
+			raise
+
+
+# Shared by every `get_ip()` call which is not given a connection pool
+default_openers = OpenerCache()
@@ -0,0 +1,307 @@
+#!/usr/bin/env python2.7
+
+"""Read and check the configuration file.
+
+Everything is parsed and validated once when the file is loaded: regular
+expressions are compiled, push URL templates are split and tried out, and source
+and protocol names are looked up. So a bad setting is reported at startup, or when
+the file is reloaded, rather than on the first poll that uses it.
+"""
+
+import os
+import re
+import collections
+
+from ddnsupdater import address
+from ddnsupdater.sources import find_source
+from ddnsupdater.providers import find_driver
+from ddnsupdater.profiles import find_profile
+
+# (section, option, key in the defaults dictionary, ConfigParser method to read it)
+DEFAULT_OPTIONS = (
+	('ddnsupdater', 'sleep', 'sleep', 'getint'),
+	('ddnsupdater', 'statefile', 'statefile', 'get'),
+	('ddnsupdater', 'statedb', 'statedb', 'get'),
+	('ddnsupdater', 'max_in_flight', 'max_in_flight', 'getint'),
+	('ddnsupdater', 'retry', 'retry', 'getint'),
+	('ddnsupdater', 'max_backoff', 'max_backoff', 'getint'),
+	('ddnsupdater', 'recheck', 'recheck', 'getint'),
+	('ddnsupdater', 'jitter', 'jitter', 'getfloat'),
+	('ddnsupdater', 'events', 'events', 'get'),
+	('ddnsupdater', 'hook_port', 'hook_port', 'getint'),
+	('ddnsupdater', 'hook_address', 'hook_address', 'get'),
+	('ddnsupdater', 'metrics_port', 'metrics_port', 'getint'),
+	('ddnsupdater', 'metrics_textfile', 'metrics_textfile', 'get'),
+	('ddnsupdater', 'trace_dir', 'trace_dir', 'get'),
+	('ddnsupdater', 'log_queue', 'log_queue', 'getboolean'),
+	('ddnsupdater', 'log_json', 'log_json', 'getboolean'),
+	('ddnsupdater', 'log_repeat', 'log_repeat', 'getint'),
+	('ddnsupdater', 'share_window', 'share_window', 'getint'),
+	('ddnsupdater', 'workers', 'workers', 'getint'),
+	('ddnsupdater', 'low_memory', 'low_memory', 'getboolean'),
+	('ddnsupdater', 'timeout', 'timeout', 'getfloat'),
+	('fetch', 'source', 'fetch_source', 'get'),
+	('fetch', 'interface', 'fetch_interface', 'get'),
+	('fetch', 'gateway', 'fetch_gateway', 'get'),
+	('fetch', 'url', 'fetch_url', 'get'),
+	('fetch', 'user', 'fetch_user', 'get'),
+	('fetch', 'password', 'fetch_password', 'get'),
+	('fetch', 'search', 'fetch_search', 'get'),
+	('fetch', 'skip', 'fetch_skip', 'getint'),
+	('fetch', 'match', 'fetch_match', 'get'),
+	('fetch', 'search6', 'fetch_search6', 'get'),
+	('fetch', 'skip6', 'fetch_skip6', 'getint'),
+	('fetch', 'match6', 'fetch_match6', 'get'),
+	('fetch', 'profile', 'fetch_profile', 'get'),
+	('fetch', 'keepalive', 'keepalive', 'getboolean'),
+	('fetch', 'conditional', 'conditional', 'getboolean'),
+	('push', 'url', 'push_url', 'get'),
+	('push', 'protocol', 'push_protocol', 'get'),
+	('push', 'rate', 'push_rate', 'getfloat'),
+	('push', 'burst', 'push_burst', 'getint'),
+	('push', 'debounce', 'debounce', 'getint'),
+	('push', 'max_debounce', 'max_debounce', 'getint'),
+	)
+
+# Options which a [fetch:NAME] section may override, with the method to read them
+TARGET_FETCH_OPTIONS = (
+	('sleep', 'getint'),
+	('source', 'get'),
+	('interface', 'get'),
+	('gateway', 'get'),
+	('url', 'get'),
+	('user', 'get'),
+	('password', 'get'),
+	('search', 'get'),
+	('skip', 'getint'),
+	('match', 'get'),
+	('search6', 'get'),
+	('skip6', 'getint'),
+	('match6', 'get'),
+	('profile', 'get'),
+	)
+
+FETCH_FIELDS = ('fetch_source', 'fetch_interface', 'fetch_gateway', 'fetch_url', 'fetch_user',
+				'fetch_password', 'fetch_search', 'fetch_skip', 'fetch_match', 'fetch_search6',
+				'fetch_skip6', 'fetch_match6', 'fetch_profile')
+
+PUSH_FIELDS = ('push_urls', 'push_protocol')
+
+Config = collections.namedtuple('Config', 'defaults targets')
+
+
+class TargetConfig(collections.namedtuple('TargetConfig',
+										  ('name', 'sleep') + FETCH_FIELDS + PUSH_FIELDS)):
+	"""The checked settings of one named target. `push_urls` is a tuple of URL
+	templates, one per DDNS record.
+	"""
+
+	__slots__ = ()
+
+	def fetch_options(self):
+		"""Return the `fetch_` settings as a dictionary."""
+		return dict((field, getattr(self, field)) for field in FETCH_FIELDS)
+
+	def same_fetch(self, other):
+		return all(getattr(self, f) == getattr(other, f) for f in ('sleep',) + FETCH_FIELDS)
+
+	def same_push(self, other):
+		return all(getattr(self, f) == getattr(other, f) for f in PUSH_FIELDS)
+
+
+# Regular expressions for `get_ip()` compiled once and reused on every poll
+match_patterns = {}
+
+
+def compile_match(match):
+	"""Return the compiled form of the `match` regular expression."""
+	pattern = match_patterns.get(match)
+	if pattern is None:
+		pattern = re.compile(match)
+		if pattern.groups == 0:
+			raise ValueError('No groups in regular expression {match}'.format(match=match))
+
+		match_patterns[match] = pattern
+
+	return pattern
+
+
+def split_urls(urls):
+	"""Return the non-blank lines of a push `url` setting as a tuple of templates,
+	raising ValueError if one cannot be filled in with an address.
+	"""
+
+	templates = tuple(url.strip() for url in urls.splitlines() if url.strip() != '')
+	if len(templates) == 0:
+		raise ValueError('No push URL configured')
+
+	for template in templates:
+		try:
+			template.format(**address.SAMPLES)
+		except (KeyError, IndexError, ValueError) as e:
+			raise ValueError('Bad push URL {url}: {err!r}'.format(url=template, err=e))
+
+		address.url_record_type(template)
+
+	return templates
+
+
+def check_fetch(options):
+	"""Raise ValueError if the `fetch_` settings in the `options` dictionary cannot
+	work. Regular expressions are compiled here so polls find them ready.
+	"""
+
+	source = options['fetch_source']
+	if source == 'router':
+		if options['fetch_url'] is None:
+			raise ValueError('No url configured')
+
+		if options.get('fetch_profile'):
+			# the profile takes the place of the search and match rules
+			if options['fetch_profile'] != 'auto':
+				find_profile(options['fetch_profile'])
+
+			return
+
+		if not options['fetch_search']:
+			raise ValueError('No search string configured')
+
+		for key in ('fetch_match', 'fetch_match6'):
+			if options.get(key) is None:
+				continue
+
+			try:
+				compile_match(options[key])
+			except re.error as e:
+				raise ValueError('Bad match expression {match}: {err}'.format(
+						match=options[key], err=e))
+
+		if options.get('fetch_search6') and options.get('fetch_match6') is None:
+			raise ValueError('search6 needs a match6 expression')
+
+		return
+
+	find_source(source)
+	if source == 'interface' and options.get('fetch_interface') is None:
+		raise ValueError('The interface source needs an interface name')
+
+
+def read_defaults(config, config_file, defaults):
+	"""Return a copy of `defaults` updated with the settings of the plain
+	`[ddnsupdater]`, `[fetch]` and `[push]` sections of `config`.
+	"""
+
+	defaults = dict(defaults)
+	for section, option, key, method in DEFAULT_OPTIONS:
+		if config.has_option(section, option):
+			defaults[key] = getattr(config, method)(section, option)
+
+	if config.has_option('ddnsupdater', 'logging'):
+		# set log config file name relative to config file name
+		defaults['logging'] = os.path.join(
+			os.path.dirname(os.path.abspath(config_file)),
+							 config.get('ddnsupdater', 'logging'))
+
+	return defaults
+
+
+def read_target(config, name, defaults):
+	"""Build the `TargetConfig` for the `[fetch:NAME]` and `[push:NAME]` sections of
+	`config`, taking missing options from `defaults`.
+	"""
+
+	section = 'fetch:' + name
+	push_section = 'push:' + name
+	if not config.has_section(push_section):
+		raise ValueError('Section [{fetch}] has no matching [{push}] section'.format(
+				fetch=section, push=push_section))
+
+	options = {
+		'fetch_sleep': defaults['sleep'],
+		'push_protocol': defaults.get('push_protocol', 'namecheap'),
+		}
+	for field in FETCH_FIELDS:
+		options[field] = defaults.get(field)
+
+	present = set(config.options(section))
+	for option, method in TARGET_FETCH_OPTIONS:
+		if option in present:
+			options['fetch_' + option] = getattr(config, method)(section, option)
+
+	if config.has_option(push_section, 'protocol'):
+		options['push_protocol'] = config.get(push_section, 'protocol')
+
+	try:
+		if options['fetch_sleep'] < 1:
+			raise ValueError('sleep must be at least 1 second')
+
+		check_fetch(options)
+
+	except ValueError as e:
+		raise ValueError('In section [{section}]: {err}'.format(section=section, err=e))
+
+	try:
+		if not config.has_option(push_section, 'url'):
+			raise ValueError('No url configured')
+
+		find_driver(options['push_protocol'])
+		push_urls = split_urls(config.get(push_section, 'url'))
+
+	except ValueError as e:
+		raise ValueError('In section [{section}]: {err}'.format(section=push_section, err=e))
+
+	sleep = options.pop('fetch_sleep')
+	return TargetConfig(name=name, sleep=sleep, push_urls=push_urls, **options)
+
+
+def load(config_file, defaults):
+	"""Read and check `config_file`. Returns a `Config` holding a copy of
+	`defaults` updated from the plain sections, and a list of `TargetConfig`, one per
+	pair of named `[fetch:NAME]` and `[push:NAME]` sections, sorted by name.
+	Options missing from a named section are taken from the updated defaults, so
+	settings shared by every target can go in the plain `[fetch]` section.
+	Raises IOError if the file cannot be read and ValueError for a bad setting.
+	"""
+
+	if not os.path.exists(config_file):
+		raise IOError('Configuration file {name} cannot be read'.format(
+				name=config_file))
+
+	# only imported when there is a file to read
+	import ConfigParser
+	# plain dicts parse a file with hundreds of sections much faster than the default
+	# OrderedDict, and the targets are sorted anyway
+	config = ConfigParser.ConfigParser(dict_type=dict)
+	try:
+		config.read(config_file)
+
+		defaults = read_defaults(config, config_file, defaults)
+
+		targets = []
+		for section in config.sections():
+			if section.startswith('fetch:'):
+				targets.append(read_target(config, section[len('fetch:'):], defaults))
+
+			elif section.startswith('push:') and not config.has_section('fetch:' + section[5:]):
+				raise ValueError('Section [{push}] has no matching [fetch:{name}] section'.format(
+						push=section, name=section[5:]))
+
+	except ConfigParser.Error as e:
+		# a malformed file, or a bad %(name)s reference in a value
+		raise ValueError('Cannot read configuration file {name}: {err}'.format(
+				name=config_file, err=str(e).strip()))
+
+	return Config(defaults, sorted(targets, key=lambda t: t.name))
+
+
+def diff_targets(old, new):
+	"""Compare two lists of `TargetConfig`. Returns the names of the targets which
+	were added, removed and changed, each as a sorted list.
+	"""
+
+	old = dict((t.name, t) for t in old)
+	new = dict((t.name, t) for t in new)
+	added = sorted(name for name in new if name not in old)
+	removed = sorted(name for name in old if name not in new)
+	changed = sorted(name for name in new if name in old and new[name] != old[name])
+	return added, removed, changed
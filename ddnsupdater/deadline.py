@@ -0,0 +1,223 @@
+#!/usr/bin/env python2.7
+
+"""Time budgets for each poll, shared by every network operation made during it.
+
+A poll runs inside
+
+    with deadline.scope(Deadline(30)):
+        ...
+
+and the code making requests asks `deadline.timeout('connect')` for the socket
+timeout to use, so a router or DDNS provider which hangs can never hold a worker
+thread or connection for longer than the poll's budget. Once the budget has run
+out `DeadlineExceeded` is raised, naming the phase which was in progress.
+"""
+
+import time
+import socket
+import threading
+import contextlib
+
+# Longest wait for a connection to open, so a router which is down is given up on
+# quickly and the rest of the budget is left for the push
+CONNECT_TIMEOUT = 5
+
+# Share of a poll's budget the fetch may use, keeping the rest for the push
+FETCH_SHARE = 0.5
+
+_local = threading.local()
+
+
+class DeadlineExceeded(Exception):
+	"""The budget of a `Deadline` ran out during `phase`, such as 'connect' or 'read'."""
+
+	def __init__(self, phase, budget):
+		Exception.__init__(self, 'Ran out of time during {phase} ({budget:g}s budget)'.format(
+				phase=phase, budget=budget))
+		self.phase = phase
+		self.budget = budget
+
+
+class Deadline(object):
+	"""A budget of `budget` seconds, starting now."""
+
+	def __init__(self, budget, clock=time.time):
+		self.budget = budget
+		self.clock = clock
+		self.expires = clock() + budget
+		# the phase most recently given a timeout
+		self.phase = None
+
+	def remaining(self):
+		return self.expires - self.clock()
+
+	def timeout(self, phase, cap=None):
+		"""Start `phase` and return the seconds left for it, no more than `cap`.
+		Raises `DeadlineExceeded` if there are none.
+		"""
+
+		self.phase = phase
+		left = self.remaining()
+		if left <= 0:
+			raise DeadlineExceeded(phase, self.budget)
+
+		return left if cap is None else min(left, cap)
+
+	def part(self, share):
+		"""Return a `Deadline` for part of the work, using no more than `share` of the
+		budget and ending no later than this one.
+		"""
+
+		part = Deadline(self.budget * share, self.clock)
+		part.expires = min(part.expires, self.expires)
+		return part
+
+
+def current():
+	"""Return the `Deadline` of the poll running on this thread, or None."""
+	return getattr(_local, 'deadline', None)
+
+
+@contextlib.contextmanager
+def scope(deadline):
+	"""Make `deadline`, which may be None for no limit, the current thread's deadline
+	for the duration of the block.
+	"""
+
+	previous = current()
+	_local.deadline = deadline
+	try:
+		yield deadline
+	finally:
+		_local.deadline = previous
+
+
+def timeout(phase, cap=None):
+	"""Return the timeout for `phase` under the current deadline, at most `cap`, or
+	`cap` if there is no deadline.
+	"""
+
+	deadline = current()
+	if deadline is None:
+		return cap
+
+	return deadline.timeout(phase, cap)
+
+
+def check_timeout(error):
+	"""Raise `DeadlineExceeded` in place of `error`, a socket error, if it was a
+	timeout caused by the current deadline running out.
+	"""
+
+	deadline = current()
+	if deadline is None:
+		return
+
+	# urllib2 wraps socket errors in URLError
+	timed_out = isinstance(getattr(error, 'reason', error), socket.timeout)
+	if timed_out and deadline.remaining() <= 0.01:
+		raise DeadlineExceeded(deadline.phase, deadline.budget)
+
+
+def find_socket(response):
+	"""Return the socket under a urllib2 or httplib `response`, or None. urllib2
+	wraps the `httplib.HTTPResponse` in file objects, which hold it as `fp` or
+	`_sock`, and the response holds the socket the same way.
+	"""
+
+	obj = response
+	for _ in xrange(6):
+		# file objects made by makefile() hold the bare `_socket.socket`
+		if isinstance(obj, (socket.socket, socket._socket.socket)):
+			return obj
+
+		obj = getattr(obj, 'fp', None) or getattr(obj, '_sock', None)
+		if obj is None:
+			return None
+
+	return None
+
+
+class Watchdog(object):
+	"""Shut `sock` down once the current deadline runs out. A socket timeout only
+	limits each recv(), so it catches a server which stops sending but not one
+	which sends a byte at a time; the watchdog ends that read too, after which
+	`check()` raises `DeadlineExceeded`. Does nothing if there is no deadline.
+	"""
+
+	def __init__(self, sock, phase='read'):
+		self.deadline = current()
+		self.phase = phase
+		self.expired = False
+		self._timer = None
+		if self.deadline is not None and sock is not None:
+			self._timer = threading.Timer(self.deadline.timeout(phase), self._expire, (sock,))
+			self._timer.daemon = True
+			self._timer.start()
+
+	def _expire(self, sock):
+		self.expired = True
+		try:
+			sock.shutdown(socket.SHUT_RDWR)
+		except socket.error:
+			pass
+
+	def check(self):
+		if self.expired:
+			raise DeadlineExceeded(self.phase, self.deadline.budget)
+
+	def cancel(self):
+		if self._timer is not None:
+			self._timer.cancel()
+			self._timer = None
+
+
+class GuardedResponse(object):
+	"""A urllib2 response whose body must be read before the current deadline runs
+	out, as `ddnsupdater.pool.PooledResponse` does for pooled connections. Other
+	attributes, such as `code` and `headers`, are those of the response.
+	"""
+
+	def __init__(self, response, phase='read'):
+		self.response = response
+		self.watchdog = Watchdog(find_socket(response), phase)
+
+	def __getattr__(self, name):
+		return getattr(self.response, name)
+
+	def _call(self, function, *args):
+		try:
+			data = function(*args)
+		except Exception as e:
+			self.watchdog.check()
+			check_timeout(e)
+			raise
+
+		self.watchdog.check()
+		return data
+
+	def read(self, amt=-1):
+		return self._call(self.response.read, amt)
+
+	def readline(self):
+		return self._call(self.response.readline)
+
+	def __iter__(self):
+		while True:
+			line = self.readline()
+			if line == '':
+				return
+
+			yield line
+
+	def close(self):
+		self.watchdog.cancel()
+		self.response.close()
+
+
+def guard(response, phase='read'):
+	"""Return `response`, from urllib2, wrapped in a `GuardedResponse` if there is
+	a current deadline.
+	"""
+
+	return response if current() is None else GuardedResponse(response, phase)
@@ -0,0 +1,403 @@
+#!/usr/bin/env python2.7
+
+"""Build and send RFC 2136 DNS UPDATE messages, optionally signed with TSIG
+(RFC 8945)
+"""
+
+import time
+import hmac
+import base64
+import socket
+import struct
+import random
+import hashlib
+import threading
+
+from ddnsupdater import deadline
+
+OPCODE_UPDATE = 5
+CLASS_IN = 1
+CLASS_ANY = 255
+TYPE_A = 1
+TYPE_SOA = 6
+TYPE_AAAA = 28
+TYPE_TSIG = 250
+FLAG_TC = 0x0200
+
+# Largest message sent over UDP before switching to TCP, as no EDNS is used
+MAX_UDP_SIZE = 512
+
+RCODES = {
+	0: 'NOERROR',
+	1: 'FORMERR',
+	2: 'SERVFAIL',
+	3: 'NXDOMAIN',
+	4: 'NOTIMP',
+	5: 'REFUSED',
+	6: 'YXDOMAIN',
+	7: 'YXRRSET',
+	8: 'NXRRSET',
+	9: 'NOTAUTH',
+	10: 'NOTZONE',
+	16: 'BADSIG',
+	17: 'BADKEY',
+	18: 'BADTIME',
+	}
+
+TSIG_ALGORITHMS = {
+	'hmac-md5': ('hmac-md5.sig-alg.reg.int', hashlib.md5),
+	'hmac-sha1': ('hmac-sha1', hashlib.sha1),
+	'hmac-sha256': ('hmac-sha256', hashlib.sha256),
+	'hmac-sha512': ('hmac-sha512', hashlib.sha512),
+	}
+
+HEADER = struct.Struct('!HHHHHH')
+RR_FIXED = struct.Struct('!HHLH')
+
+
+class DNSError(Exception):
+	"""Raised when a response cannot be read or fails TSIG verification."""
+
+
+def encode_name(name):
+	"""Encode a domain name as a sequence of length-prefixed labels."""
+	labels = [label for label in name.rstrip('.').split('.') if label != '']
+	for label in labels:
+		if len(label) > 63:
+			raise ValueError('DNS label too long in {name}'.format(name=name))
+
+	return ''.join(chr(len(label)) + label for label in labels) + '\0'
+
+
+def skip_name(message, offset):
+	"""Return the offset just past the possibly compressed name at `offset`."""
+	while True:
+		if offset >= len(message):
+			raise DNSError('Truncated name in DNS message')
+
+		length = ord(message[offset])
+		if length & 0xc0 == 0xc0:
+			return offset + 2
+
+		offset += 1 + length
+		if length == 0:
+			return offset
+
+
+def absolute_name(name, zone):
+	"""Return `name` as a fully qualified name, treating it as relative to `zone`
+	unless it ends in a dot or already ends with the zone.
+	"""
+
+	zone = zone.rstrip('.')
+	if name.endswith('.'):
+		return name.rstrip('.')
+
+	if name == '@':
+		return zone
+
+	if name == zone or name.endswith('.' + zone):
+		return name
+
+	return '{name}.{zone}'.format(name=name, zone=zone)
+
+
+def update_message(zone, records, msg_id=None):
+	"""Build one UPDATE message which, for each (name, ip, ttl) in `records`,
+	replaces the A records of `name` in `zone` with `ip`, or the AAAA records if
+	`ip` is an IPv6 address. The server applies all of them or none.
+	"""
+
+	if msg_id is None:
+		msg_id = random.randint(0, 0xffff)
+
+	parts = [HEADER.pack(msg_id, OPCODE_UPDATE << 11, 1, 0, 2 * len(records), 0),
+			 encode_name(zone) + struct.pack('!HH', TYPE_SOA, CLASS_IN)]
+	for name, ip, ttl in records:
+		owner = encode_name(absolute_name(name, zone))
+		if ':' in ip:
+			rtype, rdata = TYPE_AAAA, socket.inet_pton(socket.AF_INET6, ip)
+
+		else:
+			rtype, rdata = TYPE_A, socket.inet_aton(ip)
+
+		# delete the existing RRset, then add the new address
+		parts.append(owner + RR_FIXED.pack(rtype, CLASS_ANY, 0, 0))
+		parts.append(owner + RR_FIXED.pack(rtype, CLASS_IN, ttl, len(rdata)) + rdata)
+
+	return ''.join(parts)
+
+
+class TSIGKey(object):
+	"""A shared secret for signing messages.
+
+	name
+	    Key name as configured on the server
+
+	secret
+	    The base64 encoded secret
+
+	algorithm
+	    One of the names in `TSIG_ALGORITHMS`
+
+	"""
+
+	fudge = 300
+
+	def __init__(self, name, secret, algorithm='hmac-sha256'):
+		if algorithm not in TSIG_ALGORITHMS:
+			raise ValueError('Unknown TSIG algorithm {name}. Choose from: {names}'.format(
+					name=algorithm, names=', '.join(sorted(TSIG_ALGORITHMS))))
+
+		self.name = name.lower().rstrip('.')
+		# a '+' in a secret given in a URL query may have been decoded to a space
+		self.secret = base64.b64decode(secret.replace(' ', '+'))
+		self.algorithm_name, self.digest = TSIG_ALGORITHMS[algorithm]
+
+	def _variables(self, time_signed, fudge, error=0, other=''):
+		return (encode_name(self.name) + struct.pack('!HL', CLASS_ANY, 0) +
+				encode_name(self.algorithm_name) + self._times(time_signed, fudge) +
+				struct.pack('!HH', error, len(other)) + other)
+
+	def _times(self, time_signed, fudge):
+		return struct.pack('!HLH', time_signed >> 32, time_signed & 0xffffffff, fudge)
+
+	def mac(self, message, time_signed, fudge, request_mac=None, error=0, other=''):
+		"""Compute the MAC of an unsigned `message`. A response's MAC also covers the
+		`request_mac` of the request it answers.
+		"""
+
+		signer = hmac.new(self.secret, digestmod=self.digest)
+		if request_mac is not None:
+			signer.update(struct.pack('!H', len(request_mac)) + request_mac)
+
+		signer.update(message)
+		signer.update(self._variables(time_signed, fudge, error, other))
+		return signer.digest()
+
+	def sign(self, message, request_mac=None, time_signed=None, error=0):
+		"""Append a TSIG record to `message`. Returns the signed message and its MAC."""
+		if time_signed is None:
+			time_signed = int(time.time())
+
+		msg_id = HEADER.unpack_from(message)[0]
+		mac = self.mac(message, time_signed, self.fudge, request_mac, error)
+		rdata = (encode_name(self.algorithm_name) + self._times(time_signed, self.fudge) +
+				 struct.pack('!H', len(mac)) + mac + struct.pack('!HHH', msg_id, error, 0))
+		record = (encode_name(self.name) + RR_FIXED.pack(TYPE_TSIG, CLASS_ANY, 0, len(rdata)) +
+				  rdata)
+		arcount = struct.unpack_from('!H', message, 10)[0]
+		signed = message[:10] + struct.pack('!H', arcount + 1) + message[12:] + record
+		return signed, mac
+
+	def verify(self, message, request_mac=None):
+		"""Check the TSIG record ending `message`, raising `DNSError` if it is
+		missing or wrong. Returns the message's MAC.
+		"""
+
+		offset, arcount = find_last_record(message)
+		record_start = offset
+		offset = skip_name(message, offset)
+		rr_type, _, _, _ = RR_FIXED.unpack_from(message, offset)
+		if rr_type != TYPE_TSIG:
+			raise DNSError('Response is not signed')
+
+		offset = skip_name(message, offset + RR_FIXED.size)
+		time_high, time_low, fudge, mac_size = struct.unpack_from('!HLHH', message, offset)
+		offset += 10
+		mac = message[offset:offset + mac_size]
+		original_id, error, other_size = struct.unpack_from('!HHH', message, offset + mac_size)
+		other = message[offset + mac_size + 6:offset + mac_size + 6 + other_size]
+		time_signed = (time_high << 32) + time_low
+
+		if error != 0:
+			raise DNSError('Server rejected signature: {rcode}'.format(
+					rcode=RCODES.get(error, error)))
+
+		unsigned = (struct.pack('!H', original_id) + message[2:10] +
+					struct.pack('!H', arcount - 1) + message[12:record_start])
+		expected = self.mac(unsigned, time_signed, fudge, request_mac, error, other)
+		if not hmac.compare_digest(mac, expected):
+			raise DNSError('Bad TSIG signature on response')
+
+		if abs(time.time() - time_signed) > fudge:
+			raise DNSError('TSIG time outside the allowed fudge')
+
+		return mac
+
+
+def find_last_record(message):
+	"""Return the offset of the last resource record in `message` and the
+	message's additional record count.
+	"""
+
+	if len(message) < HEADER.size:
+		raise DNSError('Short DNS response')
+
+	_, _, qdcount, ancount, nscount, arcount = HEADER.unpack_from(message)
+	if arcount == 0:
+		raise DNSError('Response is not signed')
+
+	offset = HEADER.size
+	for _ in xrange(qdcount):
+		offset = skip_name(message, offset) + 4
+
+	last = None
+	for _ in xrange(ancount + nscount + arcount):
+		last = offset
+		offset = skip_name(message, offset)
+		_, _, _, rdlength = RR_FIXED.unpack_from(message, offset)
+		offset += RR_FIXED.size + rdlength
+
+	return last, arcount
+
+
+def response_code(message, msg_id):
+	"""Return the RCODE name from a response to the message with ID `msg_id`."""
+	if len(message) < HEADER.size:
+		raise DNSError('Short DNS response')
+
+	reply_id, flags, _, _, _, _ = HEADER.unpack_from(message)
+	if reply_id != msg_id:
+		raise DNSError('DNS response ID {got} does not match request {sent}'.format(
+				got=reply_id, sent=msg_id))
+
+	rcode = flags & 0xf
+	return RCODES.get(rcode, str(rcode))
+
+
+class UpdateClient(object):
+	"""Send UPDATE messages to one name server, keeping its UDP socket, and a TCP
+	connection once one has been needed, open for reuse.
+	Messages too large for UDP, or whose UDP reply is truncated, go over TCP.
+	Each of the two is given up to `timeout` seconds, and no longer than the
+	current `ddnsupdater.deadline.Deadline` allows.
+	Safe to share between threads; messages are sent one at a time.
+	"""
+
+	def __init__(self, server, port=53, key=None, timeout=5):
+		self.server = server
+		self.port = port
+		self.key = key
+		self.timeout = timeout
+		self.sent = 0
+		self._udp = None
+		self._tcp = None
+		self._lock = threading.Lock()
+
+	def close(self):
+		with self._lock:
+			for sock in (self._udp, self._tcp):
+				if sock is not None:
+					sock.close()
+
+			self._udp = self._tcp = None
+
+	def _wait(self, end):
+		"""Return the socket timeout for the next wait of an exchange which must be
+		over by `end`.
+		"""
+
+		left = end - time.time()
+		if left <= 0:
+			raise socket.timeout('timed out')
+
+		return deadline.timeout('push', left)
+
+	def _send_udp(self, message, msg_id):
+		end = time.time() + self.timeout
+		if self._udp is None:
+			self._udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+			self._udp.connect((self.server, self.port))
+
+		self._udp.settimeout(self._wait(end))
+		self._udp.send(message)
+		while True:
+			self._udp.settimeout(self._wait(end))
+			reply = self._udp.recv(65535)
+			# ignore late replies to earlier messages which timed out
+			if len(reply) >= 2 and struct.unpack_from('!H', reply)[0] == msg_id:
+				return reply
+
+	def _recv_exactly(self, size, end):
+		data = ''
+		while len(data) < size:
+			self._tcp.settimeout(self._wait(end))
+			chunk = self._tcp.recv(size - len(data))
+			if chunk == '':
+				raise DNSError('Name server closed the connection')
+
+			data += chunk
+
+		return data
+
+	def _send_tcp(self, message, end=None, retry=True):
+		if end is None:
+			end = time.time() + self.timeout
+
+		if self._tcp is None:
+			self._tcp = socket.create_connection((self.server, self.port), self._wait(end))
+
+		try:
+			self._tcp.settimeout(self._wait(end))
+			self._tcp.sendall(struct.pack('!H', len(message)) + message)
+			size = struct.unpack('!H', self._recv_exactly(2, end))[0]
+			return self._recv_exactly(size, end)
+
+		except (socket.timeout, deadline.DeadlineExceeded):
+			# part of a reply may be left unread
+			self._tcp.close()
+			self._tcp = None
+			raise
+
+		except (socket.error, DNSError):
+			self._tcp.close()
+			self._tcp = None
+			if not retry:
+				raise
+
+			# the server may have closed an idle connection
+			return self._send_tcp(message, end, retry=False)
+
+	def send(self, message):
+		"""Sign `message` if there is a key, send it and return the RCODE name of the
+		reply.
+		"""
+
+		msg_id = HEADER.unpack_from(message)[0]
+		request_mac = None
+		if self.key is not None:
+			message, request_mac = self.key.sign(message)
+
+		with self._lock:
+			self.sent += 1
+			try:
+				reply = None
+				if len(message) <= MAX_UDP_SIZE:
+					reply = self._send_udp(message, msg_id)
+
+				if reply is None or HEADER.unpack_from(reply)[1] & FLAG_TC:
+					reply = self._send_tcp(message)
+
+			except socket.timeout as e:
+				deadline.check_timeout(e)
+				raise DNSError('No reply from {server}'.format(server=self.server))
+
+		rcode = response_code(reply, msg_id)
+		if self.key is not None and rcode not in ('NOTAUTH', 'FORMERR'):
+			# a server which could not check our signature replies unsigned
+			self.key.verify(reply, request_mac)
+
+		return rcode
+
+
+def send_update(server, port, message, timeout=5, key=None):
+	"""Send `message` to `server` with a one-off client and return the RCODE name of
+	the reply.
+	"""
+
+	client = UpdateClient(server, port, key, timeout)
+	try:
+		return client.send(message)
+	finally:
+		client.close()
@@ -0,0 +1,350 @@
+#!/usr/bin/env python2.7
+
+"""Poll many fetch/push targets concurrently from a single process"""
+
+import time
+import heapq
+import Queue
+import logging
+import threading
+
+from ddnsupdater import trace
+from ddnsupdater import address
+from ddnsupdater import deadline
+from ddnsupdater.deadline import Deadline, DeadlineExceeded
+from ddnsupdater.push import Deferred
+from ddnsupdater.schedule import Schedule
+
+
+class Target(object):
+	"""One source of an external IP address paired with the DDNS entry it updates.
+
+	name
+	    Label used in log messages
+
+	fetch
+	    Callable taking no arguments which returns the current external IP, or
+		several addresses as described in `ddnsupdater.address`
+
+	push
+	    Callable taking the new IP which updates the DDNS entry. It may return
+		False if there was nothing to send, e.g. a `ddnsupdater.push.Pusher` whose
+		records all hold the address already.
+
+	period
+	    Seconds between polls of this target
+
+	schedule
+	    Optional `ddnsupdater.schedule.Schedule` to adjust the time between polls
+		after failures and changes. Defaults to one with the standard settings.
+
+	"""
+
+	def __init__(self, name, fetch, push, period, last_ip=None, schedule=None):
+		self.name = name
+		self.fetch = fetch
+		self.push = push
+		self.period = period
+		self.last_ip = last_ip
+		self.schedule = schedule if schedule is not None else Schedule(period)
+		# time of the next check, or None if none is queued
+		self.next_check = None
+		# set while a worker is checking the target, which is then never queued
+		self.in_progress = False
+		# check again as soon as the check in progress finishes
+		self.woken = False
+		# set once the target has been removed from its engine
+		self.retired = False
+		# seconds until the push held back by the last check should be retried
+		self.retry_after = None
+
+	def __repr__(self):
+		return 'Target({name})'.format(name=self.name)
+
+
+class Engine(object):
+	"""Run the `poll()` loop for many targets at once.
+
+	A single scheduler thread hands targets to a fixed pool of `max_in_flight`
+	worker threads as they fall due, so no more than `max_in_flight` fetch or push
+	requests are ever outstanding. Each target keeps its own `period`.
+
+	>>> engine = Engine([Target('home', fetch, push, 600),
+						 Target('office', fetch2, push2, 60)],
+						max_in_flight=8)
+	>>> engine.run()
+
+	If a `ddnsupdater.state.StateStore` is given as `state`, each target's last
+	pushed address is loaded from it and saved to it. Timings and failures are
+	recorded in `metrics`, a `ddnsupdater.metrics.PollMetrics`, if one is given.
+
+	Each check, fetch and push together, is given `timeout` seconds, of which the
+	fetch may use `ddnsupdater.deadline.FETCH_SHARE`, so one router or provider
+	which hangs holds a worker thread and connection for no longer than that.
+
+	`clock` can be replaced for testing.
+
+	"""
+
+	def __init__(self, targets, max_in_flight=16, state=None, metrics=None, timeout=None,
+				 clock=time.time):
+		if max_in_flight < 1:
+			raise ValueError('max_in_flight must be at least 1')
+
+		self.targets = list(targets)
+		self.max_in_flight = max_in_flight
+		self.state = state
+		self.metrics = metrics
+		self.timeout = timeout
+		self.clock = clock
+		for target in self.targets:
+			self._restore(target)
+
+		self.checks = 0
+		self._due = []
+		self._seq = 0
+		self._work = Queue.Queue()
+		self._cond = threading.Condition()
+		self._running = False
+		self._workers = []
+
+	def _restore(self, target):
+		# pick up where the last run left off
+		if self.state is not None and target.last_ip is None:
+			saved = self.state.target(target.name)
+			if saved is not None:
+				target.last_ip = saved.ip
+
+	def schedule(self, target, when):
+		"""Arrange for `target` to be checked at time `when`. A target which is being
+		checked is not queued a second time, but checked again as soon as it finishes.
+		"""
+
+		with self._cond:
+			if target.retired:
+				return
+
+			if target.in_progress:
+				target.woken = True
+				return
+
+			if target.next_check is not None and target.next_check <= when:
+				return
+
+			target.next_check = when
+			self._seq += 1
+			heapq.heappush(self._due, (when, self._seq, target))
+			self._cond.notify()
+
+	def wake(self, targets=None):
+		"""Check `targets`, or every target, now instead of waiting for their next poll.
+		A target already being checked is checked again as soon as it finishes.
+		Shared fetches are invalidated so the checks read the address afresh.
+		"""
+
+		if targets is None:
+			targets = self.targets
+
+		for fetch in set(target.fetch for target in targets):
+			invalidate = getattr(fetch, 'invalidate', None)
+			if invalidate is not None:
+				invalidate()
+
+		now = self.clock()
+		with self._cond:
+			for target in targets:
+				self.schedule(target, now)
+
+	def replace(self, targets):
+		"""Swap the engine's targets for `targets`, e.g. after the configuration has
+		been reloaded. Targets in both the old and new lists carry on undisturbed, new
+		ones are checked straight away and the rest are never checked again, although
+		a check already in progress is allowed to finish.
+		"""
+
+		targets = list(targets)
+		with self._cond:
+			keep = set(id(t) for t in targets)
+			old = set(id(t) for t in self.targets)
+			for target in self.targets:
+				if id(target) not in keep:
+					target.retired = True
+
+			for target in targets:
+				if id(target) not in old:
+					self._restore(target)
+
+			self.targets = targets
+			if not self._running:
+				return
+
+		now = self.clock()
+		for target in targets:
+			if id(target) not in old:
+				self.schedule(target, now)
+
+	def watch(self, events):
+		"""Wake targets when `events`, an `ddnsupdater.events.EventSource`, reports
+		a change. Events naming a target wake just that target.
+		"""
+
+		def woken(name):
+			if name is None:
+				self.wake()
+
+			else:
+				self.wake([t for t in self.targets if t.name == name])
+
+		events.subscribe(woken)
+
+	def fetched(self, source, ip):
+		"""Check every idle target which fetches from `source` now. Called when a
+		`ddnsupdater.shared.SharedFetch` makes a fresh fetch, so its result is pushed to
+		every target sharing it, and their polls fall back into step instead of each
+		fetching again later.
+		"""
+
+		now = self.clock()
+		with self._cond:
+			for target in self.targets:
+				# one being checked is fetching already, so is not woken
+				if target.fetch is source and not target.in_progress:
+					self.schedule(target, now)
+
+	def check(self, target):
+		"""Fetch the current IP for `target` and push it if it has changed.
+		Errors are logged rather than raised so one broken target cannot stop the others.
+		Returns a tuple of whether the check succeeded and whether the IP changed.
+		"""
+
+		changed = False
+		stage = 'fetch'
+		start = self.clock()
+		budget = fetch_budget = None
+		if self.timeout is not None:
+			budget = Deadline(self.timeout)
+			fetch_budget = budget.part(deadline.FETCH_SHARE)
+
+		try:
+			with trace.span('fetch', target=target.name), deadline.scope(fetch_budget):
+				ip = address.normalise(target.fetch())
+
+			if self.metrics is not None:
+				self.metrics.fetched(target.name, self.clock() - start)
+
+			logging.info('{name}: current external address is {ip}'.format(
+					name=target.name, ip=ip))
+			if ip != target.last_ip:
+				logging.info('{name}: external IP changed, updating DDNS server'.format(
+						name=target.name))
+				changed = True
+				stage = 'push'
+				start = self.clock()
+				try:
+					with trace.span('push', target=target.name), deadline.scope(budget):
+						pushed = target.push(ip)
+
+				except Deferred as e:
+					# nothing failed, but the address is not fully pushed yet
+					logging.info('{name}: {err}'.format(name=target.name, err=e))
+					target.retry_after = e.delay
+					return True, changed
+
+				if self.metrics is not None and pushed is not False:
+					self.metrics.pushed(target.name, self.clock() - start)
+
+				target.last_ip = ip
+
+			if self.state is not None:
+				self.state.checked(target.name, ip)
+
+		except Exception as e:
+			if isinstance(e, DeadlineExceeded):
+				# nothing unexpected, so no traceback
+				logging.error('{name}: poll failed, {stage} {err}'.format(
+						name=target.name, stage=stage, err=e))
+
+			else:
+				logging.exception('{name}: poll failed'.format(name=target.name))
+
+			if self.metrics is not None:
+				self.metrics.failed(target.name, stage, self.clock() - start, e)
+
+			return False, changed
+
+		finally:
+			with self._cond:
+				self.checks += 1
+
+		return True, changed
+
+	def _worker(self):
+		while True:
+			target = self._work.get()
+			if target is None:
+				return
+
+			ok, changed = self.check(target)
+			delay = target.schedule.next_delay(ok, changed)
+			if target.retry_after is not None:
+				delay = min(delay, target.retry_after)
+				target.retry_after = None
+
+			with self._cond:
+				target.in_progress = False
+				woken, target.woken = target.woken, False
+				if self._running:
+					self.schedule(target, self.clock() + (0 if woken else delay))
+
+	def start(self):
+		"""Start the worker threads and queue every target for an immediate check."""
+		self._running = True
+		for _ in xrange(self.max_in_flight):
+			thread = threading.Thread(target=self._worker, name='ddns-worker')
+			thread.daemon = True
+			thread.start()
+			self._workers.append(thread)
+
+		now = self.clock()
+		for target in self.targets:
+			self.schedule(target, now)
+
+	def stop(self):
+		"""Ask `run()` to return and shut down the worker threads."""
+		with self._cond:
+			self._running = False
+			self._cond.notify()
+
+	def _dispatch(self, now):
+		"""Hand every target due by `now` to the workers. Returns the seconds until
+		the next one is due, or None if none is queued.
+		"""
+
+		with self._cond:
+			while self._due and self._due[0][0] <= now:
+				when, _, target = heapq.heappop(self._due)
+				# skip entries superseded by an earlier wake(), and removed targets
+				if when == target.next_check and not target.retired:
+					target.next_check = None
+					target.in_progress = True
+					self._work.put(target)
+
+			return self._due[0][0] - now if self._due else None
+
+	def run(self):
+		"""Dispatch targets to the workers as they fall due until `stop()` is called."""
+		if not self._running:
+			self.start()
+
+		with self._cond:
+			while self._running:
+				wait = self._dispatch(self.clock())
+				self._cond.wait(wait if wait is not None else 1)
+
+		for _ in self._workers:
+			self._work.put(None)
+
+		for thread in self._workers:
+			thread.join()
+
+		self._workers = []
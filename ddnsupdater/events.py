@@ -0,0 +1,184 @@
+#!/usr/bin/env python2.7
+
+"""Notifications that the external IP address may have changed, so it can be
+checked straight away instead of waiting for the next timed poll.
+"""
+
+import socket
+import struct
+import logging
+import threading
+import BaseHTTPServer
+
+# from linux/rtnetlink.h
+RTMGRP_IPV4_IFADDR = 0x10
+RTMGRP_IPV6_IFADDR = 0x100
+RTM_NEWADDR = 20
+RTM_DELADDR = 21
+
+NLMSG_HEADER = struct.Struct('=LHHLL')
+IFADDRMSG = struct.Struct('=BBBBL')
+
+
+class EventSource(object):
+	"""Base class for change notifications. Calling `trigger()` directly makes
+	this a simulated event source for testing.
+
+	`wait()` suits a single polling loop; `subscribe()` registers a callback
+	which is given the name of the affected target, or None for all of them.
+	"""
+
+	def __init__(self):
+		self._event = threading.Event()
+		self._callbacks = []
+		self.count = 0
+
+	def subscribe(self, callback):
+		self._callbacks.append(callback)
+
+	def trigger(self, name=None):
+		"""Report a possible address change."""
+		self.count += 1
+		self._event.set()
+		for callback in self._callbacks:
+			callback(name)
+
+	def wait(self, timeout):
+		"""Block until an event arrives or `timeout` seconds pass.
+		Returns True if woken by an event.
+		"""
+
+		fired = self._event.wait(timeout)
+		self._event.clear()
+		return fired
+
+	def start(self):
+		"""Start listening for events."""
+		return self
+
+	def close(self):
+		pass
+
+
+class NetlinkEvents(EventSource):
+	"""Listen for the kernel adding or removing addresses on `interface`, or on
+	any interface if None.
+	"""
+
+	def __init__(self, interface=None):
+		EventSource.__init__(self)
+		self.interface = interface
+		self._sock = None
+
+	def start(self):
+		self._sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+		self._sock.bind((0, RTMGRP_IPV4_IFADDR | RTMGRP_IPV6_IFADDR))
+		thread = threading.Thread(target=self._listen, name='ddns-netlink')
+		thread.daemon = True
+		thread.start()
+		return self
+
+	def close(self):
+		if self._sock is not None:
+			self._sock.close()
+			self._sock = None
+
+	def _index(self):
+		"""Return the index of the interface being watched, or None if it does not
+		exist, e.g. ppp0 while the link is down.
+		"""
+
+		try:
+			with open('/sys/class/net/{name}/ifindex'.format(name=self.interface)) as h:
+				return int(h.read())
+
+		except (IOError, ValueError):
+			return None
+
+	def _listen(self):
+		while self._sock is not None:
+			try:
+				data = self._sock.recv(65536)
+			except socket.error:
+				return
+
+			try:
+				if self.changed(data):
+					logging.debug('Address change reported by the kernel')
+					self.trigger()
+
+			except Exception:
+				# keep listening, or no event would ever wake a poll again
+				logging.exception('Failed to handle a netlink message')
+
+	def changed(self, data):
+		"""Return whether the netlink messages in `data` add or remove an address on
+		the interface being watched. If the interface has gone, any address change
+		counts, as it is most likely the interface's own.
+		"""
+
+		index = self._index() if self.interface is not None else None
+		if self.interface is not None and index is None:
+			logging.debug('Interface {name} not found'.format(name=self.interface))
+
+		offset = 0
+		while offset + NLMSG_HEADER.size <= len(data):
+			length, msg_type, _, _, _ = NLMSG_HEADER.unpack_from(data, offset)
+			if length < NLMSG_HEADER.size:
+				break
+
+			if msg_type in (RTM_NEWADDR, RTM_DELADDR):
+				if index is None:
+					return True
+
+				_, _, _, _, msg_index = IFADDRMSG.unpack_from(data, offset + NLMSG_HEADER.size)
+				if msg_index == index:
+					return True
+
+			# messages are padded to 4 byte boundaries
+			offset += (length + 3) & ~3
+
+		return False
+
+
+class HookEvents(EventSource):
+	"""Accept HTTP requests from a router's reconnect hook on `port` of `address`.
+	A request for / triggers every target, and one for /NAME the target called
+	NAME. There is no authentication, so by default only local clients are served;
+	give an `address` of '' to accept requests from anywhere.
+	"""
+
+	def __init__(self, port, address='127.0.0.1'):
+		EventSource.__init__(self)
+		self.port = port
+		self.address = address
+		self._server = None
+
+	def start(self):
+		events = self
+
+		class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+			def log_message(self, *args):
+				pass
+
+			def do_GET(self):
+				name = self.path.strip('/') or None
+				logging.debug('Address change reported by {client}'.format(
+						client=self.client_address[0]))
+				self.send_response(204)
+				self.end_headers()
+				events.trigger(name)
+
+			do_POST = do_GET
+
+		self._server = BaseHTTPServer.HTTPServer((self.address, self.port), Handler)
+		thread = threading.Thread(target=self._server.serve_forever, name='ddns-hook')
+		thread.daemon = True
+		thread.start()
+		return self
+
+	def close(self):
+		if self._server is not None:
+			self._server.shutdown()
+			self._server.server_close()
+			self._server = None
@@ -0,0 +1,139 @@
+#!/usr/bin/env python2.7
+
+"""Check every target's address once, in parallel, for `--one-shot` runs such as
+health checks from cron.
+"""
+
+import json
+import time
+import Queue
+import socket
+import threading
+import collections
+
+from ddnsupdater import address
+from ddnsupdater import deadline
+from ddnsupdater.deadline import Deadline, DeadlineExceeded
+
+OK = 'ok'
+ERROR = 'error'
+TIMEOUT = 'timeout'
+
+# Exit codes, following the Nagios plugin convention
+EXIT_OK = 0
+EXIT_SOME_FAILED = 1
+EXIT_ALL_FAILED = 2
+
+CheckResult = collections.namedtuple('CheckResult', 'name status ip seconds error')
+
+
+def check_one(name, fetch, clock=time.time, timeout=None):
+	"""Call `fetch` within a `ddnsupdater.deadline.Deadline` of `timeout` seconds
+	and return its `CheckResult`.
+	"""
+
+	start = clock()
+	try:
+		with deadline.scope(Deadline(timeout) if timeout is not None else None):
+			ip = address.normalise(fetch())
+
+	except Exception as e:
+		# urllib2 wraps socket errors in URLError
+		timed_out = (isinstance(e, DeadlineExceeded)
+					 or isinstance(getattr(e, 'reason', e), socket.timeout))
+		return CheckResult(name, TIMEOUT if timed_out else ERROR, None, clock() - start,
+						   str(e) or e.__class__.__name__)
+
+	return CheckResult(name, OK, ip, clock() - start, None)
+
+
+def check_all(fetches, max_workers=16, timeout=10, clock=time.time):
+	"""Call every fetch function in `fetches`, a list of (name, function) pairs,
+	with no more than `max_workers` at once, and return a `CheckResult` for each in
+	the same order. Each fetch has a deadline of `timeout` seconds, and one still
+	running a moment after that is reported as timed out and left to finish on its
+	own, so one dead router cannot hold up the rest.
+	"""
+
+	results = [None] * len(fetches)
+	work = Queue.Queue()
+	for item in enumerate(fetches):
+		work.put(item)
+
+	def worker():
+		while True:
+			try:
+				n, (name, fetch) = work.get_nowait()
+			except Queue.Empty:
+				return
+
+			found = []
+			start = clock()
+			thread = threading.Thread(
+					target=lambda: found.append(check_one(name, fetch, clock, timeout)),
+					name='ddns-check')
+			# abandoned if it times out
+			thread.daemon = True
+			thread.start()
+			# a little longer than the deadline, so it can report the phase itself
+			thread.join(timeout + 0.5)
+			if found:
+				results[n] = found[0]
+
+			else:
+				results[n] = CheckResult(name, TIMEOUT, None, clock() - start,
+										 'No answer after {timeout}s'.format(timeout=timeout))
+
+	workers = [threading.Thread(target=worker, name='ddns-checker')
+			   for _ in xrange(min(max_workers, len(fetches)))]
+	for thread in workers:
+		thread.start()
+
+	for thread in workers:
+		thread.join()
+
+	return results
+
+
+def exit_code(results):
+	"""Return `EXIT_OK` if every check in `results` succeeded, `EXIT_ALL_FAILED` if
+	none did, or else `EXIT_SOME_FAILED`.
+	"""
+
+	failed = sum(1 for result in results if result.status != OK)
+	if failed == 0:
+		return EXIT_OK
+
+	return EXIT_ALL_FAILED if failed == len(results) else EXIT_SOME_FAILED
+
+
+def format_table(results):
+	"""Return `results` as a text table, one line per target."""
+	width = max([len('TARGET')] + [len(result.name) for result in results])
+	lines = ['{name:<{width}}  {status:<7}  {ms:>8}  {ip}'.format(
+			name='TARGET', width=width, status='STATUS', ms='MS', ip='ADDRESS')]
+	for result in results:
+		lines.append('{name:<{width}}  {status:<7}  {ms:8.1f}  {ip}'.format(
+				name=result.name,
+				width=width,
+				status=result.status,
+				ms=result.seconds * 1000,
+				ip=result.ip if result.status == OK else result.error))
+
+	failed = sum(1 for result in results if result.status != OK)
+	lines.append('{ok} ok, {failed} failed'.format(ok=len(results) - failed, failed=failed))
+	return '\n'.join(lines) + '\n'
+
+
+def format_json(results):
+	"""Return `results` as a JSON document."""
+	failed = sum(1 for result in results if result.status != OK)
+	return json.dumps({
+			'ok': len(results) - failed,
+			'failed': failed,
+			'targets': [{'name': result.name,
+						 'status': result.status,
+						 'address': result.ip,
+						 'seconds': round(result.seconds, 6),
+						 'error': result.error} for result in results],
+			}, indent=2, sort_keys=True, separators=(',', ': ')) + '\n'
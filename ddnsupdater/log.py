@@ -1,47 +1,279 @@
 #!/usr/bin/env python2.7
 
-"""Initialise Python standard library logging module"""
+"""Initialise Python standard library logging module.
+
+Optionally records are handed to a background thread through a queue, so a slow
+disk never holds up a poll, and repeated lines such as the current address on every
+poll are suppressed.
+"""
 
 import os
+import time
+import Queue
+import atexit
 import logging
-import logging.config
-
-CONSOLE_LOGGING = {
-	'version': 1,
-		'disable_existing_loggers': True,
-		'formatters': {
-			'normal': {
-				'format': '%(asctime)s %(levelname)s %(message)s',
-				'datefmt': '%Y-%m-%d %H:%M:%S',
-				},
-			},
-		'handlers': {
-			'console': {  # 'level': 'DEBUG',
-						'class': 'logging.StreamHandler',
-						'formatter': 'normal',
-						},
-			},
-		'root': {
-				'level': 'DEBUG',
-				'handlers': ['console'],
-				},
-		}
-
-
-def init_log(config_filename=None):
-	"""Initialise log file"""
+import threading
+
+# Format of messages logged to the console when there is no logging config file
+CONSOLE_FORMAT = '%(asctime)s %(levelname)s %(message)s'
+CONSOLE_DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+EXCEPTION_FORMATTER = logging.Formatter()
+
+
+class DuplicateFilter(logging.Filter):
+	"""Let a message through once per `interval` seconds. The next copy after that
+	notes how many were suppressed in between. Only records below `max_level` are
+	filtered, so warnings and errors always get through.
+	"""
+
+	max_keys = 10000
+
+	def __init__(self, interval=300, max_level=logging.WARNING, clock=time.time):
+		logging.Filter.__init__(self)
+		self.interval = interval
+		self.max_level = max_level
+		self.clock = clock
+		self.suppressed = 0
+		self._seen = {}
+		self._lock = threading.Lock()
+
+	def filter(self, record):
+		if record.levelno >= self.max_level:
+			return True
+
+		key = (record.name, record.levelno, record.getMessage())
+		now = self.clock()
+		with self._lock:
+			first, repeats = self._seen.get(key, (None, 0))
+			if first is not None and now - first < self.interval:
+				self._seen[key] = (first, repeats + 1)
+				self.suppressed += 1
+				return False
+
+			if len(self._seen) >= self.max_keys:
+				self._seen.clear()
+
+			self._seen[key] = (now, 0)
+
+		if repeats > 0:
+			record.msg = '{message} (repeated {count} times)'.format(
+				message=record.getMessage(), count=repeats)
+			record.args = ()
+
+		return True
+
+
+class JSONFormatter(logging.Formatter):
+	"""Write each record as one JSON object per line."""
+
+	def format(self, record):
+		entry = {
+			'time': self.formatTime(record, self.datefmt),
+			'level': record.levelname,
+			'logger': record.name,
+			'thread': record.threadName,
+			'message': record.getMessage(),
+			}
+		if record.exc_info:
+			entry['exception'] = self.formatException(record.exc_info)
+
+		elif getattr(record, 'exc_text', None):
+			entry['exception'] = record.exc_text
+
+		# imported here so the json package is only loaded with --log-json
+		import json
+		return json.dumps(entry)
+
+
+class QueueHandler(logging.Handler):
+	"""Put records on `queue` for a `QueueListener` to write, as in Python 3's
+	logging.handlers. If the queue is full the record is dropped and counted rather
+	than blocking the caller.
+	"""
+
+	def __init__(self, queue):
+		logging.Handler.__init__(self)
+		self.queue = queue
+		self.dropped = 0
+
+	def emit(self, record):
+		# merge the arguments and render any traceback now, while they are still
+		# valid, and release the frames
+		try:
+			record.msg = record.getMessage()
+		except Exception:
+			# e.g. arguments which do not match the format
+			self.handleError(record)
+			return
+
+		record.args = ()
+		if record.exc_info:
+			record.exc_text = EXCEPTION_FORMATTER.formatException(record.exc_info)
+			record.exc_info = None
+
+		try:
+			self.queue.put_nowait(record)
+		except Queue.Full:
+			self.dropped += 1
+
+
+class QueueListener(object):
+	"""Write records from `queue` to `handlers` on a background thread. Records
+	are taken in batches of up to `batch_size`, and plain stream and file handlers
+	are flushed once per batch rather than once per record.
+	"""
+
+	def __init__(self, queue, handlers, batch_size=256):
+		self.queue = queue
+		self.handlers = list(handlers)
+		self.batch_size = batch_size
+		self.batches = 0
+		self._thread = None
+
+	def start(self):
+		self._thread = threading.Thread(target=self._run, name='ddns-log')
+		self._thread.daemon = True
+		self._thread.start()
+		return self
+
+	def stop(self):
+		"""Write everything queued so far and stop the thread."""
+		if self._thread is not None:
+			self.queue.put(None)
+			self._thread.join()
+			self._thread = None
+
+	def _run(self):
+		while True:
+			batch = [self.queue.get()]
+			while len(batch) < self.batch_size:
+				try:
+					batch.append(self.queue.get_nowait())
+				except Queue.Empty:
+					break
+
+			stop = None in batch
+			self.write([record for record in batch if record is not None])
+			if stop:
+				return
+
+	def write(self, records):
+		self.batches += 1
+		for handler in self.handlers:
+			# StreamHandler.emit() flushes after every record; write the batch, then
+			# flush once
+			unflushed = type(handler) in (logging.StreamHandler, logging.FileHandler)
+			handler.acquire()
+			try:
+				for record in records:
+					if record.levelno < handler.level or not handler.filter(record):
+						continue
+
+					if unflushed and handler.stream is not None:
+						try:
+							handler.stream.write(handler.format(record) + '\n')
+						except Exception:
+							handler.handleError(record)
+
+					else:
+						handler.emit(record)
+
+				if unflushed and handler.stream is not None:
+					handler.flush()
+
+			finally:
+				handler.release()
+
+
+# The QueueListener started by init_log(), if logging is queued
+listener = None
+
+
+def init_log(config_filename=None, queued=False, json_format=False, repeat_interval=None):
+	"""Initialise log file.
+
+	queued
+	    Write log records from a background thread, in batches
+
+	json_format
+	    Write each record as a JSON object
+
+	repeat_interval
+	    Show a repeated INFO or DEBUG message at most once per this many seconds
+
+	"""
+
+	global listener
 	if config_filename is None:
-		logging.config.dictConfig(CONSOLE_LOGGING)
+		# Set up by hand rather than with logging.config, which imports
+		# logging.handlers and the socket server modules on every startup
+		root = logging.getLogger()
+		for handler in list(root.handlers):
+			root.removeHandler(handler)
+
+		console = logging.StreamHandler()
+		console.setFormatter(logging.Formatter(CONSOLE_FORMAT, CONSOLE_DATE_FORMAT))
+		root.addHandler(console)
+		root.setLevel(logging.DEBUG)
 
 	else:
 		if not os.path.exists(config_filename):
 			raise IOError('Log config file {name} cannot be read'.format(
 					name=config_filename))
 
-		logging.config.fileConfig(config_filename)
+		from logging import config as logging_config
+		logging_config.fileConfig(config_filename)
 
 		# LOGGING['handlers']['file'] = {'class': 'logging.FileHandler',
 									   # 'filename': filename,
 									   # 'formatter': 'normal'}
 		# LOGGING['root']['handlers'] = ['file']
 
+	root = logging.getLogger()
+	handlers = list(root.handlers)
+	if json_format:
+		for handler in handlers:
+			handler.setFormatter(JSONFormatter(datefmt='%Y-%m-%dT%H:%M:%S'))
+
+	if queued:
+		queue = Queue.Queue(maxsize=10000)
+		listener = QueueListener(queue, handlers).start()
+		atexit.register(listener.stop)
+		for handler in handlers:
+			root.removeHandler(handler)
+
+		root.addHandler(QueueHandler(queue))
+
+	if repeat_interval:
+		# filter before queueing so suppressed records cost as little as possible
+		for handler in root.handlers:
+			handler.addFilter(DuplicateFilter(repeat_interval))
+
+
+def after_fork():
+	"""Set logging up again in a newly forked child process. Handler locks held by
+	other threads at the moment of the fork are replaced, and queued logging gets
+	its own queue and writer thread, as the parent's thread is not copied.
+	"""
+
+	global listener
+	root = logging.getLogger()
+	handlers = list(root.handlers)
+	if listener is not None:
+		handlers.extend(listener.handlers)
+
+	for handler in handlers:
+		handler.createLock()
+
+	if listener is None:
+		return
+
+	queue = Queue.Queue(maxsize=10000)
+	for handler in root.handlers:
+		if isinstance(handler, QueueHandler):
+			handler.queue = queue
+
+	listener = QueueListener(queue, listener.handlers).start()
+	atexit.register(listener.stop)
@@ -1,21 +1,59 @@
 #!/usr/bin/env python2.7
 
 import os
-import re
 import sys
 import time
+import signal
+import socket
 import urllib2
 import logging
 import argparse
 import functools
-import ConfigParser
-import xml.etree.ElementTree
-
+import threading
+
+from ddnsupdater import config
+from ddnsupdater import trace
+from ddnsupdater import address
+from ddnsupdater import log
+from ddnsupdater import deadline
+from ddnsupdater.deadline import Deadline, DeadlineExceeded
+from ddnsupdater.config import compile_match, split_urls
 from ddnsupdater.log import init_log
+from ddnsupdater.auth import default_openers
+from ddnsupdater.pool import ConnectionPool
+from ddnsupdater.push import Deferred, Pusher, PushRecord
+from ddnsupdater.providers import DRIVERS, find_driver
+from ddnsupdater.sources import find_source
+from ddnsupdater.engine import Engine, Target
+from ddnsupdater.shared import SharedFetches
+from ddnsupdater.pagecache import PageCache
+from ddnsupdater.profiles import PROFILES, make_extractor
+from ddnsupdater.ratelimit import RateLimiter
+from ddnsupdater.schedule import Schedule
 from ddnsupdater import __version__
 
+# Modules which only some settings need, and which bring in large parts of the
+# standard library, are imported where they are used so a small host does not
+# pay for them at startup: fleet (json) for --one-shot, state (sqlite3) for
+# --statefile and --statedb, events and metrics (BaseHTTPServer) for --events and
+# the metrics options, and supervisor (multiprocessing) for --workers. metrics,
+# log and trace likewise only import state and json when a setting needs them.
+
+# With --low-memory, for small embedded hosts: the stack reserved for each thread,
+# the most targets polled and records pushed at once, and the idle connections
+# kept open to each host
+LOW_MEMORY_STACK_SIZE = 256 * 1024
+LOW_MEMORY_IN_FLIGHT = 2
+LOW_MEMORY_PUSH_WORKERS = 2
+LOW_MEMORY_IDLE = 1
+
+# mallopt() parameter limiting the number of glibc malloc arenas, which otherwise
+# reserves up to 64MB of address space for each thread
+M_ARENA_MAX = -8
 
-def get_ip(user, password, url, search, skip, match):
+
+def get_ip(user, password, url, search, skip, match, pool=None, extra_rules=(), cache=None,
+		   extractor=None):
 	"""Find our the current external IP assigned by the ISP to our router.
 	We do this by retrieving a page from the router control site containing the IP.
 	Most routers require authentication before giving out this info.
@@ -40,6 +78,27 @@ def get_ip(user, password, url, search, skip, match):
 	    Regular expression containing a group which will pick out the IP address
 		from the line identified by `search` and `skip`
 
+	pool
+	    Optional `ddnsupdater.pool.ConnectionPool` used to keep the connection to the
+		router open between calls
+
+	extra_rules
+	    Further (search, skip, match) rules picking out more addresses from the same
+		page, such as the IPv6 address or delegated prefix. An address whose rule
+		finds nothing is left out.
+
+	cache
+	    Optional `ddnsupdater.pagecache.PageCache` for this page, so an unchanged
+		page is not downloaded or scanned again
+
+	extractor
+	    Optional `ddnsupdater.profiles.Extractor` which finds the addresses using
+		known router page formats instead of `search`, `skip`, `match` and
+		`extra_rules`
+
+	Every group in `match` which matches is taken as an address, and they are
+	returned comma separated.
+
 	>>> get_ip('my-user',
 			   'my-password',
 			   'http://192.168.0.1/internet-status',
@@ -57,115 +116,158 @@ def get_ip(user, password, url, search, skip, match):
 	# r = s.get(url, auth=(user, password), config={'verbose':sys.stdout})
 	# for line in r.content.split('\n'):
 
+	def urlopen(headers=None, method='GET'):
+		with trace.span('fetch.open', url=url, method=method):
+			if pool is not None:
+				return pool.urlopen(url, user, password, headers, method)
+
+			return default_openers.urlopen(url, user, password, headers, method)
+
+	def scan(response):
+		with trace.span('fetch.scan'):
+			if extractor is None:
+				return extract_ip(response, search, skip, match, extra_rules)
+
+			try:
+				page = response.read()
+			finally:
+				response.close()
+
+			return extractor.extract(page)
+
+	if cache is not None:
+		return cache.fetch(urlopen, scan)
+
+	return scan(urlopen())
+
+
+def extract_ip(response, search, skip, match, extra_rules=()):
+	"""Scan the file-like `response` a line at a time for the IP address using the
+	`search`, `skip` and `match` rules described in `get_ip()`, and for any more
+	addresses using `extra_rules`.
+	Reading stops, and `response` is closed, as soon as every rule has found its
+	address so the rest of a large status page is never downloaded.
+	`match` may be a string or a compiled regular expression.
+	"""
+
+	rules = []
+	for rule_search, rule_skip, rule_match in ((search, skip, match),) + tuple(extra_rules):
+		if isinstance(rule_match, basestring):
+			rule_match = compile_match(rule_match)
+
+		rules.append([rule_search, rule_skip, rule_match, None])
+
+	def match_line(n, line, search, skip, match):
+		match_obj = match.match(line)
+		if match_obj is None:
+			message = 'No match found {skip} lines after finding string {search}'.format(
+				skip=skip,
+				search=search)
+			if n == 0:
+				raise ValueError(message)
+
+			# an extra address, such as an IPv6 one the link does not have today,
+			# is left out rather than failing the whole poll
+			logging.debug(message)
+			return []
+
+		return [group for group in match_obj.groups() if group is not None]
+
+	found = [None] * len(rules)
+	waiting = len(rules)
 	try:
-		response = urllib2.urlopen(url)
-	except urllib2.HTTPError as e:
-		if e.code != 401:
-			raise
+		for line in iter(response.readline, ''):
+			line = line.rstrip('\n')
+			for n, rule in enumerate(rules):
+				if found[n] is not None:
+					continue
+
+				# rule holds the search string, skip, match and lines left to skip
+				if rule[3] is not None:
+					rule[3] -= 1
+					if rule[3] == 0:
+						found[n] = match_line(n, line, *rule[:3])
+						waiting -= 1
+						continue
+
+				if rule[0] in line:
+					rule[3] = rule[1]
+					if rule[3] == 0:
+						found[n] = match_line(n, line, *rule[:3])
+						waiting -= 1
+
+			if waiting == 0:
+				break
+
+	finally:
+		response.close()
+
+	if found[0] is None:
+		logging.debug('No IP address found')
+		raise ValueError('Cannot find IP address')
 
-		# if we got a 401 code (unauthorised) configure urllib2 for basic authentication
-		# and try again.
-		# Once configured globally, the module will pass the credentials on subsequent calls
-		realm_obj = re.match(r'Basic realm="(.*)"',
-							 e.headers.getheader('WWW-Authenticate'))
-		if realm_obj is None:
-			raise ValueError('Could not find realm in {h}'.format(h=e.headers))
-
-		realm = realm_obj.groups(0)[0]
-		auth_handler = urllib2.HTTPBasicAuthHandler()
-		auth_handler.add_password(realm=realm,
-								  uri=url,
-								  user=user,
-								  passwd=password)
-		opener = urllib2.build_opener(auth_handler)
-		urllib2.install_opener(opener)
-
-		response = urllib2.urlopen(url)
-
-	trigger = None
-	for line in response.read().split('\n'):
-		# logging.debug('LINE: ' + line)
-		if trigger is not None:
-			trigger -= 1
-			if trigger == 0:
-				# print 'SKIP ', line
-				# print 'matcher ', match
-				match_obj = re.match(match, line)
-				if match_obj is None:
-					raise ValueError('No match found {skip} lines after finding string {search}'.format(
-							skip=skip,
-							search=search))
-
-				# print ip_match
-				match_group = match_obj.groups(1)
-				if len(match_group) == 0:
-					raise ValueError('No groups in regular expression {match}'.format(match=match))
-
-				# logging.debug('get_ip returning ' + str(match_group[0]))
-				return match_group[0]
-
-		## print 'LINE: ', line
-		if search in line:
-			# print 'MATCH ', line
-			trigger = skip
-
-	logging.debug('No IP address found')
-	raise ValueError('Cannot find IP address')
-
-
-def update_ddns(url):
+	return ','.join(address for addresses in found if addresses is not None
+					for address in addresses)
+
+
+def update_ddns(url, protocol='namecheap'):
 	"""Ping the supplied URL to update the DDNS entry.
-	Try and parse the result, assuming the remote service is namecheap.com.
+	Parse the result using the driver for `protocol`, namecheap.com by default,
+	and return it as a `ddnsupdater.providers.Outcome`.
 	"""
 
-	response_obj = urllib2.urlopen(url)
-	response = response_obj.read()
+	driver = find_driver(protocol)
+	timeout = deadline.timeout('push', None)
+	if timeout is None:
+		timeout = socket._GLOBAL_DEFAULT_TIMEOUT
+
+	with trace.span('push.request'):
+		try:
+			response_obj = deadline.guard(urllib2.urlopen(url, timeout=timeout), 'push')
+		except (urllib2.URLError, socket.timeout) as e:
+			deadline.check_timeout(e)
+			raise
 
 	try:
-		root_elem = xml.etree.ElementTree.fromstring(response)
-	# except lxml.etree.XMLSyntaxError:
-	except xml.etree.ElementTree.ParseError:
-		logging.error('Could not decode server response ({code}): {body}'.format(
-				code=response_obj.code,
-				body=response))
-		return
+		with trace.span('push.parse', protocol=protocol):
+			outcome = driver.parse(response_obj, 1)[0]
+	finally:
+		response_obj.close()
 
-	err_count_elem = root_elem.find('ErrCount')
-	if err_count_elem is not None:
-		err_count = err_count_elem.text.strip()
-	else:
-		err_count = 'Could not decode error count'
+	if outcome.ok:
+		logging.info('Server response ({code}): {message}'.format(
+				code=response_obj.code,
+				message=outcome.message))
 
-	done_elem = root_elem.find('Done')
-	if done_elem is not None:
-		done = done_elem.text.strip()
 	else:
-		done = 'Could not decode done value'
-
-	logging.info('Server response ({code}): errors {err} done {done}'.format(
-			code=response_obj.code,
-			err=err_count,
-			done=done))
-
-	# Sample response:
+		logging.error('Server response ({code}): {message}'.format(
+				code=response_obj.code,
+				message=outcome.message))
 
-	# <?xml version="1.0"?>
-	# <interface-response>
-	# <Command>SETDNSHOST</Command>
-	# <Language>eng</Language>
-	# <IP>87.186.224.7</IP>
-	# <ErrCount>0</ErrCount>
-	# <ResponseCount>0</ResponseCount>
-	# <Done>true</Done>
-	# <debug><![CDATA[]]></debug>
-	# </interface-response>
+	return outcome
 
 
-def poll(input_function, period, output_url, statefile):
+def poll(input_function, period, output_url, statefile, events=None, schedule=None,
+		 push_function=None, metrics=None, timeout=None):
 	"""Keep calling `input_function` to retrieve the current IP address,
 	and ping `output_url` to update it if a change is seen.
 	`output_url` should be a string containing `{ip}` which will be expanded to the current
 	address.
+	If an `events` source is given, the address is also checked as soon as it
+	reports a change, with `period` as the longest time between checks.
+	`schedule` is a `ddnsupdater.schedule.Schedule` which adjusts the time between
+	checks after failures and changes.
+	If `push_function` is given it is called with the new IP instead of pinging
+	`output_url`, e.g. a `ddnsupdater.push.Pusher` updating several records. It
+	returns False if there was nothing to send, which is then not counted as an update.
+	Timings and failures are recorded in `metrics`, a
+	`ddnsupdater.metrics.PollMetrics`, under the target name 'ddns'.
+	Addresses are compared in the normal form given by `ddnsupdater.address`, so
+	the same IPv6 address written differently is not seen as a change.
+	If `push_function` holds the update back by raising `ddnsupdater.push.Deferred`,
+	the address is checked again once the delay it asks for is up.
+	Each check, fetch and push together, is given up on after `timeout` seconds, as
+	described in `ddnsupdater.deadline`.
 
 	>>> poll(my_func, 600, 'https://dynamicdns.park-your-domain.com/update?'
 								 'host=www&'
@@ -186,70 +288,516 @@ def poll(input_function, period, output_url, statefile):
 
 			logging.info('Read external address of {ip}'.format(ip=last_ip))
 
+	if schedule is None:
+		schedule = Schedule(period)
+
 	while True:
-		# logging.debug('calling ' + str(input_function))
-		ip = input_function()
-		# reload(requests)  # failed attempt to get Requests module to work
-		# with repeat calls
-		logging.info('Current external address is ' + ip)
-		if ip != last_ip:
-			url = output_url.format(ip=ip)
-			# don't log IP as it will probably contain a password
-			logging.info('External IP changed, updating DDNS server')
-			update_ddns(url)
-			logging.info('Updating statefile ' + statefile)
-			with open(statefile, 'w') as h:
-				h.write(ip)
-
-		last_ip = ip
-		logging.debug('Sleeping for {period} seconds'.format(period=period))
-		time.sleep(period)
-
-def configure_defaults_from_file(config_file, defaults):
-	"""Read a set of values from `config_file` and assign them to the `defaults`
-	dictionary.
+		ok = True
+		changed = False
+		retry_after = None
+		stage = 'fetch'
+		start = time.time()
+		budget = fetch_budget = None
+		if timeout is not None:
+			budget = Deadline(timeout)
+			fetch_budget = budget.part(deadline.FETCH_SHARE)
+
+		try:
+			# logging.debug('calling ' + str(input_function))
+			with deadline.scope(fetch_budget):
+				ip = address.normalise(input_function())
+
+			if metrics is not None:
+				metrics.fetched('ddns', time.time() - start)
+
+			# reload(requests)  # failed attempt to get Requests module to work
+			# with repeat calls
+			logging.info('Current external address is ' + ip)
+			if ip != last_ip:
+				changed = True
+				# don't log IP as it will probably contain a password
+				logging.info('External IP changed, updating DDNS server')
+				stage = 'push'
+				start = time.time()
+				pushed = True
+				with deadline.scope(budget):
+					if push_function is not None:
+						pushed = push_function(ip) is not False
+
+					else:
+						update_ddns(output_url.format(**address.placeholders(ip)))
+
+				if metrics is not None and pushed:
+					metrics.pushed('ddns', time.time() - start)
+
+				if statefile is not None:
+					from ddnsupdater.state import write_statefile
+					logging.info('Updating statefile ' + statefile)
+					write_statefile(statefile, ip)
+
+			last_ip = ip
+
+		except Deferred as e:
+			logging.info(str(e))
+			retry_after = e.delay
+
+		except Exception as e:
+			if isinstance(e, DeadlineExceeded):
+				# nothing unexpected, so no traceback
+				logging.error('Poll failed, {stage} {err}'.format(stage=stage, err=e))
+
+			else:
+				logging.exception('Poll failed')
+
+			if metrics is not None:
+				metrics.failed('ddns', stage, time.time() - start, e)
+
+			ok = False
+
+		delay = schedule.next_delay(ok, changed)
+		if retry_after is not None:
+			delay = min(delay, retry_after)
+
+		logging.debug('Sleeping for {delay:.0f} seconds'.format(delay=delay))
+		if events is None:
+			time.sleep(delay)
+
+		elif events.wait(delay):
+			logging.debug('Woken by address change event')
+
+
+def make_fetch_function(options, pool=None, conditional=True):
+	"""Return a function taking no arguments which reads the current external IP
+	using the `fetch_source` named in the `options` dictionary, with the rest of the
+	`fetch_` options as its configuration. If `conditional`, a router page is only
+	downloaded and scanned again when it has changed.
+	"""
+
+	source = options['fetch_source']
+	if source == 'router':
+		extra_rules = ()
+		if options.get('fetch_search6'):
+			extra_rules = ((options['fetch_search6'],
+							options.get('fetch_skip6') or 0,
+							options['fetch_match6']),)
+
+		# Create a curried version of `get_ip()` with all parameters fixed
+		return functools.partial(get_ip,
+								 user=options['fetch_user'],
+								 password=options['fetch_password'],
+								 url=options['fetch_url'],
+								 search=options['fetch_search'],
+								 skip=options['fetch_skip'],
+								 match=options['fetch_match'],
+								 pool=pool,
+								 extra_rules=extra_rules,
+								 cache=PageCache() if conditional else None,
+								 extractor=(make_extractor(options['fetch_profile'])
+											if options.get('fetch_profile') else None))
+
+	if source == 'interface':
+		if options.get('fetch_interface') is None:
+			raise ValueError('The interface source needs an interface name')
+
+		return functools.partial(find_source(source), interface=options['fetch_interface'])
+
+	if source == 'natpmp':
+		return functools.partial(find_source(source), gateway=options.get('fetch_gateway'))
+
+	if source == 'upnp':
+		return functools.partial(find_source(source), url=options.get('fetch_url'))
+
+	# A plugin source is given every fetch option which has been set
+	return functools.partial(find_source(source), **dict(
+			(key[len('fetch_'):], value) for key, value in options.items()
+			if key.startswith('fetch_') and key != 'fetch_source' and value is not None))
+
+
+def make_event_source(events, interface=None, hook_port=None, hook_address='127.0.0.1'):
+	"""Start listening for the `events` named on the command line or in the config file."""
+	if events is None:
+		return None
+
+	if events == 'netlink':
+		from ddnsupdater.events import NetlinkEvents
+		return NetlinkEvents(interface).start()
+
+	if events == 'hook':
+		if hook_port is None:
+			raise ValueError('The hook event source needs a port')
+
+		from ddnsupdater.events import HookEvents
+		return HookEvents(hook_port, hook_address).start()
+
+	raise ValueError('Unknown event source {name}'.format(name=events))
+
+
+def make_metrics(port=None, textfile=None, pool=None):
+	"""Start serving metrics on `port` and/or writing them to `textfile`. Returns the
+	`PollMetrics` to record into, or None if neither is configured.
+	"""
+
+	if port is None and textfile is None:
+		return None
+
+	from ddnsupdater.metrics import PollMetrics, MetricsServer, TextfileWriter
+	metrics = PollMetrics()
+	metrics.watch_auth(default_openers)
+	if pool is not None:
+		metrics.watch_auth(pool)
+
+	if port is not None:
+		logging.info('Serving metrics on port {port}'.format(port=port))
+		MetricsServer(metrics.registry, port).start()
+
+	if textfile is not None:
+		TextfileWriter(metrics.registry, textfile).start()
+
+	return metrics
+
+
+def make_schedule(period, args):
+	"""Build a `Schedule` for polls every `period` seconds using the retry, backoff,
+	recheck and jitter settings from the command line `args`.
+	"""
+
+	return Schedule(period,
+					retry=args.retry,
+					max_backoff=args.max_backoff,
+					recheck=args.recheck,
+					jitter=args.jitter)
+
+
+def make_pool(args, **kwargs):
+	"""Return a `ConnectionPool` built with `kwargs`, keeping fewer idle connections
+	if the command line `args` ask for --low-memory.
+	"""
+
+	if args.low_memory:
+		kwargs['max_idle'] = LOW_MEMORY_IDLE
+
+	return ConnectionPool(**kwargs)
+
+
+def limit_memory(args):
+	"""Make the process smaller for --low-memory, at the cost of polling fewer
+	targets at once. Threads started from now on get a small stack, and fewer of
+	them are started. With glibc every thread shares one malloc arena.
+	"""
+
+	threading.stack_size(LOW_MEMORY_STACK_SIZE)
+	args.max_in_flight = min(args.max_in_flight, LOW_MEMORY_IN_FLIGHT)
+	try:
+		import ctypes
+		ctypes.CDLL(None).mallopt(M_ARENA_MAX, 1)
+	except (ImportError, OSError, AttributeError):
+		# not glibc, e.g. musl on OpenWrt, which has no per-thread arenas anyway
+		logging.debug('Cannot limit malloc arenas')
+
+
+def make_limiter(args, workers=1):
+	"""Return a `RateLimiter` keeping the updates sent to each DDNS provider within
+	the `push_rate` per minute from the command line `args`, or None if there is no
+	limit. Each of `workers` processes gets an equal share of the rate.
 	"""
 
-	config = ConfigParser.ConfigParser()
+	if args.push_rate is None or args.push_rate <= 0:
+		return None
 
-	if not os.path.exists(config_file):
-		raise IOError('Configuration file {name} cannot be read'.format(
-				name=config_file))
+	return RateLimiter(args.push_rate / 60.0 / workers, burst=args.push_burst)
 
-	config.read(config_file)
 
-	if config.has_option('ddnsupdater', 'sleep'):
-		defaults['sleep'] = config.getint('ddnsupdater', 'sleep')
+def make_pusher(records, push_pool, state, args, limiter=None):
+	"""Build the `Pusher` for `records` with the debounce settings from the command
+	line `args`.
+	"""
+
+	return Pusher(records,
+				  push_pool,
+				  max_workers=LOW_MEMORY_PUSH_WORKERS if args.low_memory else 8,
+				  state=state,
+				  limiter=limiter,
+				  debounce=args.debounce,
+				  max_debounce=args.max_debounce)
+
+
+def make_push_records(name, urls, protocol):
+	"""Return a `PushRecord` for each of the URL templates `urls`. Records are named
+	after the target, numbered if there is more than one.
+	"""
+
+	if len(urls) == 1:
+		return [PushRecord(name, urls[0], protocol)]
+
+	return [PushRecord('{name}#{n}'.format(name=name, n=n), url, protocol)
+			for n, url in enumerate(urls, 1)]
+
+
+def make_target_fetch(target_config, pool, args, shared=None):
+	"""Return the fetch function for a `ddnsupdater.config.TargetConfig`, shared
+	through `shared`, a `ddnsupdater.shared.SharedFetches`, if one is given.
+	"""
+
+	options = target_config.fetch_options()
+	fetch = make_fetch_function(options, pool, args.conditional)
+	if shared is not None:
+		fetch = shared.get(tuple(sorted(options.items())), fetch)
+
+	return fetch
+
+
+def make_target(target_config, pool, push_pool, state, args, previous=None, shared=None,
+				limiter=None):
+	"""Build an engine `Target` from a `ddnsupdater.config.TargetConfig`.
+	`previous` is the running `Target` of the same name when the configuration is
+	reloaded; its last address is carried over unless the DDNS records changed.
+	If `shared`, a `ddnsupdater.shared.SharedFetches`, is given, targets with
+	identical fetch settings share a single fetch function. Updates go through
+	`limiter`, a `ddnsupdater.ratelimit.RateLimiter` shared by every target.
+	"""
+
+	pusher = make_pusher(make_push_records(target_config.name,
+										   target_config.push_urls,
+										   target_config.push_protocol),
+						 push_pool,
+						 state,
+						 args,
+						 limiter)
+	last_ip = None
+	if previous is not None:
+		if previous[0].same_push(target_config):
+			last_ip = previous[1].last_ip
+
+		else:
+			# the records point somewhere new so all of them must be set again
+			pusher.pushed.clear()
+
+	return Target(name=target_config.name,
+				  fetch=make_target_fetch(target_config, pool, args, shared),
+				  push=pusher,
+				  period=target_config.sleep,
+				  last_ip=last_ip,
+				  schedule=make_schedule(target_config.sleep, args))
+
+
+def reload_targets(engine, running, config_file, defaults, build, select=None):
+	"""Re-read the named targets from `config_file` and hand them to `engine`.
+	`running` maps each target name to its (`TargetConfig`, `Target`) and is updated
+	in place. Targets whose settings are unchanged keep running undisturbed; the
+	others are rebuilt by calling `build(target_config, previous=previous)`.
+	If `select` is given, only the targets for which `select(target_config)` is
+	true are kept, e.g. those belonging to this worker process.
+	On a bad configuration file the error is logged and nothing changes.
+	Records a provider refused for good are sent again.
+	"""
 
-	if config.has_option('ddnsupdater', 'logging'):
-		# set log config file name relative to config file name
-		defaults['logging'] = os.path.join(
-			os.path.dirname(os.path.abspath(config_file)),
-							 config.get('ddnsupdater', 'logging'))
+	start = time.time()
+	try:
+		target_configs = config.load(config_file, defaults).targets
+	except (IOError, ValueError) as e:
+		logging.error('Not reloading {name}: {err}'.format(name=config_file, err=e))
+		return
+
+	if select is not None:
+		target_configs = [t for t in target_configs if select(t)]
+
+	added, removed, changed = config.diff_targets([c for c, _ in running.values()],
+												  target_configs)
+	targets = []
+	replaced = {}
+	for target_config in target_configs:
+		previous = running.get(target_config.name)
+		if previous is None or previous[0] != target_config:
+			previous = (target_config, build(target_config, previous=previous))
+
+		elif previous[1].push.unblock():
+			# records the provider refused for good are tried again, so check the
+			# target as if its address were new
+			previous[1].last_ip = None
+
+		replaced[target_config.name] = previous
+		targets.append(previous[1])
+
+	running.clear()
+	running.update(replaced)
+	engine.replace(targets)
+	logging.info(('Reloaded {name} in {ms:.1f}ms: {added} added, {removed} removed, '
+				  '{changed} changed, {same} unchanged').format(
+			name=config_file,
+			ms=(time.time() - start) * 1000,
+			added=len(added),
+			removed=len(removed),
+			changed=len(changed),
+			same=len(targets) - len(added) - len(changed)))
+
+
+def run_one_shot(targets, args):
+	"""Read the address of every named target in `targets`, or of the one set up
+	by the command line `args` if there are none, once and in parallel. Prints a
+	table or JSON, as chosen by `args.output`, and returns the exit status from
+	`ddnsupdater.fleet.exit_code()`. Raises ValueError if the settings are bad.
+	"""
+
+	from ddnsupdater import fleet
+
+	pool = None
+	if args.keepalive:
+		pool = make_pool(args, max_idle=args.max_in_flight, timeout=args.timeout)
+
+	if len(targets) == 0:
+		config.check_fetch(vars(args))
+		fetches = [('ddns', make_fetch_function(vars(args), pool, args.conditional))]
+
+	else:
+		shared = SharedFetches(args.share_window) if args.share_window > 0 else None
+		fetches = [(t.name, make_target_fetch(t, pool, args, shared)) for t in targets]
+
+	start = time.time()
+	results = fleet.check_all(fetches, max_workers=args.max_in_flight, timeout=args.timeout)
+	logging.info('Checked {count} targets in {ms:.0f}ms'.format(
+			count=len(results), ms=(time.time() - start) * 1000))
+	if args.output == 'json':
+		sys.stdout.write(fleet.format_json(results))
 
-	if config.has_option('ddnsupdater', 'statefile'):
-		defaults['statefile'] = config.get('ddnsupdater', 'statefile')
+	else:
+		sys.stdout.write(fleet.format_table(results))
 
-	if config.has_option('fetch', 'url'):
-		defaults['fetch_url'] = config.get('fetch', 'url')
+	return fleet.exit_code(results)
 
-	if config.has_option('fetch', 'user'):
-		defaults['fetch_user'] = config.get('fetch', 'user')
 
-	if config.has_option('fetch', 'password'):
-		defaults['fetch_password'] = config.get('fetch', 'password')
+def run_targets(targets, args, base_defaults, pool, push_pool, state, events, metrics,
+				select=None, limiter=None):
+	"""Poll the named `targets`, a list of `ddnsupdater.config.TargetConfig`, until
+	the process is stopped, reloading them from the config file on SIGHUP. `select`
+	is passed on to `reload_targets()`, and `limiter` to `make_target()`.
+	"""
 
-	if config.has_option('fetch', 'search'):
-		defaults['fetch_search'] = config.get('fetch', 'search')
+	logging.info('Polling {count} targets'.format(count=len(targets)))
+	# Targets behind the same router read the address once between them
+	shared = SharedFetches(args.share_window) if args.share_window > 0 else None
+	build = functools.partial(make_target,
+							  pool=pool,
+							  push_pool=push_pool,
+							  state=state,
+							  args=args,
+							  shared=shared,
+							  limiter=limiter)
+	running = dict((t.name, (t, build(t))) for t in targets)
+	engine = Engine([running[t.name][1] for t in targets],
+					max_in_flight=args.max_in_flight,
+					state=state,
+					metrics=metrics,
+					timeout=args.timeout)
+	if shared is not None:
+		logging.info('{count} targets read from {sources} sources'.format(
+				count=len(targets), sources=len(shared)))
+		shared.subscribe(engine.fetched)
+
+	if events is not None:
+		engine.watch(events)
+
+	# Reload the named targets on SIGHUP. The work is done on another thread, as
+	# the signal arrives on the thread running the engine.
+	reload_lock = threading.Lock()
+
+	def reload():
+		with reload_lock:
+			reload_targets(engine, running, args.config, base_defaults, build, select)
+
+	signal.signal(signal.SIGHUP, lambda signum, frame: threading.Thread(
+			target=reload, name='ddns-reload').start())
+
+	engine.run()
+
+
+def run_worker(index, count, targets, args, base_defaults, metrics_dir):
+	"""Poll the share of the named targets belonging to worker `index` of `count`,
+	in a process started by `ddnsupdater.supervisor.Supervisor`. The targets are
+	read from the config file again, so a restarted worker picks up any reload;
+	`targets` is used if the file has since become unreadable.
+	Metrics are written to a file in `metrics_dir`, if given, for the supervisor
+	to merge.
+	"""
 
-	if config.has_option('fetch', 'skip'):
-		defaults['fetch_skip'] = config.getint('fetch', 'skip')
+	from ddnsupdater.state import StateStore
+	from ddnsupdater.supervisor import HashRing
 
-	if config.has_option('fetch', 'match'):
-		defaults['fetch_match'] = config.get('fetch', 'match')
+	log.after_fork()
+	ring = HashRing(range(count))
+	select = lambda target_config: ring.node(target_config.name) == index
+	try:
+		targets = config.load(args.config, base_defaults).targets
+	except (IOError, ValueError) as e:
+		logging.error('Using the targets read at startup: {err}'.format(err=e))
+
+	if args.trace_dir is not None:
+		trace.install_signal_handlers(args.trace_dir)
+
+	pool = make_pool(args) if args.keepalive else None
+	push_pool = make_pool(args)
+	state = StateStore(args.statedb) if args.statedb is not None else None
+	events = make_event_source(args.events, args.fetch_interface, args.hook_port,
+							   args.hook_address)
+	metrics = None
+	if metrics_dir is not None:
+		textfile = os.path.join(metrics_dir, 'worker-{index}.prom'.format(index=index))
+		metrics = make_metrics(textfile=textfile, pool=pool)
+
+	# The workers update records with the same providers, so share the rate out
+	limiter = make_limiter(args, count)
+	run_targets([t for t in targets if select(t)], args, base_defaults, pool, push_pool, state,
+				events, metrics, select, limiter)
+
+
+def run_supervisor(targets, args, base_defaults):
+	"""Split the named `targets` between `args.workers` processes and keep them
+	running. SIGHUP, and with --trace-dir SIGUSR1 and SIGUSR2, are passed on to every
+	worker, and the workers' metrics are served and written as one.
+	"""
 
-	if config.has_option('push', 'url'):
-		defaults['push_url'] = config.get('push', 'url')
+	import shutil
+	import tempfile
+	from ddnsupdater.metrics import Registry, MergedRegistry, MetricsServer, TextfileWriter
+	from ddnsupdater.supervisor import Supervisor
+
+	registry = None
+	metrics_dir = None
+	if args.metrics_port is not None or args.metrics_textfile is not None:
+		registry = Registry()
+		metrics_dir = tempfile.mkdtemp(prefix='ddns-metrics-')
+		merged = MergedRegistry(registry, metrics_dir)
+		if args.metrics_port is not None:
+			logging.info('Serving metrics on port {port}'.format(port=args.metrics_port))
+			MetricsServer(merged, args.metrics_port).start()
+
+		if args.metrics_textfile is not None:
+			TextfileWriter(merged, args.metrics_textfile).start()
+
+	supervisor = Supervisor(args.workers,
+							functools.partial(run_worker,
+											  targets=targets,
+											  args=args,
+											  base_defaults=base_defaults,
+											  metrics_dir=metrics_dir),
+							metrics=registry)
+	forwarded = [signal.SIGHUP]
+	if args.trace_dir is not None:
+		# the workers only handle these when tracing
+		forwarded += [signal.SIGUSR1, signal.SIGUSR2]
+
+	for signum in forwarded:
+		signal.signal(signum, lambda signum, frame: supervisor.forward(signum))
+
+	for signum in (signal.SIGTERM, signal.SIGINT):
+		signal.signal(signum, lambda signum, frame: supervisor.stop())
+
+	logging.info('Polling {count} targets in {workers} processes'.format(
+			count=len(targets), workers=args.workers))
+	try:
+		supervisor.run()
+	finally:
+		if metrics_dir is not None:
+			shutil.rmtree(metrics_dir, ignore_errors=True)
 
 
 def main():
@@ -266,10 +814,29 @@ def main():
 	args, remaining_argv = parser.parse_known_args()
 	defaults = {
 		'sleep': 3600,
+		'fetch_source': 'router',
 		'fetch_user': 'admin',
 		'fetch_search': 'IP Address',
 		'fetch_skip': 0,
 		'fetch_match': r'.*<td>([0-9.]+)',
+		'fetch_skip6': 0,
+		'fetch_match6': r'.*<td>([0-9a-fA-F:.]+(?:/[0-9]+)?)',
+		'push_protocol': 'namecheap',
+		'max_in_flight': 16,
+		'retry': 60,
+		'recheck': 60,
+		'jitter': 0.1,
+		'keepalive': True,
+		'conditional': True,
+		'share_window': 5,
+		'workers': 1,
+		'push_burst': 5,
+		'debounce': 0,
+		'max_debounce': 300,
+		'timeout': 30,
+		'output': 'table',
+		'low_memory': False,
+		'hook_address': '127.0.0.1',
 		'push_url': ('https://dynamicdns.park-your-domain.com/update?'
 					 'host=www&'
 					 'domain=example.com&'
@@ -277,11 +844,16 @@ def main():
 					 'ip={ip}'),
 		}
 
+	base_defaults = dict(defaults)
+	targets = []
 	if args.config is not None:
 		# If the user supplied a --config file, parse it and add the contents to our
 		# defaults dictionary.
 		# Settings can then be overridden with command line flags.
-		configure_defaults_from_file(args.config, defaults)
+		try:
+			defaults, targets = config.load(args.config, defaults)
+		except ValueError as e:
+			parser.error(str(e))
 
 	parser.set_defaults(**defaults)
 	parser.add_argument('--help', '-h',
@@ -290,12 +862,56 @@ def main():
 	parser.add_argument('--logging',
 						metavar='FILE',
 						help='Configure logging using FILE')
+	parser.add_argument('--log-queue',
+						action='store_true',
+						help=('Write log messages from a background thread so slow disks never '
+							  'delay a poll'))
+	parser.add_argument('--log-json',
+						action='store_true',
+						help='Write each log message as a JSON object')
+	parser.add_argument('--log-repeat',
+						type=int,
+						metavar='SECONDS',
+						help=('Log a repeated informational message, such as the unchanged '
+							  'address, at most once per SECONDS'))
 	parser.add_argument('--statefile',
 						help=('Optional statefile used to record external IP between invocations '
 							  'to avoid reconfiguring the dynamic DNS server on every startup'))
+	parser.add_argument('--statedb',
+						metavar='FILE',
+						help=('Optional SQLite database recording the address of every target '
+							  'and DDNS record, so that nothing is pushed again after a restart'))
 	parser.add_argument('--sleep',
 						type=int,
 						help='Time between external IP address polls in seconds')
+	parser.add_argument('--retry',
+						type=int,
+						metavar='SECONDS',
+						help=('Delay before retrying after a failed poll, doubled after each '
+							  'further failure'))
+	parser.add_argument('--max-backoff',
+						type=int,
+						metavar='SECONDS',
+						help='Longest delay between retries, by default the --sleep period')
+	parser.add_argument('--recheck',
+						type=int,
+						metavar='SECONDS',
+						help=('Delay before checking again after the address changes, doubled '
+							  'on each check until it reaches the --sleep period'))
+	parser.add_argument('--jitter',
+						type=float,
+						metavar='FRACTION',
+						help='Randomly vary each delay by up to this fraction')
+	parser.add_argument('--fetch-source',
+						metavar='SOURCE',
+						help=('Where to read the external IP address from: router (default), '
+							  'interface, natpmp, upnp, or package.module.function'))
+	parser.add_argument('--fetch-interface',
+						metavar='NAME',
+						help='Local network interface holding the external IP address')
+	parser.add_argument('--fetch-gateway',
+						metavar='ADDRESS',
+						help='NAT-PMP gateway, if not the default route')
 	parser.add_argument('--fetch-user',
 						help='HTTP username to use for request')
 	parser.add_argument('--fetch-password',
@@ -307,16 +923,118 @@ def main():
 						help=('Search string to look for to identify line containing '
 							  'external IP address'))
 	parser.add_argument('--fetch-skip',
+						type=int,
 						metavar='COUNT',
 						help='Skip forwards COUNT lines from line containing MATCH')
 	parser.add_argument('--fetch-match',
 						help='Regular expression including one group to pick out IP address')
+	parser.add_argument('--fetch-search6',
+						metavar='SEARCH',
+						help=('Search string identifying the line containing the external IPv6 '
+							  'address or delegated prefix, if the router shows one'))
+	parser.add_argument('--fetch-skip6',
+						type=int,
+						metavar='COUNT',
+						help='Skip forwards COUNT lines from the line containing SEARCH6')
+	parser.add_argument('--fetch-match6',
+						help=('Regular expression with groups picking out the IPv6 address and/or '
+							  'prefix'))
+	parser.add_argument('--fetch-profile',
+						metavar='PROFILE',
+						help=('Find the address using a known router page format instead of '
+							  'SEARCH and MATCH: auto to recognise the page, or one of {names}'
+							  .format(names=', '.join(PROFILES))))
+	parser.add_argument('--no-keepalive',
+						dest='keepalive',
+						action='store_false',
+						help=('Open a new connection to the router for every poll instead of '
+							  'keeping one open'))
+	parser.add_argument('--no-conditional',
+						dest='conditional',
+						action='store_false',
+						help=('Download and scan the whole router page on every poll instead of '
+							  'only when it has changed'))
 	parser.add_argument('--one-shot',
 						action='store_true',
-						help='Test configuration by just retrieving IP address')
+						help=('Read the address of every target once, in parallel, print them '
+							  'and exit: 0 if all succeeded, 1 if some failed, 2 if all failed'))
+	parser.add_argument('--output',
+						choices=['table', 'json'],
+						help='How --one-shot prints the results')
+	parser.add_argument('--timeout',
+						type=float,
+						metavar='SECONDS',
+						help=('Give up on checking a target, fetch and push together, after '
+							  'SECONDS. The fetch may take up to half of it'))
 	parser.add_argument('--push-url',
 						help=('Target IP address to ping to update IP address. '
-							  'Use {ip} as placeholder for actual address'))
+							  'Use {ip} as placeholder for actual address, or {ip6} or {prefix} '
+							  'to update an IPv6 record'))
+	parser.add_argument('--push-protocol',
+						choices=sorted(DRIVERS),
+						help='Protocol spoken by the DDNS server')
+	parser.add_argument('--push-rate',
+						type=float,
+						metavar='COUNT',
+						help=('Send no more than COUNT updates a minute to each DDNS provider, '
+							  'updating the records which have been wrong longest first'))
+	parser.add_argument('--push-burst',
+						type=int,
+						metavar='COUNT',
+						help='Allow bursts of up to COUNT updates above the --push-rate')
+	parser.add_argument('--debounce',
+						type=int,
+						metavar='SECONDS',
+						help=('Only change a record once the new address has stayed the same '
+							  'for SECONDS, so a flapping link is not pushed on every change'))
+	parser.add_argument('--max-debounce',
+						type=int,
+						metavar='SECONDS',
+						help='Never hold an update back for --debounce longer than SECONDS')
+	parser.add_argument('--events',
+						choices=['netlink', 'hook'],
+						help=('Also check the address as soon as the kernel reports an address '
+							  'change (netlink) or a router calls the HTTP hook (hook)'))
+	parser.add_argument('--hook-port',
+						type=int,
+						metavar='PORT',
+						help='Port to listen on for the router hook')
+	parser.add_argument('--hook-address',
+						metavar='ADDRESS',
+						help=('Address to listen on for the router hook, 127.0.0.1 by default. '
+							  'The hook has no authentication'))
+	parser.add_argument('--metrics-port',
+						type=int,
+						metavar='PORT',
+						help='Serve Prometheus metrics at http://HOST:PORT/metrics')
+	parser.add_argument('--metrics-textfile',
+						metavar='FILE',
+						help=('Write Prometheus metrics to FILE for the node_exporter textfile '
+							  'collector'))
+	parser.add_argument('--trace-dir',
+						metavar='DIR',
+						help=('Record the phases of each poll. SIGUSR1 then writes a Chrome trace '
+							  'and thread stacks to DIR, and SIGUSR2 starts or stops sampling '
+							  'stacks for a flame graph'))
+	parser.add_argument('--share-window',
+						type=int,
+						metavar='SECONDS',
+						help=('Targets with identical fetch settings share one fetch, reusing its '
+							  'result for SECONDS. 0 fetches for every target separately'))
+	parser.add_argument('--workers',
+						type=int,
+						metavar='COUNT',
+						help=('Split the targets from [fetch:NAME] sections between COUNT '
+							  'processes'))
+	parser.add_argument('--max-in-flight',
+						type=int,
+						metavar='COUNT',
+						help=('Maximum number of targets polled at once when the config file '
+							  'has [fetch:NAME] sections'))
+	parser.add_argument('--low-memory',
+						action='store_true',
+						help=('Keep memory use down on small hosts by starting fewer threads, '
+							  'with smaller stacks, and keeping fewer connections open'))
 
 	args = parser.parse_args()
 
@@ -324,28 +1042,85 @@ def main():
 		parser.print_help()
 		parser.exit()
 
-	init_log(args.logging)
+	if args.low_memory:
+		# before any thread is started
+		limit_memory(args)
+
+	init_log(args.logging,
+			 queued=args.log_queue,
+			 json_format=args.log_json,
+			 repeat_interval=args.log_repeat)
+
+	if args.one_shot:
+		try:
+			code = run_one_shot(targets, args)
+		except ValueError as e:
+			parser.error(str(e))
+
+		sys.exit(code)
+
+	if len(targets) > 0 and args.workers > 1:
+		# Everything else is set up in the worker processes
+		if args.events == 'hook':
+			parser.error('The hook event source cannot be shared between worker processes')
+
+		run_supervisor(targets, args, base_defaults)
+		return
+
+	if args.trace_dir is not None:
+		trace.install_signal_handlers(args.trace_dir)
+
+	# One pool is shared by every target so targets behind the same router share
+	# connections
+	pool = make_pool(args) if args.keepalive else None
 
-	if args.fetch_url is None:
+	# Updates to the DDNS provider share their own pool of connections
+	push_pool = make_pool(args)
+
+	state = None
+	if args.statedb is not None:
+		from ddnsupdater.state import StateStore
+		logging.info('Reading state database ' + args.statedb)
+		state = StateStore(args.statedb)
+
+	try:
+		events = make_event_source(args.events, args.fetch_interface, args.hook_port,
+							   args.hook_address)
+	except ValueError as e:
+		parser.error(str(e))
+
+	metrics = make_metrics(args.metrics_port, args.metrics_textfile, pool)
+
+	if len(targets) > 0:
+		# Named targets in the config file: poll them all from this process
+		run_targets(targets, args, base_defaults, pool, push_pool, state, events, metrics,
+					limiter=make_limiter(args))
+		return
+
+	if args.fetch_source == 'router' and args.fetch_url is None:
 		parser.error('No URL configured to fetch external IP address. Use --fetch-url or '
 					 'the config file setting to specify a URL')
 
-	# Create a curried version of `get_ip()` with all parameters fixed
-	fetch_function = functools.partial(get_ip,
-									   user=args.fetch_user,
-									   password=args.fetch_password,
-									   url=args.fetch_url,
-									   search=args.fetch_search,
-									   skip=args.fetch_skip,
-									   match=args.fetch_match)
-
-	if args.one_shot:
-		print fetch_function()
+	try:
+		config.check_fetch(vars(args))
+		push_urls = split_urls(args.push_url)
+		fetch_function = make_fetch_function(vars(args), pool, args.conditional)
+	except ValueError as e:
+		parser.error(str(e))
 
 	poll(input_function=fetch_function,
 		 period=args.sleep,
 		 output_url=args.push_url,
-		 statefile=args.statefile)
+		 statefile=args.statefile,
+		 events=events,
+		 schedule=make_schedule(args.sleep, args),
+		 push_function=make_pusher(make_push_records('ddns', push_urls, args.push_protocol),
+								   push_pool,
+								   state,
+								   args,
+								   make_limiter(args)),
+		 metrics=metrics,
+		 timeout=args.timeout)
 
 if __name__ == '__main__':
 	main()
@@ -0,0 +1,432 @@
+#!/usr/bin/env python2.7
+
+"""Counters, gauges and histograms in the Prometheus text format, served over
+HTTP or written to a file for node_exporter's textfile collector.
+"""
+
+import os
+import time
+import bisect
+import logging
+import threading
+import collections
+import BaseHTTPServer
+
+# Upper bounds in seconds for latency histograms, from a fast LAN router to a
+# provider which is timing out
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def escape(value):
+	return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def format_labels(names, values, extra=''):
+	pairs = ['{name}="{value}"'.format(name=name, value=escape(value))
+			 for name, value in zip(names, values)]
+	if extra:
+		pairs.append(extra)
+
+	return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def format_value(value):
+	if value == float('inf'):
+		return '+Inf'
+
+	return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric(object):
+	"""Base class for a metric with one value per combination of `labels`."""
+
+	kind = None
+
+	def __init__(self, name, help, labels=()):
+		self.name = name
+		self.help = help
+		self.labels = tuple(labels)
+		self._values = {}
+		self._lock = threading.Lock()
+
+	def _check(self, labels):
+		if len(labels) != len(self.labels):
+			raise ValueError('{name} needs labels {labels}'.format(
+					name=self.name, labels=', '.join(self.labels)))
+
+	def get(self, *labels):
+		"""Return the current value for `labels`."""
+		return self._values.get(labels, 0)
+
+	def samples(self):
+		"""Yield (name, label string, value) for every value."""
+		with self._lock:
+			values = sorted(self._values.items())
+
+		for labels, value in values:
+			yield self.name, format_labels(self.labels, labels), value
+
+	def render(self):
+		lines = ['# HELP {name} {help}'.format(name=self.name, help=self.help),
+				 '# TYPE {name} {kind}'.format(name=self.name, kind=self.kind)]
+		for name, labels, value in self.samples():
+			lines.append('{name}{labels} {value}'.format(
+					name=name, labels=labels, value=format_value(value)))
+
+		return '\n'.join(lines) + '\n'
+
+
+class Counter(Metric):
+	kind = 'counter'
+
+	def inc(self, *labels, **kwargs):
+		"""Add `amount` (default 1) to the count for `labels`."""
+		self._check(labels)
+		with self._lock:
+			self._values[labels] = self._values.get(labels, 0) + kwargs.get('amount', 1)
+
+	def set_total(self, value, *labels):
+		"""Set the count for `labels`, for counts kept by some other object."""
+		self._check(labels)
+		with self._lock:
+			self._values[labels] = value
+
+
+class Gauge(Metric):
+	kind = 'gauge'
+
+	def set(self, value, *labels):
+		self._check(labels)
+		with self._lock:
+			self._values[labels] = value
+
+
+class Histogram(Metric):
+	"""Counts of observations falling at or below each of `buckets`, with their sum."""
+
+	kind = 'histogram'
+
+	def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+		Metric.__init__(self, name, help, labels)
+		self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+	def observe(self, value, *labels):
+		self._check(labels)
+		index = bisect.bisect_left(self.buckets, value)
+		with self._lock:
+			counts = self._values.get(labels)
+			if counts is None:
+				# per bucket counts, then the total count and sum
+				counts = self._values[labels] = [0] * len(self.buckets) + [0, 0.0]
+
+			counts[index] += 1
+			counts[-2] += 1
+			counts[-1] += value
+
+	def get(self, *labels):
+		"""Return the number of observations for `labels`."""
+		counts = self._values.get(labels)
+		return counts[-2] if counts is not None else 0
+
+	def samples(self):
+		with self._lock:
+			values = sorted((labels, list(counts)) for labels, counts in self._values.items())
+
+		for labels, counts in values:
+			total = 0
+			for bound, count in zip(self.buckets, counts):
+				total += count
+				yield (self.name + '_bucket',
+					   format_labels(self.labels, labels, 'le="{le}"'.format(
+							le=format_value(bound))),
+					   total)
+
+			yield self.name + '_count', format_labels(self.labels, labels), counts[-2]
+			yield self.name + '_sum', format_labels(self.labels, labels), counts[-1]
+
+
+class Registry(object):
+	"""A set of metrics rendered together.
+
+	>>> registry = Registry()
+	>>> polls = registry.counter('polls_total', 'Polls made', ('target',))
+	>>> polls.inc('home')
+	>>> print registry.render()
+
+	"""
+
+	def __init__(self):
+		self._metrics = []
+		self._collectors = []
+		self._lock = threading.Lock()
+
+	def add(self, metric):
+		with self._lock:
+			self._metrics.append(metric)
+
+		return metric
+
+	def counter(self, name, help, labels=()):
+		return self.add(Counter(name, help, labels))
+
+	def gauge(self, name, help, labels=()):
+		return self.add(Gauge(name, help, labels))
+
+	def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+		return self.add(Histogram(name, help, labels, buckets))
+
+	def collect(self, function):
+		"""Call `function` before each render, e.g. to copy counters kept elsewhere
+		into gauges.
+		"""
+
+		with self._lock:
+			self._collectors.append(function)
+
+	def render(self):
+		"""Return every metric in the Prometheus text exposition format."""
+		with self._lock:
+			collectors = list(self._collectors)
+			metrics = list(self._metrics)
+
+		for function in collectors:
+			function()
+
+		return ''.join(metric.render() for metric in metrics)
+
+
+class PollMetrics(object):
+	"""The metrics recorded for each target by `ddnsupdater.engine.Engine` and
+	`ddnsupdater.main.poll()`.
+	"""
+
+	def __init__(self, registry=None, clock=time.time):
+		self.registry = registry if registry is not None else Registry()
+		self.clock = clock
+		r = self.registry
+		self.fetch_seconds = r.histogram('ddns_fetch_duration_seconds',
+										 'Time taken to read the external address',
+										 ('target',))
+		self.push_seconds = r.histogram('ddns_push_duration_seconds',
+										'Time taken to update the DDNS records',
+										('target',))
+		self.failures = r.counter('ddns_failures_total',
+								  'Failed fetches and pushes',
+								  ('target', 'stage'))
+		self.parse_failures = r.counter('ddns_parse_failures_total',
+										'Router pages in which no address could be found',
+										('target',))
+		self.changes = r.counter('ddns_address_changes_total',
+								 'Address changes pushed to the DDNS records',
+								 ('target',))
+		self.last_update = r.gauge('ddns_last_update_timestamp_seconds',
+								   'Unix time of the last successful DDNS update',
+								   ('target',))
+		self.since_update = r.gauge('ddns_seconds_since_last_update',
+									'Seconds since the last successful DDNS update',
+									('target',))
+		self.deadlines = r.counter('ddns_deadline_exceeded_total',
+								   'Polls given up on when their time ran out, by the phase '
+								   'in progress',
+								   ('target', 'stage', 'phase'))
+		self.auth_challenges = r.counter('ddns_auth_challenges_total',
+										 'HTTP 401 challenges answered, per router',
+										 ('host',))
+		self._updated = {}
+		self._clients = []
+		r.collect(self._collect)
+
+	def watch_auth(self, client):
+		"""Report the authentication challenges seen by `client`, a
+		`ddnsupdater.pool.ConnectionPool` or `ddnsupdater.auth.OpenerCache`.
+		"""
+
+		self._clients.append(client)
+
+	def _collect(self):
+		now = self.clock()
+		for name, when in self._updated.items():
+			self.since_update.set(now - when, name)
+
+		# a router may be reached both ways, e.g. for fetching and for pinging
+		challenges = collections.Counter()
+		for client in self._clients:
+			challenges.update(client.challenges)
+
+		for host, count in challenges.items():
+			self.auth_challenges.set_total(count, host)
+
+	def fetched(self, name, seconds):
+		self.fetch_seconds.observe(seconds, name)
+
+	def pushed(self, name, seconds):
+		now = self.clock()
+		self._updated[name] = now
+		self.changes.inc(name)
+		self.push_seconds.observe(seconds, name)
+		self.last_update.set(now, name)
+
+	def failed(self, name, stage, seconds, error):
+		"""Record a failure during `stage`, 'fetch' or 'push', after `seconds`."""
+		self.failures.inc(name, stage)
+		phase = getattr(error, 'phase', None)
+		if phase is not None:
+			self.deadlines.inc(name, stage, phase)
+
+		if stage == 'fetch':
+			self.fetch_seconds.observe(seconds, name)
+			if isinstance(error, ValueError):
+				self.parse_failures.inc(name)
+
+		else:
+			self.push_seconds.observe(seconds, name)
+
+
+def merge_texts(texts):
+	"""Combine several Prometheus text expositions, e.g. one from each worker
+	process, into one. Each metric's HELP and TYPE lines appear once, and samples
+	of the same series are added together, except for gauges, where the largest
+	is kept.
+	"""
+
+	families = collections.OrderedDict()
+	for text in texts:
+		family = None
+		for line in text.splitlines():
+			if line.startswith('# HELP ') or line.startswith('# TYPE '):
+				_, kind, name, rest = line.split(' ', 3)
+				family = families.setdefault(name, {'HELP': None, 'TYPE': None,
+													'samples': collections.OrderedDict()})
+				family[kind] = rest
+				continue
+
+			if line == '' or line.startswith('#') or family is None:
+				continue
+
+			series, _, value = line.rpartition(' ')
+			value = float(value)
+			samples = family['samples']
+			if series not in samples:
+				samples[series] = value
+
+			elif family['TYPE'] == 'gauge':
+				samples[series] = max(samples[series], value)
+
+			else:
+				samples[series] += value
+
+	lines = []
+	for name, family in families.items():
+		for kind in ('HELP', 'TYPE'):
+			if family[kind] is not None:
+				lines.append('# {kind} {name} {rest}'.format(kind=kind, name=name,
+															 rest=family[kind]))
+
+		for series, value in family['samples'].items():
+			if abs(value) < 2 ** 53 and value == int(value):
+				value = int(value)
+
+			lines.append('{series} {value}'.format(series=series, value=format_value(value)))
+
+	return '\n'.join(lines) + '\n' if lines else ''
+
+
+class MergedRegistry(object):
+	"""Stands in for a `Registry`, rendering `registry` together with every
+	metrics file in `directory`, as written by the worker processes' `TextfileWriter`.
+	"""
+
+	def __init__(self, registry, directory):
+		self.registry = registry
+		self.directory = directory
+
+	def render(self):
+		texts = [self.registry.render()]
+		for name in sorted(os.listdir(self.directory)):
+			if not name.endswith('.prom'):
+				continue
+
+			try:
+				with open(os.path.join(self.directory, name)) as h:
+					texts.append(h.read())
+			except IOError:
+				# the worker is replacing it
+				continue
+
+		return merge_texts(texts)
+
+
+class MetricsServer(object):
+	"""Serve `registry` at http://ADDRESS:PORT/metrics for Prometheus to scrape."""
+
+	def __init__(self, registry, port, address=''):
+		self.registry = registry
+		self.port = port
+		self.address = address
+		self._server = None
+
+	def start(self):
+		registry = self.registry
+
+		class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+			def log_message(self, *args):
+				pass
+
+			def do_GET(self):
+				if self.path.split('?')[0] != '/metrics':
+					self.send_error(404)
+					return
+
+				body = registry.render()
+				self.send_response(200)
+				self.send_header('Content-Type', 'text/plain; version=0.0.4')
+				self.send_header('Content-Length', str(len(body)))
+				self.end_headers()
+				self.wfile.write(body)
+
+		self._server = BaseHTTPServer.HTTPServer((self.address, self.port), Handler)
+		thread = threading.Thread(target=self._server.serve_forever, name='ddns-metrics')
+		thread.daemon = True
+		thread.start()
+		return self
+
+	def close(self):
+		if self._server is not None:
+			self._server.shutdown()
+			self._server.server_close()
+			self._server = None
+
+
+class TextfileWriter(object):
+	"""Write `registry` to `path` every `interval` seconds, replacing the file
+	atomically so node_exporter never reads half of it.
+	"""
+
+	def __init__(self, registry, path, interval=15):
+		self.registry = registry
+		self.path = path
+		self.interval = interval
+		self._stop = threading.Event()
+
+	def write(self):
+		# state brings in sqlite3, which only --statedb needs
+		from ddnsupdater.state import write_statefile
+		write_statefile(self.path, self.registry.render())
+
+	def _run(self):
+		while not self._stop.is_set():
+			try:
+				self.write()
+			except (IOError, OSError) as e:
+				logging.error('Cannot write metrics to {path}: {err}'.format(path=self.path, err=e))
+
+			self._stop.wait(self.interval)
+
+	def start(self):
+		thread = threading.Thread(target=self._run, name='ddns-textfile')
+		thread.daemon = True
+		thread.start()
+		return self
+
+	def close(self):
+		self._stop.set()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python2.7
+
+"""Avoid reading and scanning a router page which has not changed since the last
+poll.
+
+Routers which send an ETag or Last-Modified header are asked for the page
+conditionally, and a 304 answer reuses the address found last time. Some routers
+send the headers but ignore the conditions, in which case a HEAD request is made
+first, but only once the validators have been seen to change along with the page:
+some routers send the same ones however the page changes, e.g. an ETag for the
+page template, and those are never used again once they have come with a changed
+page. Otherwise a small page is read in one go and fingerprinted, so
+an identical page is not scanned again.
+"""
+
+import hashlib
+import cStringIO
+
+# Largest page, in bytes, read whole to be fingerprinted. Larger pages are
+# scanned as they arrive so reading can stop at the address.
+MAX_FINGERPRINT = 65536
+
+
+class PageCache(object):
+	"""The validators, fingerprint and result of the last read of one router page.
+	Each target has its own, used through `fetch()`.
+	"""
+
+	def __init__(self, max_fingerprint=MAX_FINGERPRINT):
+		self.max_fingerprint = max_fingerprint
+		self.etag = None
+		self.last_modified = None
+		self.fingerprint = None
+		self.result = None
+		# whether the router honours conditional requests, None until it is known
+		self.conditional = None
+		# whether the router answers HEAD requests with the page's validators
+		self.probe = True
+		# whether the validators change when the page does, None until it is known
+		self.trusted = None
+		self.not_modified = 0
+		self.probe_hits = 0
+		self.fingerprint_hits = 0
+		self.scans = 0
+
+	def request_headers(self):
+		"""Return the headers making a request conditional on the page having changed."""
+		headers = {}
+		if self.result is None or self.trusted is False:
+			return headers
+
+		if self.etag is not None:
+			headers['If-None-Match'] = self.etag
+
+		if self.last_modified is not None:
+			headers['If-Modified-Since'] = self.last_modified
+
+		return headers
+
+	def unchanged(self, response):
+		"""Return whether `response` carries the validators of the cached page."""
+		if self.result is None:
+			return False
+
+		etag = response.headers.getheader('ETag')
+		if etag is not None:
+			return etag == self.etag
+
+		modified = response.headers.getheader('Last-Modified')
+		return modified is not None and modified == self.last_modified
+
+	def remember(self, response, fingerprint, result):
+		self.etag = response.headers.getheader('ETag')
+		self.last_modified = response.headers.getheader('Last-Modified')
+		self.fingerprint = fingerprint
+		self.result = result
+
+	def fetch(self, urlopen, scan):
+		"""Return the result of `scan(response)` for the page opened by
+		`urlopen(headers, method)`, or the cached result if the page is unchanged.
+		"""
+
+		headers = self.request_headers()
+		if headers and self.conditional is False and self.trusted and self.probe:
+			response = urlopen({}, 'HEAD')
+			response.close()
+			if self.unchanged(response):
+				self.probe_hits += 1
+				return self.result
+
+			if (response.headers.getheader('ETag') is None
+					and response.headers.getheader('Last-Modified') is None):
+				# the router does not give validators for HEAD, so stop asking
+				self.probe = False
+
+		response = urlopen(headers, 'GET')
+		if response.code == 304:
+			response.close()
+			self.conditional = True
+			self.not_modified += 1
+			return self.result
+
+		# with the same validators again either the conditions were ignored or the
+		# validators say nothing about the page, which is known once it is read
+		same_validators = self.unchanged(response)
+
+		length = response.headers.getheader('Content-Length')
+		page = response
+		fingerprint = None
+		if length is not None and length.isdigit() and int(length) <= self.max_fingerprint:
+			try:
+				body = response.read()
+			finally:
+				response.close()
+
+			fingerprint = hashlib.md5(body).digest()
+			if fingerprint == self.fingerprint:
+				self.fingerprint_hits += 1
+				self.check_validators(response, same_validators, True)
+				self.remember(response, fingerprint, self.result)
+				return self.result
+
+			page = cStringIO.StringIO(body)
+
+		self.scans += 1
+		result = scan(page)
+		# without a fingerprint the address found is all there is to compare
+		self.check_validators(response, same_validators,
+							  fingerprint is None and result == self.result)
+		self.remember(response, fingerprint, result)
+		return result
+
+	def check_validators(self, response, same_validators, same_page):
+		"""Learn from a full answer to a conditional request. The cached validators
+		with the same page mean the router ignored the conditions; with a changed page
+		they mean nothing. New validators with a changed page show they can be trusted.
+		"""
+
+		if self.result is None or self.trusted is False:
+			return
+
+		if same_validators:
+			self.conditional = False
+			if not same_page:
+				self.trusted = False
+				self.probe = False
+
+		elif not same_page and (response.headers.getheader('ETag') is not None
+								or response.headers.getheader('Last-Modified') is not None):
+			self.trusted = True
@@ -0,0 +1,352 @@
+#!/usr/bin/env python2.7
+
+"""Keep-alive HTTP connections shared between polls of the same router"""
+
+import re
+import base64
+import socket
+import urllib2
+import httplib
+import logging
+import urlparse
+import threading
+import collections
+
+from ddnsupdater import trace
+from ddnsupdater import deadline
+from ddnsupdater import __version__
+
+USER_AGENT = 'ddns-updater/{version}'.format(version=__version__)
+
+# Statuses answered by following the Location header, as urllib2 does
+REDIRECTS = (301, 302, 303, 307)
+
+
+class PooledResponse(object):
+	"""Wrap an `httplib.HTTPResponse` so its connection goes back to the pool once
+	the body has been read to the end, or is discarded if closed part way through.
+	Under a `ddnsupdater.deadline.Deadline` every read is limited to the time left,
+	so a router sending the page a byte at a time is still given up on in time.
+	"""
+
+	chunk_size = 4096
+	drain_limit = 16384
+
+	def __init__(self, pool, key, conn, response):
+		self.pool = pool
+		self.key = key
+		self.conn = conn
+		self.response = response
+		self.code = response.status
+		self.headers = response.msg
+		self._buffer = ''
+		self._watchdog = None
+
+	def _arm(self):
+		if deadline.current() is None:
+			return
+
+		# the socket under the response's file object, which is still there after
+		# httplib has let go of a connection which will close
+		sock = getattr(self.response.fp, '_sock', None)
+		if sock is None:
+			return
+
+		# the timeout catches a router which stops sending, and the watchdog one
+		# which trickles
+		sock.settimeout(deadline.timeout('read'))
+		if self._watchdog is None:
+			self._watchdog = deadline.Watchdog(sock)
+
+	def _disarm(self):
+		if self._watchdog is not None:
+			self._watchdog.cancel()
+
+	def _expired(self):
+		return self._watchdog is not None and self._watchdog.expired
+
+	def _read(self, amt=None):
+		self._arm()
+		try:
+			data = self.response.read(amt)
+		except (httplib.HTTPException, socket.error) as e:
+			if self._watchdog is not None:
+				self._watchdog.check()
+
+			deadline.check_timeout(e)
+			raise
+
+		if self._watchdog is not None:
+			self._watchdog.check()
+
+		return data
+
+	def _check_done(self):
+		if self.conn is not None and self.response.isclosed():
+			self._disarm()
+			self.pool.release(self.key, self.conn,
+							  reusable=not self.response.will_close and not self._expired())
+			self.conn = None
+
+	def read(self, amt=None):
+		if amt is None:
+			data = self._buffer + self._read()
+			self._buffer = ''
+
+		else:
+			if len(self._buffer) < amt:
+				self._buffer += self._read(amt - len(self._buffer))
+
+			data, self._buffer = self._buffer[:amt], self._buffer[amt:]
+
+		self._check_done()
+		return data
+
+	def readline(self):
+		while '\n' not in self._buffer:
+			chunk = self._read(self.chunk_size)
+			if chunk == '':
+				break
+
+			self._buffer += chunk
+
+		end = self._buffer.find('\n') + 1 or len(self._buffer)
+		line, self._buffer = self._buffer[:end], self._buffer[end:]
+		self._check_done()
+		return line
+
+	def __iter__(self):
+		while True:
+			line = self.readline()
+			if line == '':
+				return
+
+			yield line
+
+	def close(self):
+		"""Stop reading. If no more than `drain_limit` bytes of the body are left
+		they are read and discarded so the connection can be reused, otherwise the
+		connection is closed.
+		"""
+
+		if self.conn is None:
+			return
+
+		remaining = self.response.length
+		if remaining is not None and remaining <= self.drain_limit and not self._expired():
+			try:
+				self._read()
+			except (httplib.HTTPException, socket.error, deadline.DeadlineExceeded):
+				pass
+
+			self._check_done()
+			if self.conn is None:
+				return
+
+		self._disarm()
+		self.response.close()
+		self.pool.release(self.key, self.conn, reusable=False)
+		self.conn = None
+
+
+class ConnectionPool(object):
+	"""Keep up to `max_idle` open connections per router host, and send Basic
+	credentials pre-emptively once a host has asked for them, so that a warm poll
+	is a single request on an already open socket. Every request carries a
+	`User-Agent` header, and redirects are followed up to `max_redirects` times.
+
+	>>> pool = ConnectionPool()
+	>>> response = pool.urlopen('http://192.168.0.1/status', 'admin', '12345')
+	>>> page = response.read()
+
+	"""
+
+	max_redirects = 5
+
+	def __init__(self, max_idle=4, timeout=None, user_agent=USER_AGENT):
+		self.max_idle = max_idle
+		self.timeout = timeout
+		self.user_agent = user_agent
+		self._idle = {}
+		self._realms = {}
+		self._lock = threading.Lock()
+		self.connects = 0
+		# Basic authentication challenges answered, by 'host:port'
+		self.challenges = collections.Counter()
+
+	def _key(self, url):
+		parts = urlparse.urlsplit(url)
+		if parts.scheme not in ('http', 'https'):
+			raise ValueError('Cannot pool connections for URL {url}'.format(url=url))
+
+		default_port = 443 if parts.scheme == 'https' else 80
+		return (parts.scheme, parts.hostname, parts.port or default_port)
+
+	def acquire(self, key):
+		"""Return an idle connection to `key` and whether it was reused."""
+		with self._lock:
+			idle = self._idle.get(key)
+			if idle:
+				return idle.pop(), True
+
+		return self.connect(key), False
+
+	def connect(self, key):
+		"""Open a new connection to `key`."""
+		with self._lock:
+			self.connects += 1
+
+		scheme, host, port = key
+		if scheme == 'https':
+			return httplib.HTTPSConnection(host, port, timeout=self.timeout)
+
+		return httplib.HTTPConnection(host, port, timeout=self.timeout)
+
+	def release(self, key, conn, reusable=True):
+		"""Hand `conn` back for reuse, or close it."""
+		with self._lock:
+			idle = self._idle.setdefault(key, [])
+			if reusable and len(idle) < self.max_idle:
+				idle.append(conn)
+				return
+
+		conn.close()
+
+	def clear(self):
+		"""Close every idle connection."""
+		with self._lock:
+			idle, self._idle = self._idle, {}
+
+		for conns in idle.values():
+			for conn in conns:
+				conn.close()
+
+	def _connect_timeout(self):
+		if deadline.current() is None:
+			return self.timeout
+
+		cap = deadline.CONNECT_TIMEOUT
+		if self.timeout is not None:
+			cap = min(cap, self.timeout)
+
+		return deadline.timeout('connect', cap)
+
+	def _request(self, key, conn, reused, path, headers, method='GET', phase='request'):
+		try:
+			if not reused:
+				# connect explicitly, rather than inside request(), so it is timed separately
+				conn.timeout = self._connect_timeout()
+				with trace.span('http.connect', host=key[1]):
+					conn.connect()
+
+			# a pooled connection keeps the timeout of its last use
+			conn.sock.settimeout(deadline.timeout(phase, self.timeout))
+			with trace.span('http.request', host=key[1], reused=reused):
+				conn.request(method, path, headers=headers)
+				# Requests are never pipelined so a buffered reader cannot swallow the start
+				# of the next response, and it avoids one recv() per header byte
+				return conn.getresponse(buffering=True)
+
+		except socket.timeout as e:
+			deadline.check_timeout(e)
+			raise
+
+	def _send(self, key, path, headers, method='GET', phase='request'):
+		conn, reused = self.acquire(key)
+		try:
+			return conn, self._request(key, conn, reused, path, headers, method, phase)
+
+		except deadline.DeadlineExceeded:
+			conn.close()
+			raise
+
+		except (httplib.HTTPException, socket.error):
+			conn.close()
+			if not reused:
+				raise
+
+			# The router dropped an idle keep-alive connection; try a fresh one
+			logging.debug('Stale connection to {host}, reconnecting'.format(host=key[1]))
+			conn = self.connect(key)
+			try:
+				return conn, self._request(key, conn, False, path, headers, method, phase)
+			except deadline.DeadlineExceeded:
+				conn.close()
+				raise
+
+	def urlopen(self, url, user=None, password=None, headers=None, method='GET'):
+		"""GET `url`, answering a Basic authentication challenge with `user` and
+		`password` if one is made. Redirects are followed, but the credentials are
+		only sent on to the host they were given for. Raises `urllib2.HTTPError` for
+		any other status than 200, or 304 in answer to a conditional request.
+		`headers` are sent as well, and `method` may be 'HEAD' instead.
+		"""
+
+		headers = dict(headers or {})
+		headers.setdefault('User-Agent', self.user_agent)
+		host = self._key(url)
+		for _ in xrange(self.max_redirects + 1):
+			key = self._key(url)
+			if key != host:
+				user = password = None
+				headers.pop('Authorization', None)
+
+			conn, response = self._open(url, key, user, password, headers, method)
+			location = response.getheader('Location')
+			if response.status not in REDIRECTS or location is None:
+				break
+
+			response.read()
+			self.release(key, conn, reusable=not response.will_close)
+			logging.debug('Redirected from {url} to {location}'.format(url=url, location=location))
+			url = urlparse.urljoin(url, location)
+
+		else:
+			raise urllib2.HTTPError(url, response.status, 'Too many redirects', response.msg, None)
+
+		conditional = 'If-None-Match' in headers or 'If-Modified-Since' in headers
+		if response.status != 200 and not (response.status == 304 and conditional):
+			response.read()
+			self.release(key, conn, reusable=not response.will_close)
+			raise urllib2.HTTPError(url, response.status, response.reason, response.msg, None)
+
+		return PooledResponse(self, key, conn, response)
+
+	def _open(self, url, key, user, password, headers, method):
+		"""Send one request for `url`, and again with credentials if it is answered
+		with a Basic authentication challenge. Returns the connection and response.
+		"""
+
+		parts = urlparse.urlsplit(url)
+		path = parts.path or '/'
+		if parts.query:
+			path += '?' + parts.query
+
+		headers = dict(headers)
+		credentials = None
+		if user is not None:
+			credentials = 'Basic ' + base64.b64encode('{user}:{password}'.format(
+					user=user, password=password or ''))
+			if (key, user) in self._realms:
+				headers['Authorization'] = credentials
+
+		conn, response = self._send(key, path, headers, method)
+
+		if response.status == 401 and credentials is not None and 'Authorization' not in headers:
+			challenge = response.getheader('WWW-Authenticate') or ''
+			response.read()
+			self.release(key, conn, reusable=not response.will_close)
+
+			realm_obj = re.match(r'Basic realm="(.*)"', challenge)
+			if realm_obj is None:
+				raise ValueError('Could not find realm in {h}'.format(h=challenge))
+
+			with self._lock:
+				self._realms[(key, user)] = realm_obj.group(1)
+				self.challenges['{host}:{port}'.format(host=key[1], port=key[2])] += 1
+
+			headers['Authorization'] = credentials
+			with trace.span('http.auth_retry', host=key[1]):
+				conn, response = self._send(key, path, headers, method, phase='auth')
+
+		return conn, response
@@ -0,0 +1,165 @@
+#!/usr/bin/env python2.7
+
+"""Known router status page formats, so a router can be configured by model
+rather than with hand written `search`, `skip` and `match` rules.
+
+Each profile is a regular expression over the raw page whose groups pick out the
+addresses, starting with some literal text. The literal starts of every profile
+are combined into one expression which finds the places in the page where any
+profile could match, in a single pass, and only there is each profile's full
+expression tried. Once a router's profile is known only its own expression is
+used. Profiles are looked up by name in `PROFILES`, and sites can add their own
+with `register_profile()`.
+"""
+
+import re
+import logging
+import sre_parse
+import threading
+import collections
+import sre_constants
+
+# An IPv4 address in a page, before it is checked by `ddnsupdater.address`
+IPV4 = r'([0-9]{1,3}(?:\.[0-9]{1,3}){3})'
+
+Profile = collections.namedtuple('Profile', 'name pattern description')
+
+# Tried in this order where more than one could match at the same place
+PROFILES = collections.OrderedDict((profile.name, profile) for profile in (
+	Profile('sitecom-n300',
+			r'IP Address[^\n]*\n[^\n]*<td[^>]*>' + IPV4,
+			'Sitecom N300 s_internet.htm, the address in the cell after "IP Address"'),
+	Profile('dd-wrt',
+			r'\{wan_ipaddr::' + IPV4,
+			'DD-WRT Status_Internet.live.asp'),
+	Profile('openwrt',
+			r'"wan":\s*\{[^}]*?"ipaddr":\s*"' + IPV4,
+			'OpenWrt LuCI status JSON'),
+	Profile('tp-link',
+			r'var wanPara = new Array\([^)]*?"' + IPV4,
+			'TP-Link status.htm wanPara array'),
+	Profile('wan-ip',
+			r'WAN IP(?: [Aa]ddress)?:?\s*(?:<[^>]*>\s*)*' + IPV4,
+			'Any page labelling the address "WAN IP" or "WAN IP Address"'),
+	))
+
+
+def literal_start(pattern):
+	"""Return the literal text every match of the regular expression `pattern`
+	starts with, raising ValueError if there is none.
+	"""
+
+	start = []
+	for op, value in sre_parse.parse(pattern):
+		if op != sre_constants.LITERAL:
+			break
+
+		start.append(chr(value))
+
+	if len(start) == 0:
+		raise ValueError('Router profile pattern {pattern} must start with literal text'.format(
+				pattern=pattern))
+
+	return ''.join(start)
+
+
+def register_profile(name, pattern, description=''):
+	"""Make the page format `pattern` available as the profile called `name`."""
+	if re.compile(pattern).groups == 0:
+		raise ValueError('No groups in the pattern for profile {name}'.format(name=name))
+
+	literal_start(pattern)
+	PROFILES[name] = Profile(name, pattern, description)
+
+
+def find_profile(name):
+	"""Return the profile called `name`."""
+	if name not in PROFILES:
+		raise ValueError('Unknown router profile {name}. Choose from: auto, {names}'.format(
+				name=name, names=', '.join(PROFILES)))
+
+	return PROFILES[name]
+
+
+class Extractor(object):
+	"""Find the addresses in a router page using the profiles called `names`, or
+	every profile. The first page read decides which profile the router uses, and
+	later pages are matched with that profile alone unless it stops matching, e.g.
+	after a firmware upgrade.
+
+	>>> extractor = Extractor()
+	>>> extractor.extract(page)
+	'1.2.3.4'
+	>>> extractor.detected
+	'sitecom-n300'
+
+	"""
+
+	def __init__(self, names=None):
+		profiles = [find_profile(name) for name in names] if names else PROFILES.values()
+		if len(profiles) == 0:
+			raise ValueError('No router profiles to match')
+
+		self.patterns = collections.OrderedDict((p.name, re.compile(p.pattern)) for p in profiles)
+		self.starts = [(literal_start(p.pattern), p.name) for p in profiles]
+		# longest first, so where one start begins another the longer is found
+		self.combined = re.compile('|'.join(re.escape(start) for start in
+											 sorted(set(s for s, _ in self.starts),
+													key=len, reverse=True)))
+		self.detected = profiles[0].name if len(profiles) == 1 else None
+		self._lock = threading.Lock()
+
+	def detect(self, page):
+		"""Return the name of the first profile matching `page`, and its match, or
+		None and None.
+		"""
+
+		pos = 0
+		while True:
+			found = self.combined.search(page, pos)
+			if found is None:
+				return None, None
+
+			pos = found.start()
+			for start, name in self.starts:
+				if page.startswith(start, pos):
+					match_obj = self.patterns[name].match(page, pos)
+					if match_obj is not None:
+						return name, match_obj
+
+			pos += 1
+
+	def extract(self, page):
+		"""Return the addresses found in `page`, comma separated, raising ValueError if
+		no profile matches.
+		"""
+
+		detected = self.detected
+		if detected is not None:
+			match_obj = self.patterns[detected].search(page)
+			if match_obj is not None:
+				return ','.join(group for group in match_obj.groups() if group is not None)
+
+			if len(self.patterns) == 1:
+				raise ValueError('Page does not match router profile {name}'.format(name=detected))
+
+			logging.warning('Page no longer matches router profile {name}'.format(name=detected))
+
+		name, match_obj = self.detect(page)
+		if name is None:
+			raise ValueError('No router profile matches the page')
+
+		with self._lock:
+			if self.detected != name:
+				logging.info('Router page matches profile {name}'.format(name=name))
+				self.detected = name
+
+		return ','.join(group for group in match_obj.groups() if group is not None)
+
+
+def make_extractor(setting):
+	"""Return the `Extractor` for a `profile` setting, 'auto' for every profile or
+	a profile name.
+	"""
+
+	return Extractor(None if setting == 'auto' else [setting])
@@ -0,0 +1,224 @@
+#!/usr/bin/env python2.7
+
+"""Drivers for the protocols spoken by DDNS providers.
+
+A driver sends an update for one or more hosts and reads the provider's answer
+into a list of `Outcome`, one per host. Drivers are looked up by the push
+`protocol` option in `DRIVERS`.
+"""
+
+import re
+import urlparse
+import threading
+import collections
+
+from ddnsupdater import trace
+from ddnsupdater import dnsupdate
+from ddnsupdater import __version__
+
+Outcome = collections.namedtuple('Outcome', 'ok status message')
+
+
+class Driver(object):
+	"""Base class for HTTP update protocols.
+
+	`batch_param` names the query parameter which can take a comma separated list
+	of hosts so several records go in one request, or is None if the protocol has
+	no batch form. `headers` are sent with every update request. `permanent` holds
+	the statuses which the provider must not be sent again automatically.
+	"""
+
+	name = None
+	batch_param = None
+	headers = {}
+	permanent = ()
+
+	def update(self, pool, url, count):
+		"""Send the update request `url` covering `count` hosts using connections
+		from `pool`, returning a list of `count` outcomes.
+		"""
+
+		parts = urlparse.urlsplit(url)
+		response = pool.urlopen(url, parts.username, parts.password, self.headers)
+		try:
+			with trace.span('push.parse', protocol=self.name):
+				return self.parse(response, count)
+
+		finally:
+			response.close()
+
+	def parse(self, response, count):
+		"""Read the file-like `response` into `count` outcomes."""
+		raise NotImplementedError
+
+
+class NamecheapDriver(Driver):
+	"""namecheap.com's update URL, answering in XML.
+	Only the ErrCount, Done and first error elements are wanted, so the body is
+	scanned with regular expressions as it arrives rather than parsed into a tree,
+	and reading stops once they have been seen.
+	"""
+
+	name = 'namecheap'
+	chunk_size = 512
+
+	elements = re.compile(r'<(ErrCount|Done|Err1)>\s*(.*?)\s*</\1>', re.DOTALL)
+
+	def parse(self, response, count=1):
+		found = {}
+		body = ''
+		while 'ErrCount' not in found or 'Done' not in found:
+			chunk = response.read(self.chunk_size)
+			if chunk == '':
+				break
+
+			body += chunk
+			for element_obj in self.elements.finditer(body):
+				found.setdefault(element_obj.group(1), element_obj.group(2))
+
+		if 'ErrCount' not in found and 'Done' not in found:
+			return [Outcome(False, None, 'Could not decode server response: {body}'.format(
+						body=body))] * count
+
+		err_count = found.get('ErrCount', 'Could not decode error count')
+		done = found.get('Done', 'Could not decode done value')
+		message = 'errors {err} done {done}'.format(err=err_count, done=done)
+		if 'Err1' in found:
+			message += ': ' + found['Err1']
+
+		return [Outcome(err_count == '0' and done == 'true', err_count, message)] * count
+
+	# Sample response:
+
+	# <?xml version="1.0"?>
+	# <interface-response>
+	# <Command>SETDNSHOST</Command>
+	# <Language>eng</Language>
+	# <IP>87.186.224.7</IP>
+	# <ErrCount>0</ErrCount>
+	# <ResponseCount>0</ResponseCount>
+	# <Done>true</Done>
+	# <debug><![CDATA[]]></debug>
+	# </interface-response>
+
+
+class Dyndns2Driver(Driver):
+	"""The dyndns2 protocol used by DynDNS, No-IP and many others, answering with
+	one status line per host such as 'good 1.2.3.4' or 'badauth'.
+	"""
+
+	name = 'dyndns2'
+	batch_param = 'hostname'
+	# providers ask clients to identify themselves as "company - device - version"
+	# and may block a generic user agent
+	headers = {'User-Agent': 'mjem - ddns-updater - {version}'.format(version=__version__)}
+
+	success = ('good', 'nochg')
+	# the protocol forbids retrying these without the user's intervention, and a
+	# provider may block an account which does
+	permanent = ('badauth', 'nohost', 'abuse', 'notfqdn', 'badagent')
+
+	def parse(self, response, count=1):
+		lines = []
+		while len(lines) < count:
+			line = response.readline()
+			if line == '':
+				break
+
+			line = line.strip()
+			if line != '':
+				lines.append(line)
+
+		if len(lines) == 1 and count > 1:
+			# errors such as badauth answer a whole batch with a single line
+			lines = lines * count
+
+		if len(lines) != count:
+			return [Outcome(False, None, 'Expected {count} lines in response: {body}'.format(
+						count=count, body='\n'.join(lines)))] * count
+
+		return [Outcome(line.split()[0] in self.success, line.split()[0], line) for line in lines]
+
+
+class Rfc2136Driver(Driver):
+	"""Send RFC 2136 DNS UPDATE messages straight to an authoritative name server.
+	The push URL has the form
+
+	    dns://SERVER[:PORT]/ZONE?name=HOST&ip={ip}[&ttl=SECONDS]
+	        [&key=NAME&secret=BASE64[&algorithm=hmac-sha256]]
+
+	where HOST is relative to ZONE unless it ends with a dot. Use `ip={ip6}` to set
+	the AAAA record instead of the A record. With a key, messages
+	are signed with TSIG. Records for the same server and zone are sent as one
+	message, and the socket to each server is kept open between updates.
+	"""
+
+	name = 'rfc2136'
+	batch_param = 'name'
+	default_ttl = 300
+
+	def __init__(self):
+		self._clients = {}
+		self._lock = threading.Lock()
+
+	def client(self, server, port, key_name=None, secret=None, algorithm='hmac-sha256'):
+		"""Return the shared `dnsupdate.UpdateClient` for `server` and key."""
+		cache_key = (server, port, key_name, secret, algorithm)
+		with self._lock:
+			client = self._clients.get(cache_key)
+			if client is None:
+				key = None
+				if key_name is not None:
+					key = dnsupdate.TSIGKey(key_name, secret, algorithm)
+
+				client = self._clients[cache_key] = dnsupdate.UpdateClient(server, port, key)
+
+			return client
+
+	def update(self, pool, url, count):
+		parts = urlparse.urlsplit(url)
+		query = dict(urlparse.parse_qsl(parts.query))
+		zone = parts.path.strip('/')
+		if zone == '' or 'name' not in query or 'ip' not in query:
+			raise ValueError('RFC 2136 push URL needs a zone, name and ip: {url}'.format(url=url))
+
+		if 'key' in query and 'secret' not in query:
+			raise ValueError('RFC 2136 push URL has a key but no secret')
+
+		if '/' in query['ip']:
+			raise ValueError('RFC 2136 cannot set a prefix, only {ip} or {ip6}')
+
+		ttl = int(query.get('ttl', self.default_ttl))
+		names = query['name'].split(',')
+		message = dnsupdate.update_message(zone, [(name, query['ip'], ttl) for name in names])
+		client = self.client(parts.hostname,
+							 parts.port or 53,
+							 query.get('key'),
+							 query.get('secret'),
+							 query.get('algorithm', 'hmac-sha256'))
+		with trace.span('dns.send', server=parts.hostname, records=count):
+			rcode = client.send(message)
+		outcome = Outcome(rcode == 'NOERROR', rcode, 'server replied {rcode}'.format(rcode=rcode))
+		# an UPDATE succeeds or fails as a whole
+		return [outcome] * count
+
+
+DRIVERS = {
+	'namecheap': NamecheapDriver(),
+	'dyndns2': Dyndns2Driver(),
+	'rfc2136': Rfc2136Driver(),
+	}
+
+
+def register_driver(driver):
+	"""Make `driver` available under its `name` as a push protocol."""
+	DRIVERS[driver.name] = driver
+
+
+def find_driver(protocol):
+	"""Return the driver for the push `protocol`."""
+	try:
+		return DRIVERS[protocol]
+	except KeyError:
+		raise ValueError('Unknown push protocol {name}. Choose from: {names}'.format(
+				name=protocol, names=', '.join(sorted(DRIVERS))))
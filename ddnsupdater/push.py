@@ -0,0 +1,381 @@
+#!/usr/bin/env python2.7
+
+"""Update many DDNS records at once when an address changes"""
+
+import time
+import Queue
+import logging
+import urllib
+import urlparse
+import threading
+
+from ddnsupdater import trace
+from ddnsupdater import deadline
+from ddnsupdater import address
+from ddnsupdater.pool import ConnectionPool
+from ddnsupdater.providers import find_driver
+
+class PushRecord(object):
+	"""One DDNS entry to update.
+
+	name
+	    Label used in log messages and results
+
+	url
+	    Update URL containing `{ip}`, or `{ip6}` or `{prefix}` for an IPv6 record.
+		Basic authentication credentials may be given as user:password@ before the
+		host.
+
+	protocol
+	    Name of the `ddnsupdater.providers` driver which sends the update,
+		'namecheap' by default
+
+	"""
+
+	def __init__(self, name, url, protocol='namecheap'):
+		self.name = name
+		self.url = url
+		self.protocol = protocol
+		self.driver = find_driver(protocol)
+		# 'A', 'AAAA' or 'PREFIX', from the placeholder in the URL
+		self.record_type = address.url_record_type(url)
+
+	def __repr__(self):
+		return 'PushRecord({name})'.format(name=self.name)
+
+
+# `PushResult.status` of a record held back by the rate limit
+THROTTLED = 'throttled'
+
+
+class PushResult(object):
+	"""The outcome of updating one record. `status` is the provider's own result
+	code, such as 'good' or 'badauth' for dyndns2, None if there was no answer, or
+	`THROTTLED` if the request was not sent because of the rate limit, in which case
+	`retry_after` is the number of seconds to wait. `phase` names the part of the
+	request during which the poll's deadline ran out, if it did. `permanent` is set
+	for a failure which must not be retried, such as dyndns2's 'badauth'.
+	"""
+
+	def __init__(self, record, ok, message, elapsed=0.0, status=None, retry_after=None,
+				 phase=None):
+		self.record = record
+		self.ok = ok
+		self.message = message
+		self.elapsed = elapsed
+		self.status = status
+		self.retry_after = retry_after
+		self.phase = phase
+		self.permanent = not ok and status in record.driver.permanent
+
+	def __repr__(self):
+		return 'PushResult({name}, {status}, {message!r})'.format(
+			name=self.record.name, status='ok' if self.ok else 'failed', message=self.message)
+
+
+class PushError(Exception):
+	"""Raised when some records could not be updated. `phase` is set if that was
+	because the poll's deadline ran out, as for `ddnsupdater.deadline.DeadlineExceeded`.
+	"""
+
+	def __init__(self, results):
+		Exception.__init__(self, 'Failed to update {names}'.format(
+				names=', '.join(r.record.name for r in results if not r.ok)))
+		self.results = results
+		self.phase = next((r.phase for r in results if r.phase is not None), None)
+
+
+class Deferred(Exception):
+	"""Raised when some records were held back, to let a rapidly changing address
+	settle or to keep within a provider's rate limit. Nothing has failed: check
+	again after `delay` seconds.
+	"""
+
+	def __init__(self, delay, names):
+		Exception.__init__(self, 'Held back {names} for {delay:.1f}s'.format(
+				names=', '.join(names), delay=delay))
+		self.delay = delay
+		self.names = names
+
+
+def endpoint(url):
+	"""Return the (scheme, host, port) an update URL is sent to."""
+	parts = urlparse.urlsplit(url)
+	return parts.scheme, parts.hostname, parts.port
+
+
+def batches(records, ip):
+	"""Group `records` into requests, filling in the addresses `ip`. Returns a list
+	of (url, records) tuples where records of a batching protocol which differ only
+	in their host parameter share one URL.
+	"""
+
+	values = address.placeholders(ip)
+	requests = []
+	merged = {}
+	for record in records:
+		url = record.url.format(**values)
+		param = record.driver.batch_param
+		if param is None:
+			requests.append((url, [record]))
+			continue
+
+		parts = urlparse.urlsplit(url)
+		query = urlparse.parse_qsl(parts.query, keep_blank_values=True)
+		rest = tuple((key, value) for key, value in query if key != param)
+		key = (parts.scheme, parts.netloc, parts.path, rest, record.protocol)
+		if key not in merged:
+			merged[key] = ([], [])
+			requests.append((key, merged[key][1]))
+
+		merged[key][0].extend(value for name, value in query if name == param)
+		merged[key][1].append(record)
+
+	result = []
+	for url, batch in requests:
+		if isinstance(url, tuple):
+			scheme, netloc, path, rest, protocol = url
+			hosts = merged[url][0]
+			query = urllib.urlencode(rest)
+			query += '{amp}{param}={hosts}'.format(amp='&' if query else '',
+												   param=find_driver(protocol).batch_param,
+												   hosts=urllib.quote(','.join(hosts), safe=','))
+			url = urlparse.urlunsplit((scheme, netloc, path, query, ''))
+
+		result.append((url, batch))
+
+	return result
+
+
+def send(pool, url, records):
+	"""Make one update request for `records` and return their results."""
+	start = time.time()
+	try:
+		with trace.span('push.request', host=endpoint(url)[1], records=len(records)):
+			outcomes = records[0].driver.update(pool, url, len(records))
+	except Exception as e:
+		elapsed = time.time() - start
+		return [PushResult(record, False, str(e), elapsed, phase=getattr(e, 'phase', None))
+				for record in records]
+
+	elapsed = time.time() - start
+	return [PushResult(record, outcome.ok, outcome.message, elapsed, outcome.status)
+			for record, outcome in zip(records, outcomes)]
+
+
+def push_records(records, ip, pool=None, max_workers=8, per_endpoint=2, limiter=None,
+				 stale_since=None):
+	"""Update every record in `records` to `ip`, returning a list of `PushResult`.
+	`ip` may hold several addresses, as described in `ddnsupdater.address`; each
+	record takes the one for its type.
+
+	Records for the same provider endpoint are batched into one request where the
+	protocol allows. Requests run concurrently on up to `max_workers` threads,
+	with no more than `per_endpoint` at a time to any one provider, reusing
+	connections from `pool`.
+
+	With a `ddnsupdater.ratelimit.RateLimiter` as `limiter`, a request is only sent
+	if its provider has a token to spare, or else its records get a `THROTTLED`
+	result. `stale_since` maps record names to the time each began to need an
+	update, so the stalest records are let through first.
+	"""
+
+	if pool is None:
+		pool = ConnectionPool()
+
+	requests = batches(records, ip)
+	# split each endpoint's requests into `per_endpoint` lanes, each sent in order on
+	# one connection
+	lanes = {}
+	for request in requests:
+		endpoint_lanes, count = lanes.get(endpoint(request[0]), ([], 0))
+		if len(endpoint_lanes) < per_endpoint:
+			endpoint_lanes.append([])
+
+		endpoint_lanes[count % len(endpoint_lanes)].append(request)
+		lanes[endpoint(request[0])] = (endpoint_lanes, count + 1)
+
+	work = Queue.Queue()
+	for endpoint_lanes, _ in lanes.values():
+		for lane in endpoint_lanes:
+			work.put(lane)
+
+	results = {}
+	lock = threading.Lock()
+	# the workers keep to the deadline of the poll which called this
+	budget = deadline.current()
+
+	def worker():
+		with deadline.scope(budget):
+			send_lanes()
+
+	def send_lanes():
+		while True:
+			try:
+				lane = work.get_nowait()
+			except Queue.Empty:
+				return
+
+			for url, batch in lane:
+				wait = 0
+				if limiter is not None:
+					since = min((stale_since or {}).get(r.name, 0) for r in batch)
+					wait = limiter.acquire(endpoint(url)[1], batch[0].name, since)
+
+				if wait > 0:
+					batch_results = [PushResult(record, False, 'rate limited', status=THROTTLED,
+												retry_after=wait) for record in batch]
+
+				else:
+					batch_results = send(pool, url, batch)
+
+				with lock:
+					for result in batch_results:
+						results[id(result.record)] = result
+
+	threads = [threading.Thread(target=worker, name='ddns-push')
+			   for _ in xrange(min(max_workers, work.qsize()))]
+	for thread in threads:
+		thread.start()
+
+	for thread in threads:
+		thread.join()
+
+	return [results[id(record)] for record in records]
+
+
+class Pusher(object):
+	"""Push function for an `ddnsupdater.engine.Target` which updates several
+	records. Each record remembers the address it was last set to, so after a
+	partial failure only the failed records are sent again, and when only the IPv6
+	address changes the A records are left alone. With a
+	`ddnsupdater.state.StateStore` as `state` this survives restarts.
+
+	A record which has been set before is only changed once its new address has
+	been seen unchanged for `debounce` seconds, so a flapping link costs one update
+	rather than one per change, but never held back for more than `max_debounce`
+	seconds. Requests go through `limiter`, a `ddnsupdater.ratelimit.RateLimiter`,
+	if one is given. Held back records raise `Deferred`.
+
+	A record whose provider answers with a permanent failure, such as a bad
+	password, is not sent again until `unblock()` is called when the configuration
+	is reloaded.
+
+	Calling the pusher returns whether any record was updated, which it may not be
+	when every record already holds the address or is refused for good.
+	"""
+
+	def __init__(self, records, pool=None, max_workers=8, state=None, limiter=None, debounce=0,
+				 max_debounce=300, clock=time.time):
+		self.records = list(records)
+		self.pool = pool if pool is not None else ConnectionPool()
+		self.max_workers = max_workers
+		self.state = state
+		self.limiter = limiter
+		self.debounce = debounce
+		self.max_debounce = max_debounce
+		self.clock = clock
+		self.pushed = {}
+		self.results = []
+		# the message of each record refused for good
+		self.blocked = {}
+		# when each record began to need an update, and the address it was last
+		# seen needing with the time that address was first seen
+		self.stale_since = {}
+		self._seen = {}
+		if state is not None:
+			for record in self.records:
+				saved = state.record(record.name)
+				if saved is not None:
+					self.pushed[record.name] = saved.ip
+
+	def unblock(self):
+		"""Send the records refused for good again at the next push. Returns whether
+		there were any.
+		"""
+
+		blocked, self.blocked = self.blocked, {}
+		return len(blocked) > 0
+
+	def settle(self, record, wanted, now):
+		"""Return how many more seconds `record` should wait for its new address
+		`wanted` to settle, or 0 to send it now.
+		"""
+
+		stale_since = self.stale_since.setdefault(record.name, now)
+		seen, seen_at = self._seen.get(record.name, (None, None))
+		if seen != wanted:
+			self._seen[record.name] = (wanted, now)
+			seen_at = now
+
+		if self.debounce <= 0 or record.name not in self.pushed:
+			# nothing to debounce the first time a record is set
+			return 0
+
+		return max(0, min(seen_at + self.debounce, stale_since + self.max_debounce) - now)
+
+	def __call__(self, ip):
+		addresses = address.split(ip)
+		now = self.clock()
+		pending = []
+		held = {}
+		for record in self.records:
+			wanted = addresses.get(record.record_type)
+			if wanted is None:
+				logging.debug('{name}: no {type} address to push'.format(
+						name=record.name, type=record.record_type))
+				continue
+
+			if self.pushed.get(record.name) == wanted:
+				self.stale_since.pop(record.name, None)
+				self._seen.pop(record.name, None)
+				continue
+
+			if record.name in self.blocked:
+				logging.debug('{name}: not updated since {message}'.format(
+						name=record.name, message=self.blocked[record.name]))
+				continue
+
+			wait = self.settle(record, wanted, now)
+			if wait > 0:
+				held[record.name] = wait
+
+			else:
+				pending.append(record)
+
+		self.results = push_records(pending, ip, self.pool, self.max_workers, limiter=self.limiter,
+									stale_since=self.stale_since)
+		for result in self.results:
+			if result.ok:
+				pushed = addresses[result.record.record_type]
+				self.pushed[result.record.name] = pushed
+				self.stale_since.pop(result.record.name, None)
+				self._seen.pop(result.record.name, None)
+				if self.state is not None:
+					self.state.pushed(result.record.name, pushed, result.status)
+
+				logging.info('{name}: updated, {message}'.format(
+						name=result.record.name, message=result.message))
+
+			elif result.status == THROTTLED:
+				held[result.record.name] = result.retry_after
+
+			elif result.permanent:
+				self.blocked[result.record.name] = result.message
+				self.stale_since.pop(result.record.name, None)
+				self._seen.pop(result.record.name, None)
+				logging.error(('{name}: update refused, {message}. Not trying again until '
+							   'the configuration is reloaded').format(
+						name=result.record.name, message=result.message))
+
+			else:
+				logging.error('{name}: update failed, {message}'.format(
+						name=result.record.name, message=result.message))
+
+		if any(not r.ok and r.status != THROTTLED for r in self.results):
+			raise PushError(self.results)
+
+		if len(held) > 0:
+			raise Deferred(min(held.values()), sorted(held))
+
+		return any(result.ok for result in self.results)
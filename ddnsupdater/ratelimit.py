@@ -0,0 +1,117 @@
+#!/usr/bin/env python2.7
+
+"""Keep the requests sent to each DDNS provider within its quota."""
+
+import time
+import bisect
+import threading
+
+
+class TokenBucket(object):
+	"""Allow `rate` requests per second on average, in bursts of up to `burst`,
+	starting full at time `now`.
+	"""
+
+	def __init__(self, rate, burst, now):
+		self.rate = float(rate)
+		self.burst = burst
+		self.tokens = float(burst)
+		self.updated = now
+
+	def refill(self, now):
+		self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+		self.updated = now
+
+
+class WaitQueue(object):
+	"""The callers waiting for one host's tokens, ordered by how long their records
+	have been stale.
+	"""
+
+	def __init__(self):
+		self.order = []
+		self.entries = {}
+		self.purged = 0
+
+	def ahead(self, stale_since):
+		"""Return the number of callers stale for longer than since `stale_since`."""
+		return bisect.bisect_left(self.order, (stale_since,))
+
+	def add(self, key, stale_since, expires):
+		entry = self.entries.get(key)
+		if entry is not None and entry[0] == stale_since:
+			self.entries[key] = (stale_since, expires)
+			return
+
+		self.remove(key)
+		self.entries[key] = (stale_since, expires)
+		bisect.insort(self.order, (stale_since, key))
+
+	def remove(self, key):
+		entry = self.entries.pop(key, None)
+		if entry is not None:
+			del self.order[bisect.bisect_left(self.order, (entry[0], key))]
+
+	def purge(self, now):
+		"""Drop callers which did not come back in time."""
+		for key, (_, expires) in self.entries.items():
+			if expires < now:
+				self.remove(key)
+
+		self.purged = now
+
+
+class RateLimiter(object):
+	"""One `TokenBucket` per provider host, all with the same `rate` (requests per
+	second) and `burst`.
+
+	Callers never block. `acquire()` either takes a token or says how long to wait
+	before asking again. While tokens are short they are kept for the callers which
+	have been waiting with the stalest records, so when a whole fleet changes
+	address at once the records left wrong longest are updated first. A waiting
+	caller which does not ask again within `grace` seconds of its turn gives up its
+	place.
+	"""
+
+	def __init__(self, rate, burst=1, grace=5, clock=time.time):
+		if rate <= 0:
+			raise ValueError('The push rate must be above 0')
+
+		self.rate = float(rate)
+		self.burst = burst
+		self.grace = grace
+		self.clock = clock
+		self.throttled = 0
+		self._buckets = {}
+		self._waiting = {}
+		self._lock = threading.Lock()
+
+	def acquire(self, host, key, stale_since):
+		"""Ask to send a request to `host` for the caller `key`, such as a record name,
+		whose records have needed updating since time `stale_since`. Returns 0 if the
+		request may be sent now, or else the seconds to wait before asking again.
+		"""
+
+		with self._lock:
+			now = self.clock()
+			bucket = self._buckets.get(host)
+			if bucket is None:
+				bucket = self._buckets[host] = TokenBucket(self.rate, self.burst, now)
+				self._waiting[host] = WaitQueue()
+
+			bucket.refill(now)
+			waiting = self._waiting[host]
+			if now - waiting.purged >= 1:
+				waiting.purge(now)
+
+			# tokens are kept back for every caller waiting ahead of this one
+			ahead = waiting.ahead(stale_since)
+			if bucket.tokens - ahead >= 1:
+				bucket.tokens -= 1
+				waiting.remove(key)
+				return 0
+
+			wait = (ahead + 1 - bucket.tokens) / self.rate
+			waiting.add(key, stale_since, now + wait + self.grace)
+			self.throttled += 1
+			return wait
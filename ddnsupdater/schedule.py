@@ -0,0 +1,75 @@
+#!/usr/bin/env python2.7
+
+"""Decide when to poll a target next"""
+
+import time
+import random
+
+
+class Schedule(object):
+	"""Per-target poll timing.
+
+	period
+	    Seconds between polls while everything is working and nothing changes
+
+	retry
+	    Delay before the first retry after a failure. Each further consecutive
+		failure doubles it, up to `max_backoff`.
+
+	recheck
+	    Delay before the first poll after the address changes, since a reconnecting
+		ISP link often changes again shortly afterwards. It doubles on each poll
+		until it reaches `period`.
+
+	jitter
+	    Fraction by which every delay is randomly stretched or shrunk, so that many
+		instances started together do not poll in lockstep
+
+	`clock` and `rng` can be replaced for testing.
+
+	>>> schedule = Schedule(period=600, retry=30)
+	>>> time.sleep(schedule.next_delay(ok=False, changed=False))
+
+	"""
+
+	def __init__(self, period, retry=60, max_backoff=None, recheck=60, jitter=0.1,
+				 clock=time.time, rng=random.random):
+		self.period = period
+		self.retry = min(retry, period)
+		self.max_backoff = max_backoff if max_backoff is not None else period
+		self.recheck = min(recheck, period)
+		self.jitter = jitter
+		self.clock = clock
+		self.rng = rng
+		self.failures = 0
+		self.since_change = None
+		self.last_success = None
+
+	def _jittered(self, delay):
+		return delay * (1 + self.jitter * (2 * self.rng() - 1))
+
+	def next_delay(self, ok, changed):
+		"""Record the outcome of a poll and return the seconds until the next one."""
+		if not ok:
+			self.failures += 1
+			delay = min(self.max_backoff, self.retry * 2 ** (self.failures - 1))
+			return self._jittered(delay)
+
+		self.failures = 0
+		self.last_success = self.clock()
+		if changed:
+			self.since_change = 0
+
+		if self.since_change is not None:
+			delay = self.recheck * 2 ** self.since_change
+			self.since_change += 1
+			if delay < self.period:
+				return self._jittered(delay)
+
+			self.since_change = None
+
+		return self._jittered(self.period)
+
+	def next_check(self, ok, changed):
+		"""Like `next_delay()` but returns the absolute time of the next poll."""
+		return self.clock() + self.next_delay(ok, changed)
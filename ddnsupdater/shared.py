@@ -0,0 +1,147 @@
+#!/usr/bin/env python2.7
+
+"""Share one fetch of the external address between every target reading it from
+the same place, e.g. many DDNS entries behind one router.
+"""
+
+import time
+import threading
+
+from ddnsupdater import deadline
+from ddnsupdater.deadline import DeadlineExceeded
+
+
+class Flight(object):
+	"""One fetch in progress, which later callers wait for."""
+
+	def __init__(self):
+		self.done = threading.Event()
+		self.value = None
+		self.error = None
+
+
+class SharedFetch(object):
+	"""Wrap the fetch function `fetch` so that calls made while a fetch is in
+	progress wait for it and share its result (single-flight), and calls within
+	`max_age` seconds of a successful fetch reuse its result without fetching.
+	Failures are passed to the callers waiting at the time but never reused.
+	`invalidate()` makes the next call fetch afresh.
+
+	Functions added with `subscribe()` are called with this object and the address
+	after each fetch which succeeds.
+	"""
+
+	def __init__(self, fetch, max_age=5, clock=time.time):
+		self.fetch = fetch
+		self.max_age = max_age
+		self.clock = clock
+		self.fetches = 0
+		self.shared = 0
+		self._listeners = []
+		self._value = None
+		self._when = None
+		self._flight = None
+		# bumped by invalidate(), so a fetch started before it is not kept
+		self._generation = 0
+		self._lock = threading.Lock()
+
+	def __repr__(self):
+		return 'SharedFetch({fetch!r})'.format(fetch=self.fetch)
+
+	def subscribe(self, callback):
+		self._listeners.append(callback)
+
+	def invalidate(self):
+		"""Forget the last result, and let no later call join the fetch in progress,
+		e.g. when an event says the address has just changed and an answer read
+		before it would be stale.
+		"""
+
+		with self._lock:
+			self._when = None
+			self._flight = None
+			self._generation += 1
+
+	def __call__(self):
+		with self._lock:
+			if self._when is not None and self.clock() - self._when < self.max_age:
+				self.shared += 1
+				return self._value
+
+			flight = self._flight
+			leader = flight is None
+			if leader:
+				flight = self._flight = Flight()
+				generation = self._generation
+				self.fetches += 1
+
+			else:
+				self.shared += 1
+
+		if not leader:
+			# no longer than this caller's own deadline allows
+			if not flight.done.wait(deadline.timeout('shared')):
+				raise DeadlineExceeded('shared', deadline.current().budget)
+
+			if flight.error is not None:
+				raise flight.error
+
+			return flight.value
+
+		try:
+			flight.value = self.fetch()
+			with self._lock:
+				if self._generation == generation:
+					self._value, self._when = flight.value, self.clock()
+
+		except Exception as e:
+			flight.error = e
+			raise
+
+		finally:
+			with self._lock:
+				if self._flight is flight:
+					self._flight = None
+
+			flight.done.set()
+
+		for callback in list(self._listeners):
+			callback(self, flight.value)
+
+		return flight.value
+
+
+class SharedFetches(object):
+	"""Hand out one `SharedFetch` per source, identified by a hashable key such as
+	its settings, so targets with identical settings share it.
+	"""
+
+	def __init__(self, max_age=5):
+		self.max_age = max_age
+		self._fetches = {}
+		self._listeners = []
+		self._lock = threading.Lock()
+
+	def __len__(self):
+		return len(self._fetches)
+
+	def get(self, key, fetch):
+		"""Return the `SharedFetch` for `key`, wrapping `fetch` if there is none yet."""
+		with self._lock:
+			shared = self._fetches.get(key)
+			if shared is None:
+				shared = self._fetches[key] = SharedFetch(fetch, self.max_age)
+				for callback in self._listeners:
+					shared.subscribe(callback)
+
+			return shared
+
+	def subscribe(self, callback):
+		"""Call `callback(shared_fetch, ip)` after each successful fetch of any source,
+		including ones added later.
+		"""
+
+		with self._lock:
+			self._listeners.append(callback)
+			for shared in self._fetches.values():
+				shared.subscribe(callback)
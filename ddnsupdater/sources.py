@@ -0,0 +1,280 @@
+#!/usr/bin/env python2.7
+
+"""Ways of finding the current external IP address other than scraping a router
+status page.
+
+Each source is a function taking its configuration as keyword arguments and
+returning the address as a string. Sources are looked up by name in `SOURCES`;
+a name containing a dot is imported as `package.module.function`, so sites can
+plug in their own.
+"""
+
+import re
+import fcntl
+import socket
+import struct
+import urllib2
+import logging
+import importlib
+import urlparse
+import threading
+
+from ddnsupdater import deadline
+
+# from linux/sockios.h
+SIOCGIFADDR = 0x8915
+
+# IFA_F_TEMPORARY, IFA_F_DEPRECATED, IFA_F_TENTATIVE and IFA_F_DADFAILED from
+# linux/if_addr.h
+IPV6_SKIP_FLAGS = 0x01 | 0x08 | 0x20 | 0x40
+
+NATPMP_PORT = 5351
+
+SSDP_ADDRESS = ('239.255.255.250', 1900)
+
+WAN_SERVICES = ('urn:schemas-upnp-org:service:WANIPConnection:1',
+				'urn:schemas-upnp-org:service:WANPPPConnection:1')
+
+_ioctl_socket = None
+
+
+def interface_ip(interface):
+	"""Read the IPv4 address assigned to a local network `interface`, such as
+	'ppp0', straight from the kernel. Use on hosts which hold the public address
+	themselves.
+	"""
+
+	global _ioctl_socket
+	if _ioctl_socket is None:
+		_ioctl_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+	try:
+		ifreq = fcntl.ioctl(_ioctl_socket.fileno(),
+							SIOCGIFADDR,
+							struct.pack('256s', interface[:15]))
+	except IOError as e:
+		raise ValueError('Cannot read address of interface {interface}: {err}'.format(
+				interface=interface, err=e.strerror))
+
+	return socket.inet_ntoa(ifreq[20:24])
+
+
+def interface_ip6(interface):
+	"""Read the global IPv6 addresses of `interface` from /proc/net/if_inet6, leaving
+	out temporary (privacy) addresses and ones which are deprecated or not yet
+	usable. Returns a list, empty if there are none.
+	"""
+
+	addresses = []
+	try:
+		with open('/proc/net/if_inet6') as h:
+			for line in h:
+				hex_address, _, _, scope, flags, name = line.split()
+				if name != interface or int(scope, 16) != 0 or int(flags, 16) & IPV6_SKIP_FLAGS:
+					continue
+
+				addresses.append(socket.inet_ntop(socket.AF_INET6, hex_address.decode('hex')))
+
+	except IOError:
+		# no IPv6 support in this kernel
+		pass
+
+	return addresses
+
+
+def interface_addresses(interface):
+	"""Return the IPv4 address of `interface` and its first global IPv6 address,
+	comma separated, whichever of them it has.
+	"""
+
+	addresses = interface_ip6(interface)[:1]
+	try:
+		addresses.insert(0, interface_ip(interface))
+	except ValueError:
+		if len(addresses) == 0:
+			raise
+
+	return ','.join(addresses)
+
+
+def default_gateway():
+	"""Return the IPv4 address of the default route's gateway, from /proc/net/route."""
+	with open('/proc/net/route') as h:
+		for line in h:
+			fields = line.split()
+			# destination 0.0.0.0 with the RTF_GATEWAY flag set
+			if fields[1] == '00000000' and int(fields[3], 16) & 2:
+				return socket.inet_ntoa(struct.pack('<L', int(fields[2], 16)))
+
+	raise ValueError('No default gateway found')
+
+
+def natpmp_ip(gateway=None, timeout=0.25, retries=4):
+	"""Ask the `gateway` router for its external address using NAT-PMP (RFC 6886).
+	The gateway defaults to the default route. The request is retried `retries`
+	times, doubling the `timeout` each time.
+	"""
+
+	if gateway is None:
+		gateway = default_gateway()
+
+	sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+	try:
+		sock.connect((gateway, NATPMP_PORT))
+		for _ in xrange(retries):
+			sock.settimeout(deadline.timeout('request', timeout))
+			sock.send(struct.pack('!BB', 0, 0))
+			try:
+				response = sock.recv(16)
+			except socket.timeout as e:
+				deadline.check_timeout(e)
+				timeout *= 2
+				continue
+
+			if len(response) < 12:
+				raise ValueError('Short NAT-PMP response from {gateway}'.format(gateway=gateway))
+
+			version, opcode, result = struct.unpack('!BBH', response[:4])
+			if opcode != 128 or result != 0:
+				raise ValueError('NAT-PMP request to {gateway} failed with result {result}'.format(
+						gateway=gateway, result=result))
+
+			return socket.inet_ntoa(response[8:12])
+
+	finally:
+		sock.close()
+
+	raise ValueError('No NAT-PMP response from {gateway}'.format(gateway=gateway))
+
+
+def read_url(url, timeout):
+	"""Return the body of `url`, a URL or `urllib2.Request`, waiting no more than
+	`timeout` seconds at a time and keeping to the poll's deadline.
+	"""
+
+	try:
+		response = deadline.guard(urllib2.urlopen(url, timeout=deadline.timeout('request', timeout)))
+		try:
+			return response.read()
+		finally:
+			response.close()
+
+	except (urllib2.URLError, socket.timeout) as e:
+		deadline.check_timeout(e)
+		raise
+
+
+# UPnP control URLs found by SSDP discovery, so later polls go straight to the router
+_upnp_control = {}
+_upnp_lock = threading.Lock()
+
+
+def discover_upnp(timeout=2):
+	"""Find the control URL and service type of the local Internet gateway device
+	with an SSDP search.
+	"""
+
+	search = '\r\n'.join(['M-SEARCH * HTTP/1.1',
+						  'HOST: {host}:{port}'.format(host=SSDP_ADDRESS[0], port=SSDP_ADDRESS[1]),
+						  'MAN: "ssdp:discover"',
+						  'MX: 1',
+						  'ST: urn:schemas-upnp-org:device:InternetGatewayDevice:1',
+						  '', ''])
+	sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+	try:
+		sock.settimeout(deadline.timeout('request', timeout))
+		sock.sendto(search, SSDP_ADDRESS)
+		try:
+			reply = sock.recv(4096)
+		except socket.timeout as e:
+			deadline.check_timeout(e)
+			raise ValueError('No UPnP Internet gateway device found')
+
+	finally:
+		sock.close()
+
+	location_obj = re.search(r'^location:\s*(\S+)', reply, re.IGNORECASE | re.MULTILINE)
+	if location_obj is None:
+		raise ValueError('No location in SSDP reply {reply}'.format(reply=reply))
+
+	location = location_obj.group(1)
+	description = read_url(location, timeout)
+	for service in WAN_SERVICES:
+		service_obj = re.search(
+			r'<serviceType>' + re.escape(service) + r'</serviceType>.*?<controlURL>(.*?)</controlURL>',
+			description, re.DOTALL)
+		if service_obj is not None:
+			return urlparse.urljoin(location, service_obj.group(1).strip()), service
+
+	raise ValueError('Gateway at {location} has no WAN connection service'.format(
+			location=location))
+
+
+def upnp_ip(url=None, service=WAN_SERVICES[0], timeout=2):
+	"""Ask a UPnP Internet gateway device for its external address. `url` is the
+	WAN connection service's control URL; if not given it is discovered with SSDP
+	and remembered until a request to it fails.
+	"""
+
+	discovered = url is None
+	if discovered:
+		with _upnp_lock:
+			if 'discovered' not in _upnp_control:
+				_upnp_control['discovered'] = discover_upnp(timeout)
+
+			url, service = _upnp_control['discovered']
+
+	body = ('<?xml version="1.0"?>'
+			'<s:Envelope xmlns:s="http://schemas.xmlsoap.org/soap/envelope/" '
+			's:encodingStyle="http://schemas.xmlsoap.org/soap/encoding/">'
+			'<s:Body><u:GetExternalIPAddress xmlns:u="{service}"/></s:Body>'
+			'</s:Envelope>').format(service=service)
+	request = urllib2.Request(url, body, {
+			'Content-Type': 'text/xml; charset="utf-8"',
+			'SOAPAction': '"{service}#GetExternalIPAddress"'.format(service=service)})
+	try:
+		response = read_url(request, timeout)
+	except (urllib2.URLError, socket.error):
+		if discovered:
+			# miniupnpd picks a new port each time it starts, so after a router
+			# reboot the device is found again on the next poll
+			with _upnp_lock:
+				if _upnp_control.get('discovered') == (url, service):
+					del _upnp_control['discovered']
+
+		raise
+
+	ip_obj = re.search(r'<NewExternalIPAddress>\s*([^<\s]+)\s*</NewExternalIPAddress>', response)
+	if ip_obj is None:
+		logging.debug('UPnP response: ' + response)
+		raise ValueError('No external address in UPnP response from {url}'.format(url=url))
+
+	return ip_obj.group(1)
+
+
+SOURCES = {
+	'interface': interface_addresses,
+	'natpmp': natpmp_ip,
+	'upnp': upnp_ip,
+	}
+
+
+def register_source(name, function):
+	"""Make `function` available as the IP source called `name`."""
+	SOURCES[name] = function
+
+
+def find_source(name):
+	"""Return the IP source function called `name`."""
+	if name in SOURCES:
+		return SOURCES[name]
+
+	if '.' in name:
+		module_name, _, function_name = name.rpartition('.')
+		try:
+			return getattr(importlib.import_module(module_name), function_name)
+		except (ImportError, AttributeError) as e:
+			raise ValueError('Cannot load IP source {name}: {err}'.format(name=name, err=e))
+
+	raise ValueError('Unknown IP source {name}. Choose from: {names}'.format(
+			name=name, names=', '.join(sorted(SOURCES.keys() + ['router']))))
@@ -0,0 +1,103 @@
+#!/usr/bin/env python2.7
+
+"""Remember addresses and push results between runs"""
+
+import os
+import time
+import sqlite3
+import threading
+import collections
+
+TargetState = collections.namedtuple('TargetState', 'ip checked changed')
+
+RecordState = collections.namedtuple('RecordState', 'ip status pushed')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS targets (
+	name TEXT PRIMARY KEY,
+	ip TEXT,
+	checked REAL,
+	changed REAL
+);
+CREATE TABLE IF NOT EXISTS records (
+	name TEXT PRIMARY KEY,
+	ip TEXT,
+	status TEXT,
+	pushed REAL
+);
+"""
+
+
+def write_statefile(statefile, ip):
+	"""Replace the contents of the plain text `statefile` with `ip` atomically, so a
+	crash part way through never leaves it empty or truncated.
+	"""
+
+	temp = statefile + '.tmp'
+	with open(temp, 'w') as h:
+		h.write(ip)
+		h.flush()
+		os.fsync(h.fileno())
+
+	os.rename(temp, statefile)
+
+
+class StateStore(object):
+	"""State of many targets and their DDNS records kept in an SQLite database.
+
+	Everything is loaded into memory when the store is opened so lookups are dict
+	lookups, and every change is written straight through. The database runs in
+	write-ahead log mode, so a crash loses at most the last few changes and never
+	corrupts the file; a record is only marked as pushed once its provider has
+	accepted the update, so nothing is pushed twice after a restart.
+	Safe to share between threads. Several processes may open the same database,
+	as long as each writes only its own targets; a writer waits up to `timeout`
+	seconds for another to finish.
+	"""
+
+	def __init__(self, path, clock=time.time, timeout=30):
+		self.path = path
+		self.clock = clock
+		self._lock = threading.Lock()
+		self._db = sqlite3.connect(path, timeout=timeout, check_same_thread=False)
+		self._db.execute('PRAGMA journal_mode=WAL')
+		self._db.execute('PRAGMA synchronous=NORMAL')
+		self._db.executescript(SCHEMA)
+		self.targets = dict(
+			(row[0], TargetState(*row[1:]))
+			for row in self._db.execute('SELECT name, ip, checked, changed FROM targets'))
+		self.records = dict(
+			(row[0], RecordState(*row[1:]))
+			for row in self._db.execute('SELECT name, ip, status, pushed FROM records'))
+
+	def close(self):
+		with self._lock:
+			self._db.close()
+
+	def target(self, name):
+		"""Return the `TargetState` of target `name`, or None if it is not known."""
+		return self.targets.get(name)
+
+	def record(self, name):
+		"""Return the `RecordState` of DDNS record `name`, or None if it is not known."""
+		return self.records.get(name)
+
+	def checked(self, name, ip):
+		"""Note that target `name` was just seen to have address `ip`."""
+		now = self.clock()
+		with self._lock:
+			old = self.targets.get(name)
+			changed = old.changed if old is not None and old.ip == ip else now
+			self.targets[name] = TargetState(ip, now, changed)
+			with self._db:
+				self._db.execute('INSERT OR REPLACE INTO targets VALUES (?, ?, ?, ?)',
+								 (name, ip, now, changed))
+
+	def pushed(self, name, ip, status):
+		"""Note that DDNS record `name` was updated to `ip`, with provider `status`."""
+		now = self.clock()
+		with self._lock:
+			self.records[name] = RecordState(ip, status, now)
+			with self._db:
+				self._db.execute('INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?)',
+								 (name, ip, status, now))
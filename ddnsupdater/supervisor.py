@@ -0,0 +1,160 @@
+#!/usr/bin/env python2.7
+
+"""Spread the named targets over several worker processes.
+
+Each target belongs to one worker, chosen by consistent hashing of its name, so
+adding or removing a target never moves the others. A worker which dies is
+started again with the same number and so picks up the same targets.
+"""
+
+import os
+import time
+import bisect
+import signal
+import struct
+import hashlib
+import logging
+import multiprocessing
+
+
+def hash_key(text):
+	return struct.unpack('>Q', hashlib.md5(text).digest()[:8])[0]
+
+
+class HashRing(object):
+	"""Consistent hashing of names onto `nodes`. Each node is placed at `replicas`
+	points around the ring to even out the share each one gets.
+
+	>>> ring = HashRing(range(4))
+	>>> ring.node('home')
+	2
+
+	"""
+
+	def __init__(self, nodes, replicas=100):
+		points = sorted((hash_key('{node}-{n}'.format(node=node, n=n)), node)
+						for node in nodes for n in xrange(replicas))
+		if len(points) == 0:
+			raise ValueError('A hash ring needs at least one node')
+
+		self._keys = [key for key, _ in points]
+		self._nodes = [node for _, node in points]
+
+	def node(self, name):
+		"""Return the node `name` belongs to."""
+		index = bisect.bisect(self._keys, hash_key(name))
+		return self._nodes[index % len(self._nodes)]
+
+
+class Supervisor(object):
+	"""Run `work(index, count)` in `count` child processes, numbered from 0, and
+	start any which exits again with the same `index`.
+
+	A worker which dies within `stable` seconds of starting waits twice as long as
+	last time before being restarted, from `min_delay` up to `max_delay` seconds, so
+	one which cannot start does not spin. Restarts are counted in `metrics`, a
+	`ddnsupdater.metrics.Registry`, if one is given.
+	"""
+
+	def __init__(self, count, work, min_delay=1, max_delay=60, stable=60, metrics=None,
+				 clock=time.time):
+		if count < 1:
+			raise ValueError('At least one worker process is needed')
+
+		self.count = count
+		self.work = work
+		self.min_delay = min_delay
+		self.max_delay = max_delay
+		self.stable = stable
+		self.clock = clock
+		self.processes = [None] * count
+		self._started = [0] * count
+		self._delays = [min_delay] * count
+		self._restart_at = [None] * count
+		self._running = False
+		self.restarts = None
+		if metrics is not None:
+			self.restarts = metrics.counter('ddns_worker_restarts_total',
+											'Worker processes restarted after exiting',
+											('worker',))
+
+	def _child(self, index):
+		# the supervisor handles these; a worker is stopped with SIGTERM
+		signal.signal(signal.SIGTERM, signal.SIG_DFL)
+		signal.signal(signal.SIGINT, signal.SIG_IGN)
+		# the supervisor's handlers forward these to its workers, which a worker
+		# cannot do; `work` installs its own for the ones it handles
+		for signum in (signal.SIGHUP, signal.SIGUSR1, signal.SIGUSR2):
+			signal.signal(signum, signal.SIG_IGN)
+
+		self.work(index, self.count)
+
+	def start_worker(self, index):
+		process = multiprocessing.Process(target=self._child,
+										  args=(index,),
+										  name='ddns-worker-{index}'.format(index=index))
+		# stopped along with the supervisor
+		process.daemon = True
+		process.start()
+		self.processes[index] = process
+		self._started[index] = self.clock()
+		self._restart_at[index] = None
+		logging.info('Started worker {index} as process {pid}'.format(index=index, pid=process.pid))
+
+	def check(self):
+		"""Notice workers which have exited and restart those whose delay is up."""
+		now = self.clock()
+		for index, process in enumerate(self.processes):
+			if self._restart_at[index] is not None:
+				if now >= self._restart_at[index]:
+					if self.restarts is not None:
+						self.restarts.inc(str(index))
+
+					self.start_worker(index)
+
+				continue
+
+			if process is None or process.is_alive():
+				continue
+
+			if now - self._started[index] >= self.stable:
+				self._delays[index] = self.min_delay
+
+			else:
+				self._delays[index] = min(self._delays[index] * 2, self.max_delay)
+
+			logging.error('Worker {index} (process {pid}) exited with code {code}, restarting in '
+						  '{delay}s'.format(index=index, pid=process.pid, code=process.exitcode,
+											 delay=self._delays[index]))
+			self._restart_at[index] = now + self._delays[index]
+
+	def forward(self, signum):
+		"""Send signal `signum` to every running worker."""
+		for process in self.processes:
+			if process is not None and process.is_alive():
+				try:
+					os.kill(process.pid, signum)
+				except OSError:
+					pass
+
+	def run(self, interval=1):
+		"""Start every worker and keep them running until `stop()` is called."""
+		self._running = True
+		for index in xrange(self.count):
+			self.start_worker(index)
+
+		while self._running:
+			self.check()
+			# signals interrupt the sleep, so stop() takes effect promptly
+			time.sleep(interval)
+
+		for process in self.processes:
+			if process is not None and process.is_alive():
+				process.terminate()
+
+		for process in self.processes:
+			if process is not None:
+				process.join()
+
+	def stop(self):
+		self._running = False
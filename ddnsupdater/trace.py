@@ -0,0 +1,274 @@
+#!/usr/bin/env python2.7
+
+"""Optional timing of each phase of a poll.
+
+Code marks phases with
+
+    with trace.span('fetch.scan', target=name):
+        ...
+
+which costs next to nothing until `enable()` is called. Recorded spans can be
+written out in the Chrome trace event format, for chrome://tracing, Perfetto or
+speedscope. `StackSampler` shows where time goes inside a phase by sampling the
+stacks of every thread, and `install_signal_handlers()` lets both be dumped from a
+running daemon.
+"""
+
+import os
+import sys
+import time
+import signal
+import thread
+import logging
+import threading
+import traceback
+import collections
+
+
+class NullSpan(object):
+	"""Stands in for a `Span` while tracing is off."""
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc_info):
+		return False
+
+
+NULL_SPAN = NullSpan()
+
+
+class Span(object):
+	__slots__ = ('tracer', 'name', 'args', 'start')
+
+	def __init__(self, tracer, name, args):
+		self.tracer = tracer
+		self.name = name
+		self.args = args
+		self.start = None
+
+	def __enter__(self):
+		self.start = time.time()
+		return self
+
+	def __exit__(self, exc_type, exc_value, exc_traceback):
+		if exc_type is not None:
+			self.args['error'] = exc_type.__name__
+
+		self.tracer.record(self.name, self.start, time.time() - self.start, self.args)
+		return False
+
+
+class Tracer(object):
+	"""Keep the most recent `max_spans` spans from every thread."""
+
+	def __init__(self, max_spans=100000):
+		self.spans = collections.deque(maxlen=max_spans)
+
+	def span(self, name, **args):
+		return Span(self, name, args)
+
+	def record(self, name, start, duration, args):
+		# deque.append is atomic so no lock is needed
+		self.spans.append((name, start, duration, thread.get_ident(), args))
+
+	def chrome_trace(self):
+		"""Return the spans as a Chrome trace event format document."""
+		pid = os.getpid()
+		names = dict((t.ident, t.name) for t in threading.enumerate())
+		events = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid,
+				   'args': {'name': name}} for tid, name in names.items()]
+		for name, start, duration, tid, args in list(self.spans):
+			events.append({'name': name,
+						   'cat': name.split('.')[0],
+						   'ph': 'X',
+						   'ts': int(start * 1e6),
+						   'dur': int(duration * 1e6),
+						   'pid': pid,
+						   'tid': tid,
+						   'args': args})
+
+		return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+	def export(self, path):
+		"""Write the spans to `path` in the Chrome trace event format."""
+		# only needed for --trace-dir
+		import json
+		with open(path, 'w') as h:
+			json.dump(self.chrome_trace(), h)
+
+	def summary(self):
+		"""Return (name, count, total seconds, longest seconds) for each kind of span,
+		slowest total first.
+		"""
+
+		totals = {}
+		for name, _, duration, _, _ in list(self.spans):
+			count, total, longest = totals.get(name, (0, 0.0, 0.0))
+			totals[name] = (count + 1, total + duration, max(longest, duration))
+
+		return sorted(((name,) + value for name, value in totals.items()),
+					  key=lambda row: row[2], reverse=True)
+
+
+# The active `Tracer`, or None while tracing is off
+tracer = None
+
+
+def span(name, **args):
+	"""Return a context manager timing the phase `name`, described by `args`."""
+	if tracer is None:
+		return NULL_SPAN
+
+	return tracer.span(name, **args)
+
+
+def enable(max_spans=100000):
+	"""Start recording spans. Returns the `Tracer`."""
+	global tracer
+	if tracer is None:
+		tracer = Tracer(max_spans)
+
+	return tracer
+
+
+def disable():
+	global tracer
+	tracer = None
+
+
+def format_stacks():
+	"""Return the current stack of every thread as text."""
+	names = dict((t.ident, t.name) for t in threading.enumerate())
+	lines = []
+	for tid, frame in sys._current_frames().items():
+		lines.append('Thread {name} ({tid}):\n'.format(name=names.get(tid, '?'), tid=tid))
+		lines.extend(traceback.format_stack(frame))
+		lines.append('\n')
+
+	return ''.join(lines)
+
+
+class StackSampler(object):
+	"""Sample the stack of every other thread each `interval` seconds, counting
+	identical stacks. `collapsed()` gives the result in the folded format read by
+	flamegraph.pl and speedscope.
+	Unlike cProfile, which only sees the thread that starts it, this covers the
+	worker threads where polls actually run.
+	"""
+
+	def __init__(self, interval=0.005):
+		self.interval = interval
+		self.counts = collections.Counter()
+		self.samples = 0
+		self._stop = threading.Event()
+		self._thread = None
+
+	def _run(self):
+		me = thread.get_ident()
+		names = {}
+		while not self._stop.wait(self.interval):
+			for tid, frame in sys._current_frames().items():
+				if tid == me:
+					continue
+
+				stack = []
+				while frame is not None:
+					code = frame.f_code
+					stack.append('{func} ({file}:{line})'.format(
+							func=code.co_name,
+							file=os.path.basename(code.co_filename),
+							line=code.co_firstlineno))
+					frame = frame.f_back
+
+				if tid not in names:
+					names = dict((t.ident, t.name) for t in threading.enumerate())
+
+				stack.append(names.get(tid, 'thread'))
+				self.counts[';'.join(reversed(stack))] += 1
+
+			self.samples += 1
+
+	@property
+	def running(self):
+		return self._thread is not None
+
+	def start(self):
+		self._stop.clear()
+		self._thread = threading.Thread(target=self._run, name='ddns-sampler')
+		self._thread.daemon = True
+		self._thread.start()
+		return self
+
+	def stop(self):
+		self._stop.set()
+		if self._thread is not None:
+			self._thread.join()
+			self._thread = None
+
+	def collapsed(self):
+		return ''.join('{stack} {count}\n'.format(stack=stack, count=count)
+					   for stack, count in self.counts.most_common())
+
+
+def install_signal_handlers(directory):
+	"""Start tracing and arrange for signals to write diagnostics to `directory`:
+
+	SIGUSR1
+	    Write the recorded spans as a Chrome trace, and the current stack of every
+		thread, and log a summary of the slowest phases
+
+	SIGUSR2
+	    Start sampling thread stacks; on the next SIGUSR2 stop and write them in the
+		folded format for flame graphs
+
+	"""
+
+	enable()
+	sampler = StackSampler()
+	lock = threading.Lock()
+
+	def path(suffix):
+		return os.path.join(directory, 'ddns-{pid}-{when}.{suffix}'.format(
+				pid=os.getpid(), when=time.strftime('%Y%m%d-%H%M%S'), suffix=suffix))
+
+	def dump():
+		with lock:
+			trace_path = path('trace.json')
+			tracer.export(trace_path)
+			with open(path('stacks.txt'), 'w') as h:
+				h.write(format_stacks())
+
+			for name, count, total, longest in tracer.summary()[:10]:
+				logging.info('{name}: {count} spans, {total:.3f}s total, {longest:.3f}s longest'.format(
+						name=name, count=count, total=total, longest=longest))
+
+			logging.info('Wrote trace to {path}'.format(path=trace_path))
+
+	def toggle_sampler():
+		with lock:
+			if not sampler.running:
+				sampler.counts.clear()
+				sampler.samples = 0
+				sampler.start()
+				logging.info('Sampling thread stacks')
+				return
+
+			sampler.stop()
+			sample_path = path('folded')
+			with open(sample_path, 'w') as h:
+				h.write(sampler.collapsed())
+
+			logging.info('Wrote {count} stack samples to {path}'.format(
+					count=sampler.samples, path=sample_path))
+
+	def on_thread(function):
+		# Handlers run on the main thread, which may be inside the engine; do the work
+		# elsewhere
+		def handler(signum, frame):
+			threading.Thread(target=function, name='ddns-trace').start()
+
+		return handler
+
+	signal.signal(signal.SIGUSR1, on_thread(dump))
+	signal.signal(signal.SIGUSR2, on_thread(toggle_sampler))
@@ -29,11 +29,9 @@ setup(
 	license='GPL',
 	keywords="namecheap namecheap.com ddns",
 	packages=['ddnsupdater'],
-	#scripts=['bin/carrie'],
-	entry_points={
-		'console_scripts': [
-			'ddns-updater=ddnsupdater.main:main',
-			]},
+	# A plain script rather than a console_scripts entry point, whose wrapper
+	# imports pkg_resources and scans every installed distribution before starting
+	scripts=['bin/ddns-updater'],
 	package_dir={'ddnsupdater': 'ddnsupdater'},
 	# Files go into MANIFEST.in to get them in the distribution archives,
 	# package_data to get them installed
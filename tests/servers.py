@@ -0,0 +1,170 @@
+#!/usr/bin/env python2.7
+
+"""Local servers for the tests: an HTTP server answering each request with a
+function and recording what was asked for, and a name server accepting DNS UPDATE
+messages.
+"""
+
+import sys
+import socket
+import struct
+import threading
+import SocketServer
+import BaseHTTPServer
+
+from ddnsupdater import dnsupdate
+
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+	protocol_version = 'HTTP/1.1'
+
+	def log_message(self, *args):
+		pass
+
+	def do_GET(self):
+		if 'content-length' in self.headers:
+			self.body = self.rfile.read(int(self.headers['content-length']))
+
+		with self.server.lock:
+			self.server.requests.append((self.command, self.path, dict(self.headers)))
+
+		code, headers, body = self.server.respond(self)
+		self.send_response(code)
+		self.send_header('Content-Length', str(len(body)))
+		for key, value in headers:
+			self.send_header(key, value)
+
+		self.end_headers()
+		if self.command != 'HEAD':
+			self.wfile.write(body)
+
+	do_HEAD = do_POST = do_GET
+
+
+class Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+	"""Answer every request with `respond(handler)`, which returns the status code,
+	a list of (header, value) pairs and the body. `requests` holds the method,
+	path and headers of each request received.
+	"""
+
+	daemon_threads = True
+	allow_reuse_address = True
+
+	def __init__(self, respond):
+		BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0), Handler)
+		self.respond = respond
+		self.requests = []
+		self.lock = threading.Lock()
+		thread = threading.Thread(target=self.serve_forever)
+		thread.daemon = True
+		thread.start()
+
+	def handle_error(self, request, client_address):
+		# clients closing a connection part way through are expected
+		if sys is not None and not isinstance(sys.exc_info()[1], socket.error):
+			BaseHTTPServer.HTTPServer.handle_error(self, request, client_address)
+
+	def url(self, path='/'):
+		return 'http://127.0.0.1:{port}{path}'.format(port=self.server_address[1], path=path)
+
+	def close(self):
+		self.shutdown()
+		self.server_close()
+
+
+class NameServer(object):
+	"""Answer DNS UPDATE messages over UDP and TCP on the same port with NOERROR, or
+	NOTAUTH if a `key` is set and a message is not correctly signed. Replies to a
+	signed message are signed. With `truncate` every UDP reply has the TC flag set
+	and nothing else, and with `bad_mac` the MAC of each signed reply is spoilt.
+	`messages` holds each message received with 'udp' or 'tcp'.
+	"""
+
+	def __init__(self, key=None, truncate=False, bad_mac=False):
+		self.key = key
+		self.truncate = truncate
+		self.bad_mac = bad_mac
+		self.messages = []
+		self.stopped = threading.Event()
+		self.udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+		self.udp.bind(('127.0.0.1', 0))
+		self.udp.settimeout(0.05)
+		self.port = self.udp.getsockname()[1]
+		self.tcp = socket.socket()
+		self.tcp.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+		self.tcp.bind(('127.0.0.1', self.port))
+		self.tcp.listen(4)
+		self.tcp.settimeout(0.05)
+		self.threads = [threading.Thread(target=self.serve_udp),
+						threading.Thread(target=self.serve_tcp)]
+		for thread in self.threads:
+			thread.start()
+
+	def close(self):
+		self.stopped.set()
+		for thread in self.threads:
+			thread.join()
+
+		self.udp.close()
+		self.tcp.close()
+
+	def answer(self, message, transport):
+		self.messages.append((message, transport))
+		msg_id, flags = dnsupdate.HEADER.unpack_from(message)[:2]
+		if transport == 'udp' and self.truncate:
+			return dnsupdate.HEADER.pack(msg_id, 0x8000 | dnsupdate.FLAG_TC | (flags & 0x7800),
+										 0, 0, 0, 0)
+
+		rcode = 0
+		request_mac = None
+		if self.key is not None:
+			try:
+				request_mac = self.key.verify(message)
+			except dnsupdate.DNSError:
+				rcode = 9
+
+		zone_end = dnsupdate.skip_name(message, dnsupdate.HEADER.size) + 4
+		reply = (dnsupdate.HEADER.pack(msg_id, 0x8000 | (flags & 0x7800) | rcode, 1, 0, 0, 0) +
+				 message[dnsupdate.HEADER.size:zone_end])
+		if request_mac is not None:
+			reply, _ = self.key.sign(reply, request_mac)
+			if self.bad_mac:
+				# the last byte of the MAC, which is followed by six more
+				reply = reply[:-7] + chr(ord(reply[-7]) ^ 1) + reply[-6:]
+
+		return reply
+
+	def serve_udp(self):
+		while not self.stopped.is_set():
+			try:
+				message, client = self.udp.recvfrom(65535)
+			except socket.timeout:
+				continue
+
+			self.udp.sendto(self.answer(message, 'udp'), client)
+
+	def serve_tcp(self):
+		while not self.stopped.is_set():
+			try:
+				conn, _ = self.tcp.accept()
+			except socket.timeout:
+				continue
+
+			conn.settimeout(1)
+			stream = conn.makefile('rb')
+			try:
+				while not self.stopped.is_set():
+					size = stream.read(2)
+					if len(size) < 2:
+						break
+
+					message = stream.read(struct.unpack('!H', size)[0])
+					reply = self.answer(message, 'tcp')
+					conn.sendall(struct.pack('!H', len(reply)) + reply)
+
+			except socket.error:
+				pass
+
+			finally:
+				stream.close()
+				conn.close()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python2.7
+
+import StringIO
+import unittest
+
+from ddnsupdater import address
+from ddnsupdater.main import extract_ip
+
+
+class NormaliseTest(unittest.TestCase):
+	def test_ipv4(self):
+		self.assertEqual(address.normalise('192.0.2.1'), '192.0.2.1')
+		# leading zeros some routers pad with
+		self.assertEqual(address.normalise('192.000.002.001'), '192.0.2.1')
+
+	def test_ipv4_mapped(self):
+		self.assertEqual(address.normalise('::ffff:192.0.2.1'), '192.0.2.1')
+		self.assertEqual(address.normalise('::FFFF:c000:0201'), '192.0.2.1')
+		self.assertEqual(address.split('::ffff:192.0.2.1'), {'A': '192.0.2.1'})
+
+	def test_ipv6_forms_compare_equal(self):
+		forms = ['2001:db8::1',
+				 '2001:DB8::1',
+				 '2001:db8:0:0:0:0:0:1',
+				 '2001:0db8:0000:0000:0000:0000:0000:0001']
+		self.assertEqual(set(address.normalise(form) for form in forms), set(['2001:db8::1']))
+		self.assertEqual(address.normalise('192.0.2.1, 2001:0DB8::0001'),
+						 address.normalise('192.0.2.1,2001:db8::1'))
+
+	def test_zone_id(self):
+		self.assertEqual(address.normalise('fe80::1%eth0'), 'fe80::1')
+		self.assertEqual(address.normalise('fe80::1%eth0'), address.normalise('fe80::1%2'))
+
+	def test_prefix(self):
+		self.assertEqual(address.normalise('2001:db8:100:0:0:0:0:1/56'), '2001:db8:100::/56')
+		self.assertRaises(ValueError, address.normalise, '2001:db8::/129')
+		self.assertRaises(ValueError, address.normalise, '192.0.2.0/24')
+
+	def test_order(self):
+		self.assertEqual(address.normalise('2001:db8:100::/56 2001:db8::1 192.0.2.1'),
+						 '192.0.2.1,2001:db8::1,2001:db8:100::/56')
+
+	def test_bad_addresses(self):
+		for text in ('', '192.0.2', '192.0.2.256', 'router', '2001:db8::g'):
+			self.assertRaises(ValueError, address.normalise, text)
+
+
+class SplitTest(unittest.TestCase):
+	def test_first_of_each_type_kept(self):
+		self.assertEqual(address.split(['2001:db8::1', '2001:db8::2', '192.0.2.1']),
+						 {'A': '192.0.2.1', 'AAAA': '2001:db8::1'})
+
+	def test_placeholders(self):
+		self.assertEqual(address.placeholders('192.0.2.1'),
+						 {'ip': '192.0.2.1', 'ip6': None, 'prefix': None})
+
+
+class UrlRecordTypeTest(unittest.TestCase):
+	def test_types(self):
+		self.assertEqual(address.url_record_type('https://example.com/?ip={ip}'), 'A')
+		self.assertEqual(address.url_record_type('https://example.com/?ip={ip6}'), 'AAAA')
+		self.assertEqual(address.url_record_type('https://example.com/?p={prefix}'), 'PREFIX')
+		# the provider takes the address the request comes from
+		self.assertEqual(address.url_record_type('https://example.com/?host=www'), 'A')
+
+	def test_mixed_placeholders(self):
+		self.assertRaises(ValueError, address.url_record_type,
+						  'https://example.com/?ip={ip}&ip6={ip6}')
+
+
+class UnmatchedIPv6Test(unittest.TestCase):
+	page = '<td>IP Address</td>\n<td>192.0.2.1</td>\n<td>IPv6 Address</td>\n<td>{ip6}</td>\n'
+
+	def fetch(self, ip6):
+		return address.normalise(extract_ip(StringIO.StringIO(self.page.format(ip6=ip6)),
+											'IP Address', 1, r'<td>([0-9.]+)</td>',
+											(('IPv6 Address', 1, r'<td>([0-9a-f:]+)</td>'),)))
+
+	def test_left_out(self):
+		# a router showing no IPv6 address gives the same answer as one with none at
+		# all, so nothing is pushed
+		self.assertEqual(self.fetch('Not connected'), '192.0.2.1')
+		self.assertEqual(self.fetch('2001:db8::1'), '192.0.2.1,2001:db8::1')
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python2.7
+
+import base64
+import urllib2
+import unittest
+
+from ddnsupdater.auth import OpenerCache
+from ddnsupdater.metrics import PollMetrics
+from tests.servers import Server
+
+
+class Router(object):
+	"""A router status page behind Basic authentication as admin with `password`."""
+
+	def __init__(self, test, password='12345'):
+		self.password = password
+		self.server = Server(self.respond)
+		test.addCleanup(self.server.close)
+
+	def respond(self, handler):
+		expected = 'Basic ' + base64.b64encode('admin:' + self.password)
+		if handler.headers.get('authorization') != expected:
+			return 401, [('WWW-Authenticate', 'Basic realm="Router"')], 'Unauthorized'
+
+		return 200, [], 'IP Address 1.2.3.4'
+
+	@property
+	def host(self):
+		return '127.0.0.1:{port}'.format(port=self.server.server_address[1])
+
+	def url(self, path='/status'):
+		return self.server.url(path)
+
+	def authorised(self):
+		"""Whether each request so far carried credentials."""
+		return ['authorization' in headers for _, _, headers in self.server.requests]
+
+
+class OpenerCacheTest(unittest.TestCase):
+	def setUp(self):
+		self.router = Router(self)
+		self.cache = OpenerCache()
+
+	def fetch(self, url=None, password='12345'):
+		response = self.cache.urlopen(url or self.router.url(), 'admin', password)
+		try:
+			return response.read()
+		finally:
+			response.close()
+
+	def test_preemptive_after_first_challenge(self):
+		self.assertEqual(self.fetch(), 'IP Address 1.2.3.4')
+		self.assertEqual(self.router.authorised(), [False, True])
+		self.assertEqual(self.cache.challenges, {self.router.host: 1})
+
+		# credentials go with the first request from now on
+		self.fetch()
+		self.fetch()
+		self.assertEqual(self.router.authorised(), [False, True, True, True])
+		self.assertEqual(self.cache.challenges, {self.router.host: 1})
+
+	def test_challenges_exported(self):
+		metrics = PollMetrics()
+		metrics.watch_auth(self.cache)
+		self.fetch()
+		self.fetch()
+		self.assertIn('ddns_auth_challenges_total{{host="{host}"}} 1\n'.format(
+				host=self.router.host), metrics.registry.render())
+
+	def test_rejected_credentials_evicted(self):
+		self.fetch()
+		opener = self.cache.get(self.router.url(), 'Router', 'admin')
+		self.assertIsNotNone(opener)
+
+		# the password changes on the router and in the config
+		self.router.password = '67890'
+		self.assertEqual(self.fetch(password='67890'), 'IP Address 1.2.3.4')
+		# the cached opener is tried, then the challenge answered afresh
+		self.assertEqual(self.router.authorised(), [False, True, True, True])
+		self.assertEqual(self.cache.challenges, {self.router.host: 2})
+		self.assertIsNot(self.cache.get(self.router.url(), 'Router', 'admin'), opener)
+		self.assertEqual(len(self.cache), 1)
+
+	def test_wrong_password(self):
+		with self.assertRaises(urllib2.HTTPError) as raised:
+			self.fetch(password='wrong')
+
+		self.assertEqual(raised.exception.code, 401)
+		self.assertEqual(self.router.authorised(), [False, True])
+
+	def test_lru_eviction(self):
+		self.cache.max_size = 2
+		urls = [self.router.url('/page{n}'.format(n=n)) for n in xrange(3)]
+		self.fetch(urls[0])
+		self.fetch(urls[1])
+		# using the first makes the second the least recently used
+		self.fetch(urls[0])
+		self.fetch(urls[2])
+
+		self.assertEqual(len(self.cache), 2)
+		self.assertIsNotNone(self.cache.get(urls[0], 'Router', 'admin'))
+		self.assertIsNone(self.cache.get(urls[1], 'Router', 'admin'))
+		self.assertIsNotNone(self.cache.get(urls[2], 'Router', 'admin'))
+
+		# the evicted URL has to be challenged again
+		del self.router.server.requests[:]
+		self.fetch(urls[1])
+		self.assertEqual(self.router.authorised(), [False, True])
+
+	def test_no_realm(self):
+		self.router.server.respond = lambda handler: (401, [], 'Unauthorized')
+		self.assertRaises(ValueError, self.fetch)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python2.7
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from ddnsupdater import config
+
+DEFAULTS = {
+	'sleep': 3600,
+	'fetch_source': 'router',
+	'fetch_search': 'IP Address',
+	'fetch_skip': 1,
+	'fetch_match': r'.*<td>([0-9.]+)',
+	'push_protocol': 'namecheap',
+	}
+
+GOOD = """[fetch]
+url=http://192.168.0.1/status
+
+[fetch:home]
+password=12345
+
+[push:home]
+url=https://dynamicdns.park-your-domain.com/update?host=home&ip={ip}
+"""
+
+
+class LoadTest(unittest.TestCase):
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, self.dir)
+
+	def write(self, text):
+		path = os.path.join(self.dir, 'ddns.conf')
+		with open(path, 'w') as h:
+			h.write(text)
+
+		return path
+
+	def test_good_file(self):
+		loaded = config.load(self.write(GOOD), DEFAULTS)
+		self.assertEqual([t.name for t in loaded.targets], ['home'])
+
+	def test_malformed_files_raise_value_error(self):
+		for text in ('url=http://192.168.0.1/status\n',  # no section header
+					 '[fetch]\nthis is not an option\n',  # parsing error
+					 GOOD.replace('password=12345', 'password=%(missing)s')):  # interpolation
+			self.assertRaises(ValueError, config.load, self.write(text), DEFAULTS)
+
+	def test_missing_file_raises_io_error(self):
+		self.assertRaises(IOError, config.load, os.path.join(self.dir, 'missing.conf'), DEFAULTS)
+
+
+if __name__ == '__main__':
+	unittest.main()
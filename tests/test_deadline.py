@@ -0,0 +1,190 @@
+#!/usr/bin/env python2.7
+
+import time
+import socket
+import struct
+import threading
+import urllib2
+import unittest
+
+from ddnsupdater import deadline
+from ddnsupdater import dnsupdate
+from ddnsupdater.auth import OpenerCache
+from ddnsupdater.main import get_ip, update_ddns
+from ddnsupdater.pool import ConnectionPool
+from ddnsupdater.deadline import Deadline, DeadlineExceeded
+
+PAGE = '<td>IP Address</td>\n<td>1.2.3.4</td>\n' * 200
+
+
+class TricklingServer(object):
+	"""Send a response's headers at once and then its body a byte every `interval`
+	seconds, so no single recv() ever times out.
+	"""
+
+	def __init__(self, body=PAGE, interval=0.02):
+		self.body = body
+		self.interval = interval
+		self.stopped = False
+		self.sock = socket.socket()
+		self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+		self.sock.bind(('127.0.0.1', 0))
+		self.sock.listen(16)
+		thread = threading.Thread(target=self.accept)
+		thread.daemon = True
+		thread.start()
+
+	def url(self, path='/'):
+		return 'http://127.0.0.1:{port}{path}'.format(port=self.sock.getsockname()[1], path=path)
+
+	def close(self):
+		self.stopped = True
+		self.sock.close()
+
+	def accept(self):
+		while not self.stopped:
+			try:
+				conn, _ = self.sock.accept()
+			except socket.error:
+				return
+
+			thread = threading.Thread(target=self.trickle, args=(conn,))
+			thread.daemon = True
+			thread.start()
+
+	def trickle(self, conn):
+		try:
+			conn.recv(4096)
+			conn.sendall('HTTP/1.1 200 OK\r\nContent-Length: {length}\r\n\r\n'.format(
+					length=len(self.body)))
+			for char in self.body:
+				if self.stopped:
+					return
+
+				conn.sendall(char)
+				time.sleep(self.interval)
+
+		except socket.error:
+			pass
+
+		finally:
+			conn.close()
+
+
+class ChattyNameServer(object):
+	"""Answer every UDP message with a stream of replies carrying the wrong ID, and
+	accept TCP connections without ever answering.
+	"""
+
+	def __init__(self):
+		self.stopped = False
+		self.udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+		self.udp.bind(('127.0.0.1', 0))
+		# also the time between wrong replies
+		self.udp.settimeout(0.05)
+		self.port = self.udp.getsockname()[1]
+		self.tcp = socket.socket()
+		self.tcp.bind(('127.0.0.1', self.port))
+		self.tcp.listen(4)
+		thread = threading.Thread(target=self.chatter)
+		thread.daemon = True
+		thread.start()
+
+	def close(self):
+		self.stopped = True
+		self.udp.close()
+		self.tcp.close()
+
+	def chatter(self):
+		client = None
+		while not self.stopped:
+			try:
+				message, client = self.udp.recvfrom(4096)
+				continue
+			except socket.timeout:
+				pass
+			except socket.error:
+				return
+
+			if client is None:
+				continue
+
+			wrong_id = (struct.unpack_from('!H', message)[0] + 1) & 0xffff
+			try:
+				self.udp.sendto(struct.pack('!H', wrong_id) + message[2:12], client)
+			except socket.error:
+				return
+
+
+class DeadlineTest(unittest.TestCase):
+	def setUp(self):
+		self.server = TricklingServer()
+		self.addCleanup(self.server.close)
+
+	def assertGivesUpInTime(self, function, budget=0.5, phase='read'):
+		start = time.time()
+		with deadline.scope(Deadline(budget)):
+			with self.assertRaises(DeadlineExceeded) as raised:
+				function()
+
+		self.assertLess(time.time() - start, budget + 0.5)
+		self.assertEqual(raised.exception.phase, phase)
+
+	def test_pooled_fetch(self):
+		pool = ConnectionPool()
+		self.assertGivesUpInTime(lambda: get_ip('admin', '', self.server.url(), 'nothere', 1,
+												 '(x)', pool=pool))
+
+	def test_urllib2_fetch(self):
+		self.assertGivesUpInTime(lambda: get_ip('admin', '', self.server.url(), 'nothere', 1,
+												 '(x)'))
+
+	def test_urllib2_push(self):
+		self.assertGivesUpInTime(lambda: update_ddns(self.server.url('/update')), phase='push')
+
+	def test_dns_update_udp(self):
+		# replies keep arriving, but none for this message
+		server = ChattyNameServer()
+		self.addCleanup(server.close)
+		client = dnsupdate.UpdateClient('127.0.0.1', server.port, timeout=5)
+		message = dnsupdate.update_message('example.com', [('home', '1.2.3.4', 300)])
+		self.assertGivesUpInTime(lambda: client.send(message), phase='push')
+
+	def test_dns_update_tcp(self):
+		server = ChattyNameServer()
+		self.addCleanup(server.close)
+		client = dnsupdate.UpdateClient('127.0.0.1', server.port, timeout=5)
+		# too large for UDP
+		message = dnsupdate.update_message('example.com', [('host{n}'.format(n=n), '1.2.3.4', 300)
+														   for n in xrange(40)])
+		self.assertGivesUpInTime(lambda: client.send(message), phase='push')
+		self.assertIsNone(client._tcp)
+
+	def test_no_deadline(self):
+		self.server.interval = 0
+		self.assertEqual(get_ip('admin', '', self.server.url(), 'IP Address', 1,
+								r'.*<td>([0-9.]+)'), '1.2.3.4')
+
+	def test_timeouts_passed_to_urllib2(self):
+		timeouts = []
+		def urlopen(request, timeout):
+			timeouts.append(timeout)
+			raise urllib2.URLError('refused')
+
+		self.addCleanup(setattr, urllib2, 'urlopen', urllib2.urlopen)
+		urllib2.urlopen = urlopen
+		for budget in (None, 30):
+			with deadline.scope(budget and Deadline(budget)):
+				self.assertRaises(urllib2.URLError, update_ddns, 'http://127.0.0.1:1/update')
+				self.assertRaises(urllib2.URLError, OpenerCache().urlopen,
+								  'http://127.0.0.1:1/', None, None)
+
+		# the socket default without a deadline, what is left of it with one
+		self.assertEqual(timeouts[:2], [socket._GLOBAL_DEFAULT_TIMEOUT] * 2)
+		for timeout in timeouts[2:]:
+			self.assertIsInstance(timeout, float)
+			self.assertTrue(0 < timeout <= 30)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python2.7
+
+import unittest
+
+from ddnsupdater import dnsupdate
+from ddnsupdater.providers import DRIVERS
+from tests.servers import NameServer
+
+SECRET = 'c2VjcmV0IGtleSBmb3IgdGVzdHM='
+
+RECORDS = [('home', '192.0.2.1', 300), ('www', '2001:db8::1', 60)]
+
+# The MAC of update_message('example.com', RECORDS, msg_id=0x1234) signed with
+# SECRET as ddns-key at time 1700000000, as computed by dnspython
+KNOWN_MAC = '07232b7a3f8e21a5f077f90e70fa8bd180ca693d97173348d2ca55bfeca9a1b6'
+
+
+class TSIGTest(unittest.TestCase):
+	def setUp(self):
+		self.key = dnsupdate.TSIGKey('ddns-key', SECRET)
+		self.message = dnsupdate.update_message('example.com', RECORDS, msg_id=0x1234)
+
+	def test_known_mac(self):
+		signed, mac = self.key.sign(self.message, time_signed=1700000000)
+		self.assertEqual(mac.encode('hex'), KNOWN_MAC)
+		self.assertTrue(signed.startswith(self.message[:10]))
+		# one more additional record
+		self.assertEqual(dnsupdate.HEADER.unpack_from(signed)[5], 1)
+		self.assertTrue(signed.endswith(mac + '\x12\x34\x00\x00\x00\x00'))
+
+	def test_verify(self):
+		signed, mac = self.key.sign(self.message)
+		self.assertEqual(self.key.verify(signed), mac)
+
+		# a response's MAC covers the request's
+		response, response_mac = self.key.sign(self.message, request_mac=mac)
+		self.assertEqual(self.key.verify(response, mac), response_mac)
+		self.assertRaises(dnsupdate.DNSError, self.key.verify, response)
+
+	def test_bad_mac_rejected(self):
+		signed, _ = self.key.sign(self.message)
+		spoilt = signed[:-7] + chr(ord(signed[-7]) ^ 1) + signed[-6:]
+		self.assertRaises(dnsupdate.DNSError, self.key.verify, spoilt)
+
+		other = dnsupdate.TSIGKey('ddns-key', 'b3RoZXIgc2VjcmV0')
+		self.assertRaises(dnsupdate.DNSError, other.verify, signed)
+
+	def test_old_signature_rejected(self):
+		signed, _ = self.key.sign(self.message, time_signed=1700000000)
+		self.assertRaises(dnsupdate.DNSError, self.key.verify, signed)
+
+	def test_unsigned_rejected(self):
+		self.assertRaises(dnsupdate.DNSError, self.key.verify, self.message)
+
+
+class UpdateClientTest(unittest.TestCase):
+	def serve(self, **kwargs):
+		server = NameServer(**kwargs)
+		self.addCleanup(server.close)
+		return server
+
+	def client(self, server, key=None):
+		client = dnsupdate.UpdateClient('127.0.0.1', server.port, key, timeout=2)
+		self.addCleanup(client.close)
+		return client
+
+	def test_signed_update(self):
+		key = dnsupdate.TSIGKey('ddns-key', SECRET)
+		server = self.serve(key=key)
+		message = dnsupdate.update_message('example.com', RECORDS)
+		self.assertEqual(self.client(server, key).send(message), 'NOERROR')
+		self.assertEqual([transport for _, transport in server.messages], ['udp'])
+
+	def test_unsigned_update_refused(self):
+		server = self.serve(key=dnsupdate.TSIGKey('ddns-key', SECRET))
+		message = dnsupdate.update_message('example.com', RECORDS)
+		self.assertEqual(self.client(server).send(message), 'NOTAUTH')
+
+	def test_response_with_bad_mac(self):
+		key = dnsupdate.TSIGKey('ddns-key', SECRET)
+		server = self.serve(key=key, bad_mac=True)
+		message = dnsupdate.update_message('example.com', RECORDS)
+		self.assertRaises(dnsupdate.DNSError, self.client(server, key).send, message)
+
+	def test_truncated_reply_falls_back_to_tcp(self):
+		key = dnsupdate.TSIGKey('ddns-key', SECRET)
+		server = self.serve(key=key, truncate=True)
+		client = self.client(server, key)
+		message = dnsupdate.update_message('example.com', RECORDS)
+		self.assertEqual(client.send(message), 'NOERROR')
+		self.assertEqual([transport for _, transport in server.messages], ['udp', 'tcp'])
+		self.assertEqual(server.messages[0][0], server.messages[1][0])
+
+	def test_large_message_goes_over_tcp(self):
+		server = self.serve()
+		records = [('host{n}'.format(n=n), '192.0.2.{n}'.format(n=n), 300) for n in xrange(40)]
+		message = dnsupdate.update_message('example.com', records)
+		self.assertGreater(len(message), dnsupdate.MAX_UDP_SIZE)
+		self.assertEqual(self.client(server).send(message), 'NOERROR')
+		self.assertEqual([transport for _, transport in server.messages], ['tcp'])
+
+
+class BatchTest(unittest.TestCase):
+	def test_update_message(self):
+		message = dnsupdate.update_message('example.com', RECORDS, msg_id=7)
+		msg_id, flags, zocount, prcount, upcount, adcount = dnsupdate.HEADER.unpack_from(message)
+		self.assertEqual((msg_id, flags >> 11, zocount, prcount, upcount, adcount),
+						 (7, dnsupdate.OPCODE_UPDATE, 1, 0, 4, 0))
+		# each name's RRset is deleted and the new address added
+		self.assertIn(dnsupdate.encode_name('home.example.com') +
+					  dnsupdate.RR_FIXED.pack(dnsupdate.TYPE_A, dnsupdate.CLASS_ANY, 0, 0), message)
+		self.assertIn(dnsupdate.encode_name('www.example.com') +
+					  dnsupdate.RR_FIXED.pack(dnsupdate.TYPE_AAAA, dnsupdate.CLASS_IN, 60, 16),
+					  message)
+
+	def test_one_message_for_several_records(self):
+		server = NameServer()
+		self.addCleanup(server.close)
+		url = 'dns://127.0.0.1:{port}/example.com?name=a,b,c.example.org.&ip=192.0.2.1'.format(
+			port=server.port)
+		outcomes = DRIVERS['rfc2136'].update(None, url, 3)
+		self.assertEqual([outcome.status for outcome in outcomes], ['NOERROR'] * 3)
+		self.assertEqual(len(server.messages), 1)
+
+		message = server.messages[0][0]
+		self.assertEqual(dnsupdate.HEADER.unpack_from(message)[4], 6)
+		for name in ('a.example.com', 'b.example.com', 'c.example.org'):
+			self.assertIn(dnsupdate.encode_name(name), message)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,329 @@
+#!/usr/bin/env python2.7
+
+import time
+import threading
+import unittest
+
+from ddnsupdater.engine import Engine, Target
+from ddnsupdater.metrics import PollMetrics
+from ddnsupdater.schedule import Schedule
+
+
+class FakeClock(object):
+	def __init__(self):
+		self.now = 1000.0
+
+	def __call__(self):
+		return self.now
+
+
+class FakeTarget(Target):
+	"""Target whose fetches are logged in `log` and which fails while `error` is set.
+	A fetch waits for `gate` if one is given.
+	"""
+
+	def __init__(self, name, period, clock, log, gate=None):
+		Target.__init__(self, name, self.fetch_ip, self.push_ip, period,
+						schedule=Schedule(period, retry=30, jitter=0, clock=clock))
+		self.log = log
+		self.gate = gate
+		self.error = None
+		self.pushes = []
+
+	def fetch_ip(self):
+		self.log.append(self.name)
+		if self.gate is not None:
+			self.gate.wait(5)
+
+		if self.error is not None:
+			raise self.error
+
+		return '1.2.3.4'
+
+	def push_ip(self, ip):
+		self.pushes.append(ip)
+
+
+class SlowFetch(object):
+	"""Fetch function which takes `seconds` and records how many calls overlap."""
+
+	def __init__(self, seconds=0.01, ip='1.2.3.4'):
+		self.seconds = seconds
+		self.ip = ip
+		self.calls = 0
+		self.running = 0
+		self.overlaps = 0
+		self.lock = threading.Lock()
+
+	def __call__(self):
+		with self.lock:
+			self.calls += 1
+			self.running += 1
+			if self.running > 1:
+				self.overlaps += 1
+
+		time.sleep(self.seconds)
+		with self.lock:
+			self.running -= 1
+
+		return self.ip
+
+
+class OverlapEngine(Engine):
+	"""Engine counting checks of a target which overlap."""
+
+	def __init__(self, *args, **kwargs):
+		Engine.__init__(self, *args, **kwargs)
+		self.running = set()
+		self.overlaps = 0
+		self.lock = threading.Lock()
+
+	def check(self, target):
+		with self.lock:
+			if target in self.running:
+				self.overlaps += 1
+
+			self.running.add(target)
+
+		try:
+			return Engine.check(self, target)
+
+		finally:
+			with self.lock:
+				self.running.discard(target)
+
+
+class EngineTest(unittest.TestCase):
+	"""The engine's worker threads driven by a fake clock, with the test standing in
+	for the scheduler thread.
+	"""
+
+	def setUp(self):
+		self.clock = FakeClock()
+		self.log = []
+
+	def engine(self, targets, max_in_flight=1):
+		engine = Engine(targets, max_in_flight=max_in_flight, clock=self.clock)
+		engine.start()
+
+		def stop():
+			engine.stop()
+			for thread in engine._workers:
+				engine._work.put(None)
+
+			for thread in engine._workers:
+				thread.join(5)
+
+		self.addCleanup(stop)
+		return engine
+
+	def settle(self, engine, checks):
+		"""Wait for `checks` checks in all, each rescheduled."""
+		end = time.time() + 5
+		while time.time() < end:
+			with engine._cond:
+				if engine.checks == checks and not any(t.in_progress for t in engine.targets):
+					return
+
+			time.sleep(0.001)
+
+		self.fail('{n} checks made, not {checks}'.format(n=engine.checks, checks=checks))
+
+	def advance(self, engine, seconds, checks):
+		self.clock.now += seconds
+		engine._dispatch(self.clock.now)
+		self.settle(engine, checks)
+
+	def test_scheduling_order(self):
+		targets = [FakeTarget(name, period, self.clock, self.log)
+				   for name, period in (('a', 100), ('b', 30), ('c', 60))]
+		engine = self.engine(targets)
+		self.advance(engine, 0, 3)
+		# after the change to the first address a and c are rechecked in 60
+		# seconds, and b after its period of 30
+		self.assertEqual([t.next_check - self.clock.now for t in targets], [60, 30, 60])
+		self.assertEqual(engine._dispatch(self.clock.now), 30)
+
+		self.advance(engine, 29, 3)
+		self.advance(engine, 1, 4)
+		# due together, in the order they were scheduled
+		self.advance(engine, 30, 7)
+		self.assertEqual(self.log, ['a', 'b', 'c', 'b', 'a', 'c', 'b'])
+		self.assertEqual(engine.checks, 7)
+
+	def test_max_in_flight(self):
+		gate = threading.Event()
+		targets = [FakeTarget('t{n}'.format(n=n), 60, self.clock, self.log, gate)
+				   for n in xrange(6)]
+		engine = self.engine(targets, max_in_flight=2)
+		engine._dispatch(self.clock.now)
+		time.sleep(0.1)
+		self.assertEqual(len(self.log), 2)
+
+		gate.set()
+		self.settle(engine, 6)
+		self.assertEqual(sorted(self.log), sorted(t.name for t in targets))
+
+	def test_reschedule_after_failure(self):
+		target = FakeTarget('home', 600, self.clock, self.log)
+		target.error = IOError('router unreachable')
+		engine = self.engine([target])
+		self.advance(engine, 0, 1)
+		self.assertEqual(target.next_check, self.clock.now + 30)
+
+		# backing off
+		self.advance(engine, 30, 2)
+		self.assertEqual(target.next_check, self.clock.now + 60)
+		self.assertEqual(target.pushes, [])
+
+		target.error = None
+		self.advance(engine, 60, 3)
+		self.assertEqual(target.pushes, ['1.2.3.4'])
+		self.assertEqual(target.next_check, self.clock.now + 60)
+
+	def test_failed_push_retried(self):
+		target = FakeTarget('home', 600, self.clock, self.log)
+		def push(ip):
+			raise IOError('provider unreachable')
+
+		target.push = push
+		engine = self.engine([target])
+		self.advance(engine, 0, 1)
+		self.assertIsNone(target.last_ip)
+		self.assertEqual(target.next_check, self.clock.now + 30)
+
+		target.push = target.push_ip
+		self.advance(engine, 30, 2)
+		self.assertEqual(target.last_ip, '1.2.3.4')
+		self.assertEqual(target.pushes, ['1.2.3.4'])
+
+	def test_push_of_nothing_not_counted(self):
+		target = FakeTarget('home', 600, self.clock, self.log)
+		# e.g. a Pusher whose records already hold the address
+		target.push = lambda ip: False
+		engine = self.engine([target])
+		engine.metrics = PollMetrics(clock=self.clock)
+		self.advance(engine, 0, 1)
+		self.assertEqual(target.last_ip, '1.2.3.4')
+		self.assertEqual(engine.metrics.changes.get('home'), 0)
+
+		# plain push functions return nothing
+		target.push = target.push_ip
+		target.last_ip = None
+		self.advance(engine, 60, 2)
+		self.assertEqual(engine.metrics.changes.get('home'), 1)
+
+	def test_stop_lets_checks_finish(self):
+		gate = threading.Event()
+		target = FakeTarget('home', 60, self.clock, self.log, gate)
+		engine = Engine([target], max_in_flight=2, clock=self.clock)
+		thread = threading.Thread(target=engine.run)
+		thread.daemon = True
+		thread.start()
+
+		end = time.time() + 5
+		while not self.log and time.time() < end:
+			time.sleep(0.001)
+
+		engine.stop()
+		thread.join(0.1)
+		# still waiting for the check in progress
+		self.assertTrue(thread.is_alive())
+
+		gate.set()
+		thread.join(5)
+		self.assertFalse(thread.is_alive())
+		self.assertEqual(engine.checks, 1)
+		self.assertEqual(engine._workers, [])
+		# nothing is scheduled once stopped
+		self.assertIsNone(target.next_check)
+
+
+class EngineThreadTest(unittest.TestCase):
+	def start(self, engine):
+		thread = threading.Thread(target=engine.run)
+		thread.daemon = True
+		thread.start()
+
+		def stop():
+			engine.stop()
+			thread.join(5)
+			self.assertFalse(thread.is_alive())
+
+		self.addCleanup(stop)
+
+	def test_wake_never_overlaps_checks(self):
+		fetches = [SlowFetch() for _ in xrange(20)]
+		targets = [Target('t{n}'.format(n=n), fetch, lambda ip: None, 3600)
+				   for n, fetch in enumerate(fetches)]
+		engine = Engine(targets, max_in_flight=8)
+		self.start(engine)
+
+		end = time.time() + 1
+
+		def wake():
+			while time.time() < end:
+				engine.wake()
+
+		wakers = [threading.Thread(target=wake) for _ in xrange(2)]
+		for thread in wakers:
+			thread.start()
+
+		for thread in wakers:
+			thread.join()
+
+		self.assertTrue(all(fetch.calls > 1 for fetch in fetches))
+		self.assertEqual(sum(fetch.overlaps for fetch in fetches), 0)
+
+	def test_fetched_never_overlaps_checks(self):
+		source = SlowFetch(0.002)
+		targets = [Target('t{n}'.format(n=n), source, lambda ip: None, 3600)
+				   for n in xrange(20)]
+		engine = OverlapEngine(targets, max_in_flight=8)
+		self.start(engine)
+
+		end = time.time() + 1
+
+		def fetched():
+			while time.time() < end:
+				engine.fetched(source, source.ip)
+
+		threads = [threading.Thread(target=fetched) for _ in xrange(2)]
+		for thread in threads:
+			thread.start()
+
+		for thread in threads:
+			thread.join()
+
+		self.assertTrue(source.calls > len(targets))
+		self.assertEqual(engine.overlaps, 0)
+
+	def test_fetched_leaves_checks_in_progress(self):
+		source = SlowFetch(0.2)
+		target = Target('home', source, lambda ip: None, 3600)
+		engine = Engine([target], max_in_flight=4)
+		self.start(engine)
+
+		time.sleep(0.1)
+		engine.fetched(source, source.ip)
+		time.sleep(0.4)
+		self.assertEqual(source.calls, 1)
+		self.assertFalse(target.woken)
+
+	def test_wake_during_check_checks_again(self):
+		fetch = SlowFetch(0.2)
+		target = Target('home', fetch, lambda ip: None, 3600)
+		engine = Engine([target], max_in_flight=4)
+		self.start(engine)
+
+		time.sleep(0.1)
+		self.assertTrue(target.in_progress)
+		engine.wake()
+		engine.wake()
+		time.sleep(0.6)
+		self.assertEqual(fetch.calls, 2)
+		self.assertEqual(fetch.overlaps, 0)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python2.7
+
+import socket
+import unittest
+
+from ddnsupdater import events
+from ddnsupdater.events import NetlinkEvents, HookEvents
+
+
+def netlink_message(msg_type, index):
+	"""Return an address message for the interface numbered `index`."""
+	length = events.NLMSG_HEADER.size + events.IFADDRMSG.size
+	return (events.NLMSG_HEADER.pack(length, msg_type, 0, 0, 0)
+			+ events.IFADDRMSG.pack(2, 32, 0, 0, index))
+
+
+class FakeSocket(object):
+	"""Return each of `messages` from recv(), then fail as a closed socket does."""
+
+	def __init__(self, messages):
+		self.messages = list(messages)
+
+	def recv(self, size):
+		if len(self.messages) == 0:
+			raise socket.error('closed')
+
+		return self.messages.pop(0)
+
+
+class NetlinkEventsTest(unittest.TestCase):
+	def test_missing_interface_counts_as_changed(self):
+		source = NetlinkEvents('no-such-interface0')
+		self.assertIsNone(source._index())
+		self.assertTrue(source.changed(netlink_message(events.RTM_DELADDR, 7)))
+
+	def test_other_interface_ignored(self):
+		source = NetlinkEvents('lo')
+		self.assertFalse(source.changed(netlink_message(events.RTM_NEWADDR, source._index() + 1000)))
+		self.assertTrue(source.changed(netlink_message(events.RTM_NEWADDR, source._index())))
+
+	def test_listener_survives_a_bad_message(self):
+		source = NetlinkEvents()
+		calls = []
+
+		def changed(data):
+			calls.append(data)
+			if len(calls) == 1:
+				raise IOError(2, 'No such file or directory')
+
+			return True
+
+		source.changed = changed
+		source._sock = FakeSocket(['first', 'second'])
+		source._listen()
+		self.assertEqual(calls, ['first', 'second'])
+		self.assertEqual(source.count, 1)
+
+
+class HookEventsTest(unittest.TestCase):
+	def test_local_only_by_default(self):
+		source = HookEvents(0).start()
+		self.addCleanup(source.close)
+		self.assertEqual(source._server.server_address[0], '127.0.0.1')
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,38 @@
+#!/usr/bin/env python2.7
+
+import StringIO
+import unittest
+
+from ddnsupdater.main import extract_ip
+
+PAGE = '''<tr><td>IP Address</td>
+<td>1.2.3.4</td></tr>
+<tr><td>IPv6 Address</td>
+<td>{ip6}</td></tr>
+'''
+
+MATCH = r'<td>([0-9.]+)</td>'
+MATCH6 = r'<td>([0-9a-f:]+)</td>'
+IPV6_RULES = (('IPv6 Address', 1, MATCH6),)
+
+
+class ExtractTest(unittest.TestCase):
+	def extract(self, page, extra_rules=IPV6_RULES):
+		return extract_ip(StringIO.StringIO(page), 'IP Address', 1, MATCH, extra_rules)
+
+	def test_both_addresses(self):
+		self.assertEqual(self.extract(PAGE.format(ip6='2001:db8::1')), '1.2.3.4,2001:db8::1')
+
+	def test_unmatched_extra_rule_is_left_out(self):
+		self.assertEqual(self.extract(PAGE.format(ip6='Not connected')), '1.2.3.4')
+
+	def test_missing_extra_rule_is_left_out(self):
+		self.assertEqual(self.extract(PAGE.split('<tr><td>IPv6')[0]), '1.2.3.4')
+
+	def test_unmatched_main_rule_fails(self):
+		page = PAGE.format(ip6='2001:db8::1').replace('1.2.3.4', 'Not connected')
+		self.assertRaises(ValueError, self.extract, page)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python2.7
+
+import os
+import json
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+
+from ddnsupdater import fleet
+from ddnsupdater import config
+from ddnsupdater.fleet import CheckResult
+from tests.test_config import DEFAULTS
+
+FLEET = """[fetch]
+search=WAN
+skip=0
+match=WAN ([0-9.]+)
+
+[fetch:site2]
+url=http://10.0.2.1/status
+
+[push:site2]
+url=https://dyn.example.com/update?host=site2&ip={ip}
+
+[fetch:site1]
+url=http://10.0.1.1/status
+sleep=60
+
+[push:site1]
+url=https://dyn.example.com/update?host=site1&ip={ip}
+"""
+
+
+class FleetFileTest(unittest.TestCase):
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, self.dir)
+
+	def load(self, text):
+		path = os.path.join(self.dir, 'fleet.conf')
+		with open(path, 'w') as h:
+			h.write(text)
+
+		return config.load(path, DEFAULTS).targets
+
+	def test_targets(self):
+		site1, site2 = self.load(FLEET)
+		self.assertEqual((site1.name, site1.fetch_url, site1.sleep),
+						 ('site1', 'http://10.0.1.1/status', 60))
+		# shared settings come from the plain [fetch] section
+		self.assertEqual((site2.name, site2.fetch_search, site2.fetch_match, site2.sleep),
+						 ('site2', 'WAN', 'WAN ([0-9.]+)', 3600))
+		self.assertEqual(site2.push_urls, ('https://dyn.example.com/update?host=site2&ip={ip}',))
+
+	def test_unmatched_sections(self):
+		for text in (FLEET + '[fetch:site3]\nurl=http://10.0.3.1/status\n',
+					 FLEET + '[push:site3]\nurl=https://dyn.example.com/update?ip={ip}\n'):
+			with self.assertRaises(ValueError) as raised:
+				self.load(text)
+
+			self.assertIn('site3', str(raised.exception))
+
+	def test_bad_target_named(self):
+		with self.assertRaises(ValueError) as raised:
+			self.load(FLEET.replace('sleep=60', 'sleep=0'))
+
+		self.assertIn('[fetch:site1]', str(raised.exception))
+
+
+class CheckTest(unittest.TestCase):
+	def test_check_all(self):
+		def fail():
+			raise IOError('Connection refused')
+
+		results = fleet.check_all([('up', lambda: '1.2.3.4'), ('down', fail)], timeout=5)
+		self.assertEqual([(r.name, r.status, r.ip, r.error) for r in results],
+						 [('up', fleet.OK, '1.2.3.4', None),
+						  ('down', fleet.ERROR, None, 'Connection refused')])
+		self.assertEqual(fleet.exit_code(results), fleet.EXIT_SOME_FAILED)
+
+	def test_hung_fetch_abandoned(self):
+		release = threading.Event()
+		self.addCleanup(release.set)
+		start = time.time()
+		results = fleet.check_all([('hung', lambda: release.wait(10)),
+								   ('up', lambda: '1.2.3.4')], timeout=0.2)
+		self.assertLess(time.time() - start, 2)
+		self.assertEqual([r.status for r in results], [fleet.TIMEOUT, fleet.OK])
+
+	def test_exit_codes(self):
+		ok = CheckResult('a', fleet.OK, '1.2.3.4', 0.1, None)
+		failed = CheckResult('b', fleet.ERROR, None, 0.1, 'refused')
+		self.assertEqual(fleet.exit_code([ok, ok]), fleet.EXIT_OK)
+		self.assertEqual(fleet.exit_code([ok, failed]), fleet.EXIT_SOME_FAILED)
+		self.assertEqual(fleet.exit_code([failed, failed]), fleet.EXIT_ALL_FAILED)
+
+	def test_formats(self):
+		results = [CheckResult('home', fleet.OK, '1.2.3.4', 0.0125, None),
+				   CheckResult('office', fleet.TIMEOUT, None, 10, 'No answer after 10s')]
+		self.assertEqual(fleet.format_table(results).splitlines(), [
+				'TARGET  STATUS         MS  ADDRESS',
+				'home    ok           12.5  1.2.3.4',
+				'office  timeout   10000.0  No answer after 10s',
+				'1 ok, 1 failed'])
+
+		document = json.loads(fleet.format_json(results))
+		self.assertEqual((document['ok'], document['failed']), (1, 1))
+		self.assertEqual(document['targets'][1], {'name': 'office', 'status': 'timeout',
+												  'address': None, 'seconds': 10,
+												  'error': 'No answer after 10s'})
+
+
+if __name__ == '__main__':
+	unittest.main()
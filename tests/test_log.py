@@ -0,0 +1,59 @@
+#!/usr/bin/env python2.7
+
+import sys
+import Queue
+import logging
+import unittest
+
+from ddnsupdater.log import QueueHandler
+
+
+class RecordingQueueHandler(QueueHandler):
+	def __init__(self, queue):
+		QueueHandler.__init__(self, queue)
+		self.errors = []
+
+	def handleError(self, record):
+		self.errors.append(record)
+
+
+class QueueHandlerTest(unittest.TestCase):
+	def record(self, msg, args=(), exc_info=None):
+		return logging.LogRecord('ddns', logging.INFO, __file__, 1, msg, args, exc_info)
+
+	def test_message_merged(self):
+		queue = Queue.Queue()
+		QueueHandler(queue).emit(self.record('address is %s', ('1.2.3.4',)))
+		record = queue.get_nowait()
+		self.assertEqual((record.msg, record.args), ('address is 1.2.3.4', ()))
+
+	def test_traceback_rendered(self):
+		queue = Queue.Queue()
+		try:
+			raise IOError('refused')
+		except IOError:
+			QueueHandler(queue).emit(self.record('poll failed', exc_info=sys.exc_info()))
+
+		record = queue.get_nowait()
+		self.assertIsNone(record.exc_info)
+		self.assertIn('IOError: refused', record.exc_text)
+
+	def test_bad_arguments(self):
+		queue = Queue.Queue()
+		handler = RecordingQueueHandler(queue)
+		bad = self.record('address is %s and %s', ('1.2.3.4',))
+		handler.emit(bad)
+		# reported as a logging error instead of raised into the caller
+		self.assertEqual(handler.errors, [bad])
+		self.assertTrue(queue.empty())
+
+	def test_full_queue(self):
+		queue = Queue.Queue(1)
+		handler = QueueHandler(queue)
+		handler.emit(self.record('one'))
+		handler.emit(self.record('two'))
+		self.assertEqual(handler.dropped, 1)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python2.7
+
+import unittest
+
+from ddnsupdater.deadline import DeadlineExceeded
+from ddnsupdater.metrics import Histogram, PollMetrics, Registry
+
+
+class FakeClock(object):
+	def __init__(self):
+		self.now = 1000.0
+
+	def __call__(self):
+		return self.now
+
+
+class HistogramTest(unittest.TestCase):
+	def buckets(self, histogram):
+		return [(labels, value) for name, labels, value in histogram.samples()
+				if name.endswith('_bucket')]
+
+	def test_bucket_boundaries(self):
+		histogram = Histogram('latency_seconds', 'Latency', buckets=(0.1, 1, 10))
+		# a value on a bound falls into that bucket
+		for value in (0.05, 0.1, 0.5, 1, 10, 11):
+			histogram.observe(value)
+
+		self.assertEqual(self.buckets(histogram), [('{le="0.1"}', 2),
+												   ('{le="1"}', 4),
+												   ('{le="10"}', 5),
+												   ('{le="+Inf"}', 6)])
+		self.assertEqual(histogram.get(), 6)
+
+	def test_render(self):
+		registry = Registry()
+		histogram = registry.histogram('latency_seconds', 'Latency', ('target',), (0.5, 1))
+		histogram.observe(0.25, 'home')
+		histogram.observe(2, 'home')
+		self.assertEqual(registry.render(), '# HELP latency_seconds Latency\n'
+											'# TYPE latency_seconds histogram\n'
+											'latency_seconds_bucket{target="home",le="0.5"} 1\n'
+											'latency_seconds_bucket{target="home",le="1"} 1\n'
+											'latency_seconds_bucket{target="home",le="+Inf"} 2\n'
+											'latency_seconds_count{target="home"} 2\n'
+											'latency_seconds_sum{target="home"} 2.25\n')
+
+
+class RegistryTest(unittest.TestCase):
+	def test_text_format(self):
+		registry = Registry()
+		polls = registry.counter('polls_total', 'Polls made', ('target',))
+		up = registry.gauge('up', 'Whether it is running')
+		polls.inc('b')
+		polls.inc('a', amount=3)
+		up.set(1)
+		self.assertEqual(registry.render(), '# HELP polls_total Polls made\n'
+											'# TYPE polls_total counter\n'
+											'polls_total{target="a"} 3\n'
+											'polls_total{target="b"} 1\n'
+											'# HELP up Whether it is running\n'
+											'# TYPE up gauge\n'
+											'up 1\n')
+
+	def test_label_escaping(self):
+		registry = Registry()
+		registry.counter('polls_total', 'Polls made', ('target',)).inc('a "b"\\\n')
+		self.assertIn(r'polls_total{target="a \"b\"\\\n"} 1', registry.render())
+
+	def test_wrong_labels(self):
+		counter = Registry().counter('polls_total', 'Polls made', ('target',))
+		self.assertRaises(ValueError, counter.inc)
+		self.assertRaises(ValueError, counter.inc, 'a', 'b')
+
+
+class PollMetricsTest(unittest.TestCase):
+	def test_pushed(self):
+		clock = FakeClock()
+		metrics = PollMetrics(clock=clock)
+		metrics.pushed('home', 0.2)
+		clock.now += 30
+		text = metrics.registry.render()
+		self.assertIn('ddns_address_changes_total{target="home"} 1\n', text)
+		self.assertIn('ddns_last_update_timestamp_seconds{target="home"} 1000.0\n', text)
+		self.assertIn('ddns_seconds_since_last_update{target="home"} 30.0\n', text)
+
+	def test_failed(self):
+		metrics = PollMetrics()
+		metrics.failed('home', 'fetch', 0.1, ValueError('no address'))
+		metrics.failed('home', 'push', 5, DeadlineExceeded('push', 5))
+		self.assertEqual(metrics.failures.get('home', 'fetch'), 1)
+		self.assertEqual(metrics.parse_failures.get('home'), 1)
+		self.assertEqual(metrics.deadlines.get('home', 'push', 'push'), 1)
+		self.assertEqual(metrics.fetch_seconds.get('home'), 1)
+		self.assertEqual(metrics.push_seconds.get('home'), 1)
+
+
+if __name__ == '__main__':
+	unittest.main()
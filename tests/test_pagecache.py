@@ -0,0 +1,100 @@
+#!/usr/bin/env python2.7
+
+import unittest
+
+from ddnsupdater.main import get_ip
+from ddnsupdater.pool import ConnectionPool
+from ddnsupdater.pagecache import PageCache
+
+from tests.servers import Server
+
+PAGE = '<table>\n<tr><td>IP Address</td>\n<td>{ip}</td></tr>\n</table>\n'
+MATCH = r'.*<td>([0-9.]+)'
+
+
+class RouterPage(object):
+	"""A router page whose address the test changes, sent with `validators`."""
+
+	def __init__(self, validators, honour_conditions=False):
+		self.ip = '1.1.1.1'
+		self.validators = validators
+		self.honour_conditions = honour_conditions
+
+	def __call__(self, handler):
+		etag = dict(self.validators).get('ETag')
+		if (self.honour_conditions and etag is not None
+				and handler.headers.getheader('If-None-Match') == etag):
+			return 304, self.validators, ''
+
+		return 200, self.validators, PAGE.format(ip=self.ip)
+
+
+class PageCacheTest(unittest.TestCase):
+	def poll(self, page, addresses):
+		server = Server(page)
+		self.addCleanup(server.close)
+		pool = ConnectionPool()
+		cache = PageCache()
+		found = []
+		for ip in addresses:
+			page.ip = ip
+			found.append(get_ip('admin', '', server.url('/status'), 'IP Address', 1, MATCH,
+								pool=pool, cache=cache))
+
+		return found, cache, server
+
+	def test_fixed_etag_follows_the_page(self):
+		# an ETag for the page template, the same whatever the address
+		page = RouterPage([('ETag', '"static-template"')])
+		addresses = ['1.1.1.1', '2.2.2.2', '3.3.3.3', '4.4.4.4', '4.4.4.4', '5.5.5.5']
+		found, cache, server = self.poll(page, addresses)
+		self.assertEqual(found, addresses)
+		self.assertIs(cache.trusted, False)
+		self.assertFalse(cache.probe)
+		# no HEAD probes, and no conditions sent once the ETag was found out
+		self.assertEqual([method for method, _, _ in server.requests], ['GET'] * len(addresses))
+		self.assertNotIn('if-none-match', server.requests[-1][2])
+
+	def test_fixed_last_modified_follows_the_page(self):
+		page = RouterPage([('Last-Modified', 'Thu, 01 Jan 2015 00:00:00 GMT')])
+		addresses = ['1.1.1.1', '1.1.1.1', '2.2.2.2', '3.3.3.3']
+		found, cache, _ = self.poll(page, addresses)
+		self.assertEqual(found, addresses)
+		self.assertIs(cache.trusted, False)
+
+	def test_ignored_conditions_use_the_probe_once_trusted(self):
+		# an honest ETag, changed with the page, but If-None-Match is ignored
+		page = RouterPage([('ETag', '"a"')])
+		server = Server(page)
+		self.addCleanup(server.close)
+		pool = ConnectionPool()
+		cache = PageCache()
+		fetch = lambda: get_ip('admin', '', server.url('/status'), 'IP Address', 1, MATCH,
+							   pool=pool, cache=cache)
+		self.assertEqual(fetch(), '1.1.1.1')
+		self.assertEqual(fetch(), '1.1.1.1')
+		self.assertIs(cache.conditional, False)
+		# not trusted until the ETag has been seen to change with the page
+		self.assertIs(cache.trusted, None)
+		page.ip = '2.2.2.2'
+		page.validators = [('ETag', '"b"')]
+		self.assertEqual(fetch(), '2.2.2.2')
+		self.assertIs(cache.trusted, True)
+		self.assertEqual(fetch(), '2.2.2.2')
+		self.assertEqual(cache.probe_hits, 1)
+		page.ip = '3.3.3.3'
+		page.validators = [('ETag', '"c"')]
+		self.assertEqual(fetch(), '3.3.3.3')
+		self.assertEqual([method for method, _, _ in server.requests],
+						 ['GET', 'GET', 'GET', 'HEAD', 'HEAD', 'GET'])
+
+	def test_honoured_conditions(self):
+		page = RouterPage([('ETag', '"a"')], honour_conditions=True)
+		found, cache, _ = self.poll(page, ['1.1.1.1', '1.1.1.1', '1.1.1.1'])
+		self.assertEqual(found, ['1.1.1.1'] * 3)
+		self.assertEqual(cache.not_modified, 2)
+		self.assertIs(cache.conditional, True)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python2.7
+
+import urllib2
+import unittest
+
+from ddnsupdater import __version__
+from ddnsupdater.pool import ConnectionPool
+from tests.servers import Server
+
+
+class PoolTest(unittest.TestCase):
+	def serve(self, respond):
+		server = Server(respond)
+		self.addCleanup(server.close)
+		return server
+
+	def test_user_agent(self):
+		server = self.serve(lambda handler: (200, [], 'ok'))
+		pool = ConnectionPool()
+		self.assertEqual(pool.urlopen(server.url()).read(), 'ok')
+		pool.urlopen(server.url(), headers={'User-Agent': 'router-poller'}).read()
+		agents = [headers['user-agent'] for _, _, headers in server.requests]
+		self.assertEqual(agents, ['ddns-updater/' + __version__, 'router-poller'])
+
+	def test_redirects_are_followed(self):
+		def respond(handler):
+			if handler.path == '/old':
+				return 301, [('Location', '/new')], ''
+
+			if handler.path == '/new':
+				return 302, [('Location', target.url('/status'))], ''
+
+			return 200, [], 'page'
+
+		server = self.serve(respond)
+		target = self.serve(lambda handler: (200, [], 'page'))
+		pool = ConnectionPool()
+		self.assertEqual(pool.urlopen(server.url('/old')).read(), 'page')
+		self.assertEqual([path for _, path, _ in server.requests], ['/old', '/new'])
+		self.assertEqual([path for _, path, _ in target.requests], ['/status'])
+
+	def test_credentials_stay_with_their_host(self):
+		def respond(handler):
+			if 'authorization' not in handler.headers:
+				return 401, [('WWW-Authenticate', 'Basic realm="router"')], ''
+
+			return 307, [('Location', target.url('/status').replace('127.0.0.1', 'localhost'))], ''
+
+		server = self.serve(respond)
+		target = self.serve(lambda handler: (200, [], 'page'))
+		pool = ConnectionPool()
+		self.assertEqual(pool.urlopen(server.url(), 'admin', '12345').read(), 'page')
+		self.assertIn('authorization', server.requests[-1][2])
+		self.assertNotIn('authorization', target.requests[0][2])
+
+	def test_redirect_loop(self):
+		server = self.serve(lambda handler: (302, [('Location', '/')], ''))
+		pool = ConnectionPool()
+		with self.assertRaises(urllib2.HTTPError) as raised:
+			pool.urlopen(server.url())
+
+		self.assertEqual(raised.exception.code, 302)
+		self.assertEqual(len(server.requests), pool.max_redirects + 1)
+
+
+if __name__ == '__main__':
+	unittest.main()
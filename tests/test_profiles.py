@@ -0,0 +1,58 @@
+#!/usr/bin/env python2.7
+
+import unittest
+
+from ddnsupdater import profiles
+from ddnsupdater.profiles import Extractor, literal_start, make_extractor, register_profile
+
+SITECOM = ('<tr><td>IP Address</td>\n'
+		   '<td class="value">1.2.3.4</td></tr>')
+
+DD_WRT = '{wan_ipaddr::5.6.7.8}\n{wan_netmask::255.255.255.0}'
+
+OPENWRT = '{"lan": {"ipaddr": "192.168.1.1"}, "wan": {"proto": "dhcp", "ipaddr": "9.9.9.9"}}'
+
+
+class ProfileTest(unittest.TestCase):
+	def test_detects_profile(self):
+		for page, name, ip in ((SITECOM, 'sitecom-n300', '1.2.3.4'),
+							   (DD_WRT, 'dd-wrt', '5.6.7.8'),
+							   (OPENWRT, 'openwrt', '9.9.9.9')):
+			extractor = make_extractor('auto')
+			self.assertEqual(extractor.extract(page), ip)
+			self.assertEqual(extractor.detected, name)
+
+	def test_named_profile(self):
+		extractor = make_extractor('dd-wrt')
+		self.assertEqual(extractor.detected, 'dd-wrt')
+		self.assertEqual(extractor.extract(DD_WRT), '5.6.7.8')
+		# only the chosen profile is tried
+		self.assertRaises(ValueError, extractor.extract, SITECOM)
+
+	def test_falls_back_when_page_changes(self):
+		extractor = Extractor()
+		extractor.extract(SITECOM)
+		# e.g. the router's firmware was replaced
+		self.assertEqual(extractor.extract(DD_WRT), '5.6.7.8')
+		self.assertEqual(extractor.detected, 'dd-wrt')
+
+	def test_no_match(self):
+		self.assertRaises(ValueError, Extractor().extract, '<html>Router</html>')
+
+	def test_unknown_profile(self):
+		self.assertRaises(ValueError, make_extractor, 'no-such-router')
+
+	def test_literal_start(self):
+		self.assertEqual(literal_start(r'WAN IP:\s*([0-9.]+)'), 'WAN IP:')
+		self.assertRaises(ValueError, literal_start, r'\s*WAN')
+
+	def test_register(self):
+		self.addCleanup(profiles.PROFILES.pop, 'example', None)
+		register_profile('example', r'External: ' + profiles.IPV4)
+		self.assertEqual(make_extractor('example').extract('External: 4.3.2.1'), '4.3.2.1')
+		self.assertRaises(ValueError, register_profile, 'bad', r'External: [0-9.]+')
+		self.assertNotIn('bad', profiles.PROFILES)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,35 @@
+#!/usr/bin/env python2.7
+
+import unittest
+
+from ddnsupdater import __version__
+from ddnsupdater.pool import ConnectionPool
+from ddnsupdater.providers import DRIVERS
+from tests.servers import Server
+
+
+class Dyndns2Test(unittest.TestCase):
+	def setUp(self):
+		self.server = Server(self.respond)
+		self.addCleanup(self.server.close)
+
+	def respond(self, handler):
+		if 'authorization' not in handler.headers:
+			return 401, [('WWW-Authenticate', 'Basic realm="members"')], 'badauth'
+
+		return 200, [], 'good 1.2.3.4\nnochg 1.2.3.4\n'
+
+	def test_update_headers(self):
+		url = self.server.url('/nic/update?hostname=a.example.com,b.example.com&myip=1.2.3.4')
+		url = url.replace('http://', 'http://user:secret@')
+		outcomes = DRIVERS['dyndns2'].update(ConnectionPool(), url, 2)
+		self.assertEqual([outcome.status for outcome in outcomes], ['good', 'nochg'])
+
+		command, path, headers = self.server.requests[-1]
+		self.assertEqual(path, '/nic/update?hostname=a.example.com,b.example.com&myip=1.2.3.4')
+		self.assertEqual(headers['user-agent'], 'mjem - ddns-updater - ' + __version__)
+		self.assertEqual(headers['authorization'], 'Basic dXNlcjpzZWNyZXQ=')
+
+
+if __name__ == '__main__':
+	unittest.main()
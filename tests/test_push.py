@@ -0,0 +1,141 @@
+#!/usr/bin/env python2.7
+
+import urlparse
+import unittest
+
+from ddnsupdater.pool import ConnectionPool
+from ddnsupdater.push import Deferred, PushError, Pusher, PushRecord
+from tests.servers import Server
+
+
+class FakeClock(object):
+	def __init__(self):
+		self.now = 1000.0
+
+	def __call__(self):
+		return self.now
+
+
+class Provider(object):
+	"""A dyndns2 provider answering 'good' to every update, or `status` if set."""
+
+	def __init__(self, test):
+		self.status = None
+		self.server = Server(self.respond)
+		test.addCleanup(self.server.close)
+
+	def respond(self, handler):
+		query = urlparse.parse_qs(urlparse.urlsplit(handler.path).query)
+		return 200, [], '{status} {ip}\n'.format(status=self.status or 'good',
+												 ip=query['myip'][0])
+
+	def url(self, host):
+		return self.server.url('/nic/update?hostname={host}&myip={{ip}}'.format(host=host))
+
+	def updates(self):
+		return [urlparse.parse_qs(urlparse.urlsplit(path).query)['myip'][0]
+				for _, path, _ in self.server.requests]
+
+
+class PusherTest(unittest.TestCase):
+	def setUp(self):
+		self.clock = FakeClock()
+		self.provider = Provider(self)
+
+	def pusher(self, **kwargs):
+		records = [PushRecord('home', self.provider.url('home.example.com'), 'dyndns2')]
+		return Pusher(records, ConnectionPool(), clock=self.clock, **kwargs)
+
+	def test_debounce_merges_quick_changes(self):
+		pusher = self.pusher(debounce=60)
+		# nothing to debounce the first time
+		pusher('1.1.1.1')
+
+		self.clock.now += 100
+		with self.assertRaises(Deferred) as raised:
+			pusher('2.2.2.2')
+
+		self.assertEqual(raised.exception.delay, 60)
+		self.clock.now += 30
+		with self.assertRaises(Deferred) as raised:
+			pusher('3.3.3.3')
+
+		# the wait starts again for the new address
+		self.assertEqual(raised.exception.delay, 60)
+		self.clock.now += 60
+		pusher('3.3.3.3')
+		self.assertEqual(self.provider.updates(), ['1.1.1.1', '3.3.3.3'])
+
+	def test_max_debounce(self):
+		pusher = self.pusher(debounce=60, max_debounce=100)
+		pusher('1.1.1.1')
+		for n in xrange(2, 5):
+			self.clock.now += 40
+			with self.assertRaises(Deferred) as raised:
+				pusher('{n}.{n}.{n}.{n}'.format(n=n))
+
+		# stale since the first change 80 seconds ago
+		self.assertEqual(raised.exception.delay, 20)
+		self.clock.now += 40
+		pusher('5.5.5.5')
+		self.assertEqual(self.provider.updates(), ['1.1.1.1', '5.5.5.5'])
+
+	def test_change_back_cancels(self):
+		pusher = self.pusher(debounce=60)
+		pusher('1.1.1.1')
+		self.clock.now += 10
+		self.assertRaises(Deferred, pusher, '2.2.2.2')
+		self.clock.now += 10
+		pusher('1.1.1.1')
+		self.assertEqual(pusher.stale_since, {})
+		self.assertEqual(self.provider.updates(), ['1.1.1.1'])
+
+	def test_unchanged_record_not_sent(self):
+		pusher = self.pusher()
+		self.assertTrue(pusher('1.1.1.1'))
+		# there is no AAAA record, so nothing is pushed
+		self.assertFalse(pusher('1.1.1.1,2001:db8::1'))
+		self.assertEqual(self.provider.updates(), ['1.1.1.1'])
+
+	def test_failure_sent_again(self):
+		pusher = self.pusher()
+		self.provider.status = 'dnserr'
+		self.assertRaises(PushError, pusher, '1.1.1.1')
+		self.provider.status = None
+		pusher('1.1.1.1')
+		self.assertEqual(self.provider.updates(), ['1.1.1.1', '1.1.1.1'])
+		self.assertEqual(pusher.pushed, {'home': '1.1.1.1'})
+
+	def test_permanent_failure_not_retried(self):
+		pusher = self.pusher()
+		self.provider.status = 'badauth'
+		with self.assertRaises(PushError) as raised:
+			pusher('1.1.1.1')
+
+		self.assertTrue(raised.exception.results[0].permanent)
+		self.assertEqual(pusher.blocked.keys(), ['home'])
+
+		# neither the retry of the failed check nor a new address sends it again
+		self.provider.status = None
+		self.assertFalse(pusher('1.1.1.1'))
+		self.assertFalse(pusher('2.2.2.2'))
+		self.assertEqual(self.provider.updates(), ['1.1.1.1'])
+
+		# until the configuration is reloaded
+		self.assertTrue(pusher.unblock())
+		self.assertFalse(pusher.unblock())
+		pusher('2.2.2.2')
+		self.assertEqual(self.provider.updates(), ['1.1.1.1', '2.2.2.2'])
+
+	def test_other_failures_retried(self):
+		pusher = self.pusher()
+		self.provider.status = '911'
+		with self.assertRaises(PushError) as raised:
+			pusher('1.1.1.1')
+
+		self.assertFalse(raised.exception.results[0].permanent)
+		self.assertEqual(pusher.blocked, {})
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python2.7
+
+import unittest
+
+from ddnsupdater.ratelimit import RateLimiter
+
+
+class FakeClock(object):
+	def __init__(self):
+		self.now = 1000.0
+
+	def __call__(self):
+		return self.now
+
+
+class RateLimiterTest(unittest.TestCase):
+	def setUp(self):
+		self.clock = FakeClock()
+		# one request every 10 seconds, in bursts of 2
+		self.limiter = RateLimiter(0.1, burst=2, clock=self.clock)
+
+	def test_burst_then_refill(self):
+		self.assertEqual(self.limiter.acquire('provider', 'a', 0), 0)
+		self.assertEqual(self.limiter.acquire('provider', 'b', 0), 0)
+		self.assertAlmostEqual(self.limiter.acquire('provider', 'c', 0), 10)
+		self.assertEqual(self.limiter.throttled, 1)
+
+		self.clock.now += 5
+		self.assertAlmostEqual(self.limiter.acquire('provider', 'c', 0), 5)
+		self.clock.now += 5
+		self.assertEqual(self.limiter.acquire('provider', 'c', 0), 0)
+
+	def test_refill_stops_at_burst(self):
+		self.clock.now += 3600
+		for key in 'ab':
+			self.assertEqual(self.limiter.acquire('provider', key, 0), 0)
+
+		self.assertGreater(self.limiter.acquire('provider', 'c', 0), 0)
+
+	def test_hosts_limited_separately(self):
+		for key in 'ab':
+			self.limiter.acquire('one', key, 0)
+
+		self.assertEqual(self.limiter.acquire('two', 'a', 0), 0)
+
+	def test_stalest_first(self):
+		for key in 'xy':
+			self.limiter.acquire('provider', key, 0)
+
+		# 'new' asks first but its records went stale after those of 'old'
+		self.assertAlmostEqual(self.limiter.acquire('provider', 'new', 500), 10)
+		self.assertAlmostEqual(self.limiter.acquire('provider', 'old', 100), 10)
+		# the wait of 'new' grows, as the next token is kept for 'old'
+		self.assertAlmostEqual(self.limiter.acquire('provider', 'new', 500), 20)
+
+		self.clock.now += 10
+		self.assertGreater(self.limiter.acquire('provider', 'new', 500), 0)
+		self.assertEqual(self.limiter.acquire('provider', 'old', 100), 0)
+		self.clock.now += 10
+		self.assertEqual(self.limiter.acquire('provider', 'new', 500), 0)
+
+	def test_waiting_caller_gives_up_place(self):
+		for key in 'xy':
+			self.limiter.acquire('provider', key, 0)
+
+		self.limiter.acquire('provider', 'old', 100)
+		# 'old' does not come back within the grace period of its turn
+		self.clock.now += 10 + self.limiter.grace + 1
+		self.assertEqual(self.limiter.acquire('provider', 'new', 500), 0)
+
+	def test_bad_rate(self):
+		self.assertRaises(ValueError, RateLimiter, 0)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python2.7
+
+import random
+import unittest
+
+from ddnsupdater.schedule import Schedule
+
+
+class FakeClock(object):
+	def __init__(self):
+		self.now = 1000.0
+
+	def __call__(self):
+		return self.now
+
+
+class ScheduleTest(unittest.TestCase):
+	def schedule(self, period=600, rng=lambda: 0.5, **kwargs):
+		"""A `Schedule` on a fake clock, without jitter unless `rng` says otherwise."""
+		self.clock = FakeClock()
+		return Schedule(period, clock=self.clock, rng=rng, **kwargs)
+
+	def test_steady_period(self):
+		schedule = self.schedule()
+		self.assertEqual([schedule.next_delay(True, False) for _ in xrange(3)], [600] * 3)
+
+	def test_backoff_doubles_to_the_limit(self):
+		schedule = self.schedule(retry=30, max_backoff=200)
+		delays = [schedule.next_delay(False, False) for _ in xrange(5)]
+		self.assertEqual(delays, [30, 60, 120, 200, 200])
+		self.assertEqual(schedule.failures, 5)
+
+		# a success resets the backoff
+		self.assertEqual(schedule.next_delay(True, False), 600)
+		self.assertEqual(schedule.next_delay(False, False), 30)
+
+	def test_backoff_limited_to_period_by_default(self):
+		schedule = self.schedule(period=100, retry=60)
+		self.assertEqual([schedule.next_delay(False, False) for _ in xrange(3)], [60, 100, 100])
+
+	def test_recheck_after_change(self):
+		schedule = self.schedule(recheck=60)
+		delays = [schedule.next_delay(True, True)]
+		delays += [schedule.next_delay(True, False) for _ in xrange(5)]
+		self.assertEqual(delays, [60, 120, 240, 480, 600, 600])
+
+	def test_change_restarts_recheck(self):
+		schedule = self.schedule(recheck=60)
+		schedule.next_delay(True, True)
+		schedule.next_delay(True, False)
+		self.assertEqual(schedule.next_delay(True, True), 60)
+
+	def test_failure_keeps_recheck(self):
+		schedule = self.schedule(recheck=60, retry=10)
+		schedule.next_delay(True, True)
+		self.assertEqual(schedule.next_delay(False, False), 10)
+		self.assertEqual(schedule.next_delay(True, False), 120)
+
+	def test_jitter_bounds(self):
+		rng = random.Random(1)
+		schedule = self.schedule(jitter=0.1, rng=rng.random, retry=30, recheck=60)
+		for _ in xrange(1000):
+			ok, changed = rng.random() > 0.2, rng.random() > 0.9
+			failures = schedule.failures
+			since_change = 0 if changed else schedule.since_change
+			delay = schedule.next_delay(ok, changed)
+			if not ok:
+				base = min(600, 30 * 2 ** failures)
+			elif since_change is not None and 60 * 2 ** since_change < 600:
+				base = 60 * 2 ** since_change
+			else:
+				base = 600
+
+			self.assertTrue(base * 0.9 <= delay <= base * 1.1, (base, delay))
+
+	def test_jitter_extremes(self):
+		self.assertEqual(self.schedule(jitter=0.1, rng=lambda: 0.0).next_delay(True, False), 540)
+		self.assertAlmostEqual(
+			self.schedule(jitter=0.1, rng=lambda: 1.0).next_delay(True, False), 660)
+
+	def test_next_check_uses_clock(self):
+		schedule = self.schedule()
+		self.assertEqual(schedule.next_check(True, False), 1600)
+		self.assertEqual(schedule.last_success, 1000)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python2.7
+
+import time
+import threading
+import unittest
+
+from ddnsupdater.engine import Engine, Target
+from ddnsupdater.shared import SharedFetch
+
+
+class FakeClock(object):
+	def __init__(self):
+		self.now = 1000.0
+
+	def __call__(self):
+		return self.now
+
+
+class Router(object):
+	"""Fetch function returning `ip`, which blocks while `gate` is clear."""
+
+	def __init__(self, ip='1.1.1.1'):
+		self.ip = ip
+		self.calls = 0
+		self.gate = threading.Event()
+		self.gate.set()
+		self.started = threading.Event()
+
+	def __call__(self):
+		self.calls += 1
+		ip = self.ip
+		self.started.set()
+		self.gate.wait(5)
+		return ip
+
+
+def call_in_threads(function, count):
+	results = []
+	lock = threading.Lock()
+
+	def call():
+		value = function()
+		with lock:
+			results.append(value)
+
+	threads = [threading.Thread(target=call) for _ in xrange(count)]
+	for thread in threads:
+		thread.start()
+
+	return threads, results
+
+
+class SharedFetchTest(unittest.TestCase):
+	def setUp(self):
+		self.clock = FakeClock()
+		self.router = Router()
+		self.shared = SharedFetch(self.router, max_age=5, clock=self.clock)
+
+	def test_single_flight(self):
+		self.router.gate.clear()
+		threads, results = call_in_threads(self.shared, 10)
+		self.router.started.wait(5)
+		time.sleep(0.05)
+		self.router.gate.set()
+		for thread in threads:
+			thread.join()
+
+		self.assertEqual(results, ['1.1.1.1'] * 10)
+		self.assertEqual(self.router.calls, 1)
+		self.assertEqual((self.shared.fetches, self.shared.shared), (1, 9))
+
+	def test_result_reused_within_max_age(self):
+		self.assertEqual(self.shared(), '1.1.1.1')
+		self.router.ip = '2.2.2.2'
+		self.clock.now += 4
+		self.assertEqual(self.shared(), '1.1.1.1')
+		self.clock.now += 1
+		self.assertEqual(self.shared(), '2.2.2.2')
+		self.assertEqual(self.router.calls, 2)
+
+	def test_failures_not_reused(self):
+		def fail():
+			raise IOError('router down')
+
+		shared = SharedFetch(fail, clock=self.clock)
+		self.assertRaises(IOError, shared)
+		self.assertRaises(IOError, shared)
+		self.assertEqual(shared.fetches, 2)
+
+	def test_invalidate_skips_max_age(self):
+		self.shared()
+		self.router.ip = '2.2.2.2'
+		self.shared.invalidate()
+		self.assertEqual(self.shared(), '2.2.2.2')
+
+	def test_invalidate_during_fetch(self):
+		# the address changes while a fetch is reading the old one
+		self.router.gate.clear()
+		threads, results = call_in_threads(self.shared, 1)
+		self.router.started.wait(5)
+		self.router.ip = '2.2.2.2'
+		self.shared.invalidate()
+
+		# a later call does not join the stale fetch
+		self.router.gate.set()
+		self.assertEqual(self.shared(), '2.2.2.2')
+		threads[0].join()
+		self.assertEqual(results, ['1.1.1.1'])
+
+		# and the stale answer is not kept for the share window
+		self.assertEqual(self.shared(), '2.2.2.2')
+		self.assertEqual(self.router.calls, 2)
+
+
+class EngineWakeTest(unittest.TestCase):
+	def test_change_during_fetch_is_pushed(self):
+		router = Router()
+		router.gate.clear()
+		shared = SharedFetch(router, max_age=5)
+		pushed = []
+		target = Target('home', shared, pushed.append, 3600)
+		engine = Engine([target], max_in_flight=2)
+		shared.subscribe(engine.fetched)
+		thread = threading.Thread(target=engine.run)
+		thread.start()
+		try:
+			router.started.wait(5)
+			# an event reports the new address while the old one is being read
+			router.ip = '2.2.2.2'
+			engine.wake()
+			router.gate.set()
+
+			end = time.time() + 5
+			while len(pushed) < 2 and time.time() < end:
+				time.sleep(0.01)
+
+		finally:
+			engine.stop()
+			thread.join()
+
+		self.assertEqual(pushed, ['1.1.1.1', '2.2.2.2'])
+		self.assertEqual(router.calls, 2)
+
+
+if __name__ == '__main__':
+	unittest.main()
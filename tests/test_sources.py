@@ -0,0 +1,59 @@
+#!/usr/bin/env python2.7
+
+import urllib2
+import unittest
+
+from ddnsupdater import sources
+from tests.servers import Server
+
+UPNP_RESPONSE = ('<?xml version="1.0"?><s:Envelope><s:Body>'
+				 '<u:GetExternalIPAddressResponse>'
+				 '<NewExternalIPAddress>{ip}</NewExternalIPAddress>'
+				 '</u:GetExternalIPAddressResponse></s:Body></s:Envelope>')
+
+
+class UpnpTest(unittest.TestCase):
+	def setUp(self):
+		sources._upnp_control.clear()
+		self.addCleanup(sources._upnp_control.clear)
+		self.discoveries = 0
+		self.router = self.gateway('1.2.3.4')
+		original = sources.discover_upnp
+		sources.discover_upnp = self.discover
+		self.addCleanup(setattr, sources, 'discover_upnp', original)
+
+	def gateway(self, ip):
+		server = Server(lambda handler: (200, [], UPNP_RESPONSE.format(ip=ip)))
+		self.addCleanup(server.close)
+		return server
+
+	def discover(self, timeout=2):
+		self.discoveries += 1
+		return self.router.url('/ctl/IPConn'), sources.WAN_SERVICES[0]
+
+	def test_control_url_remembered(self):
+		self.assertEqual(sources.upnp_ip(), '1.2.3.4')
+		self.assertEqual(sources.upnp_ip(), '1.2.3.4')
+		self.assertEqual(self.discoveries, 1)
+		command, path, headers = self.router.requests[0]
+		self.assertEqual((command, path), ('POST', '/ctl/IPConn'))
+		self.assertIn('GetExternalIPAddress', headers['soapaction'])
+
+	def test_rediscovered_after_router_restart(self):
+		self.assertEqual(sources.upnp_ip(), '1.2.3.4')
+
+		# the router comes back up listening on another port
+		self.router.close()
+		self.assertRaises(urllib2.URLError, sources.upnp_ip)
+		self.router = self.gateway('5.6.7.8')
+		self.assertEqual(sources.upnp_ip(), '5.6.7.8')
+		self.assertEqual(self.discoveries, 2)
+
+	def test_given_url_not_remembered(self):
+		self.assertEqual(sources.upnp_ip(self.router.url('/ctl/IPConn')), '1.2.3.4')
+		self.assertEqual(self.discoveries, 0)
+		self.assertEqual(sources._upnp_control, {})
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python2.7
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from ddnsupdater import state
+from ddnsupdater.state import RecordState, StateStore, TargetState, write_statefile
+
+
+class FakeClock(object):
+	def __init__(self):
+		self.now = 1000.0
+
+	def __call__(self):
+		return self.now
+
+
+class StateTest(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, self.directory)
+		self.clock = FakeClock()
+
+	def path(self, name):
+		return os.path.join(self.directory, name)
+
+	def open(self):
+		store = StateStore(self.path('state.db'), clock=self.clock)
+		self.addCleanup(store.close)
+		return store
+
+	def test_round_trip(self):
+		store = self.open()
+		store.checked('home', '1.2.3.4')
+		self.clock.now += 60
+		store.checked('home', '1.2.3.4')
+		store.pushed('home.example.com', '1.2.3.4', 'good')
+		store.close()
+
+		store = self.open()
+		# the address is unchanged since the first check
+		self.assertEqual(store.target('home'), TargetState('1.2.3.4', 1060.0, 1000.0))
+		self.assertEqual(store.record('home.example.com'), RecordState('1.2.3.4', 'good', 1060.0))
+		self.assertIsNone(store.target('office'))
+		self.assertIsNone(store.record('office.example.com'))
+
+	def test_change(self):
+		store = self.open()
+		store.checked('home', '1.2.3.4')
+		self.clock.now += 60
+		store.checked('home', '5.6.7.8')
+		self.assertEqual(store.target('home'), TargetState('5.6.7.8', 1060.0, 1060.0))
+
+	def test_statefile(self):
+		path = self.path('ip')
+		write_statefile(path, '1.2.3.4')
+		write_statefile(path, '5.6.7.8')
+		with open(path) as h:
+			self.assertEqual(h.read(), '5.6.7.8')
+
+		self.assertEqual(os.listdir(self.directory), ['ip'])
+
+	def test_statefile_failed_write(self):
+		path = self.path('ip')
+		write_statefile(path, '1.2.3.4')
+
+		def fsync(fd):
+			raise OSError(28, 'No space left on device')
+
+		self.addCleanup(setattr, state.os, 'fsync', os.fsync)
+		state.os.fsync = fsync
+		self.assertRaises(OSError, write_statefile, path, '5.6.7.8')
+		# the old address is still there in full
+		with open(path) as h:
+			self.assertEqual(h.read(), '1.2.3.4')
+
+
+if __name__ == '__main__':
+	unittest.main()
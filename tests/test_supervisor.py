@@ -0,0 +1,86 @@
+#!/usr/bin/env python2.7
+
+import os
+import signal
+import unittest
+import collections
+import multiprocessing
+
+from ddnsupdater.metrics import merge_texts
+from ddnsupdater.supervisor import HashRing, Supervisor
+
+NAMES = ['target{n}'.format(n=n) for n in xrange(4000)]
+
+
+class HashRingTest(unittest.TestCase):
+	def test_even_balance(self):
+		ring = HashRing(range(4))
+		counts = collections.Counter(ring.node(name) for name in NAMES)
+		self.assertEqual(sorted(counts), range(4))
+		for count in counts.values():
+			self.assertLess(abs(count - 1000), 250)
+
+	def test_adding_a_node_moves_only_its_share(self):
+		before = HashRing(range(4))
+		after = HashRing(range(5))
+		moved = [name for name in NAMES if before.node(name) != after.node(name)]
+		# every name which moves goes to the new node, about a fifth of them
+		self.assertEqual(set(after.node(name) for name in moved), set([4]))
+		self.assertLess(abs(len(moved) - len(NAMES) / 5), len(NAMES) / 20)
+
+	def test_stable(self):
+		self.assertEqual([HashRing(range(4)).node(name) for name in NAMES[:50]],
+						 [HashRing(range(4)).node(name) for name in NAMES[:50]])
+
+	def test_no_nodes(self):
+		self.assertRaises(ValueError, HashRing, [])
+
+
+class MergeTextsTest(unittest.TestCase):
+	def test_merge(self):
+		one = ('# HELP ddns_checks_total Checks made\n'
+			   '# TYPE ddns_checks_total counter\n'
+			   'ddns_checks_total{target="a"} 3\n'
+			   'ddns_checks_total{target="b"} 1\n'
+			   '# HELP ddns_in_flight Checks in progress\n'
+			   '# TYPE ddns_in_flight gauge\n'
+			   'ddns_in_flight 2\n')
+		two = ('# HELP ddns_checks_total Checks made\n'
+			   '# TYPE ddns_checks_total counter\n'
+			   'ddns_checks_total{target="a"} 4\n'
+			   '# HELP ddns_in_flight Checks in progress\n'
+			   '# TYPE ddns_in_flight gauge\n'
+			   'ddns_in_flight 5\n')
+		merged = merge_texts([one, two]).splitlines()
+		self.assertEqual(merged.count('# HELP ddns_checks_total Checks made'), 1)
+		self.assertEqual(merged.count('# TYPE ddns_in_flight gauge'), 1)
+		self.assertIn('ddns_checks_total{target="a"} 7', merged)
+		self.assertIn('ddns_checks_total{target="b"} 1', merged)
+		self.assertIn('ddns_in_flight 5', merged)
+		self.assertNotIn('ddns_in_flight 7', merged)
+
+
+def report_signals(queue, index, count):
+	queue.put([signal.getsignal(signum) for signum in (signal.SIGHUP, signal.SIGUSR1,
+														signal.SIGUSR2, signal.SIGTERM)])
+
+
+class SupervisorTest(unittest.TestCase):
+	def test_worker_does_not_inherit_forwarding(self):
+		supervisor = Supervisor(1, None)
+		previous = dict((signum, signal.signal(signum, lambda signum, frame: supervisor.forward(signum)))
+						for signum in (signal.SIGHUP, signal.SIGUSR1, signal.SIGUSR2))
+		for signum, handler in previous.items():
+			self.addCleanup(signal.signal, signum, handler)
+
+		queue = multiprocessing.Queue()
+		supervisor.work = lambda index, count: report_signals(queue, index, count)
+		supervisor.start_worker(0)
+		handlers = queue.get(timeout=10)
+		supervisor.processes[0].join(10)
+		self.assertEqual(handlers, [signal.SIG_IGN] * 3 + [signal.SIG_DFL])
+		self.assertEqual(supervisor.processes[0].exitcode, 0)
+
+
+if __name__ == '__main__':
+	unittest.main()